@@ -1,6 +1,9 @@
 from curl_cffi import requests
 import configparser
 import logging
+import random
+import threading
+import time
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -10,39 +13,140 @@ config = configparser.ConfigParser()
 config.read('./conf/general.conf')
 url = config.get('INVESTING', 'URL')
 endpoint = config.get('INVESTING', 'ENDPOINT')
+MAX_PAGES = config.getint('INVESTING', 'MAX_PAGES', fallback=20)
+MAX_RETRIES = config.getint('INVESTING', 'MAX_RETRIES', fallback=3)
+BACKOFF_SECONDS = config.getfloat('INVESTING', 'BACKOFF_SECONDS', fallback=0.5)
+REQUESTS_PER_MINUTE = config.getfloat('INVESTING', 'REQUESTS_PER_MINUTE', fallback=30)
 
+# statuses worth retrying, anything else is an answer that will not change
+RETRY_STATUSES = {429, 500, 502, 503, 504}
 
-def get_dividends_next_week_post(country=5, filter_time='nextWeek'):
-    headers = {
-        "x-requested-with": "XMLHttpRequest",
-    }
-    body = {
-        "country[]": country,
-        "currentTab": filter_time,
-        "limit_from": 0
-    }
-    
-    try:
-        logger.info(f"Making request to: {url}{endpoint}")
-        
-        api_result = requests.post(url=f'{url}{endpoint}',
-                                   data=body,
-                                   headers=headers,
-                                   impersonate="chrome101")
-        
-        logger.info(f"Response status: {api_result.status_code}")
-        
-        if api_result.status_code != 200:
-            logger.error(f"API returned status code: {api_result.status_code}")
-            return {"data": []}  # Return empty data to prevent crash
-        
+
+class InvestingRequestError(Exception):
+    """The calendar could not be fetched, even after retrying"""
+
+
+class RateLimiter:
+    """Spaces out request starts across every thread of the process"""
+
+    def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self._next_start = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+rate_limiter = RateLimiter()
+
+
+class InvestingClient:
+    """
+    Client for investing.com's calendar endpoint. Requests share a keep-alive session, are spaced by the
+    global rate limiter and retried with jittered exponential backoff
+    """
+
+    def __init__(self, base_url=url, path=endpoint, max_retries=MAX_RETRIES, backoff=BACKOFF_SECONDS,
+                 max_backoff=30.0, limiter=rate_limiter, session=None):
+        self.url = f'{base_url}{path}'
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.limiter = limiter
+        self.session = session or requests.Session(impersonate="chrome101")
+
+    def post_calendar(self, country=5, filter_time='nextWeek', limit_from=0, last_time_scope=None):
+        """Return the JSON of one calendar page, raises InvestingRequestError when it can not be fetched"""
+        headers = {
+            "x-requested-with": "XMLHttpRequest",
+        }
+        body = {
+            "country[]": country,
+            "currentTab": filter_time,
+            "limit_from": limit_from
+        }
+        if last_time_scope is not None:
+            body["last_time_scope"] = last_time_scope
+
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            self.limiter.wait()
+            try:
+                logger.info(f"Making request to: {self.url}")
+                api_result = self.session.post(url=self.url, data=body, headers=headers)
+                logger.info(f"Response status: {api_result.status_code}")
+
+                if api_result.status_code == 200:
+                    try:
+                        return api_result.json()
+                    except Exception as e:
+                        logger.error(f"Failed to parse JSON: {e}")
+                        logger.error(f"Response text (first 500 chars): {api_result.text[:500]}")
+                        error = f"invalid JSON: {e}"
+                else:
+                    error = f"status code {api_result.status_code}"
+                    if api_result.status_code not in RETRY_STATUSES:
+                        raise InvestingRequestError(f"Calendar request failed with {error}")
+                    retry_after = self._retry_after(api_result)
+            except InvestingRequestError:
+                raise
+            except Exception as e:
+                logger.error(f"Request failed: {e}")
+                error = str(e)
+
+            if attempt < self.max_retries:
+                delay = retry_after if retry_after is not None else \
+                    random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+                logger.warning(f"Retrying calendar request in {delay:.1f}s after {error}")
+                time.sleep(delay)
+        raise InvestingRequestError(f"Calendar request failed after {self.max_retries + 1} attempts: {error}")
+
+    def iter_calendar_pages(self, country=5, filter_time='nextWeek', max_pages=MAX_PAGES):
+        """
+        Yield the calendar responses page by page. The endpoint sets bind_scroll_handler while more rows follow,
+        the next page is asked for with limit_from incremented and the last_time_scope it returned
+        """
+        limit_from = 0
+        last_time_scope = None
+        for _ in range(max_pages):
+            response = self.post_calendar(country=country, filter_time=filter_time,
+                                          limit_from=limit_from, last_time_scope=last_time_scope)
+            if not response.get("data"):
+                return
+            yield response
+            if not response.get("bind_scroll_handler") or response.get("last_time_scope") is None:
+                return
+            limit_from += 1
+            last_time_scope = response["last_time_scope"]
+        logger.warning(f"Calendar for country {country} still had rows after {max_pages} pages")
+
+    @staticmethod
+    def _retry_after(api_result):
         try:
-            return api_result.json()
-        except Exception as e:
-            logger.error(f"Failed to parse JSON: {e}")
-            logger.error(f"Response text (first 500 chars): {api_result.text[:500]}")
-            return {"data": []}  # Return empty data to prevent crash
-            
-    except Exception as e:
-        logger.error(f"Request failed: {e}")
-        return {"data": []}  # Return empty data to prevent crash
+            return float(api_result.headers.get("Retry-After"))
+        except (TypeError, ValueError):
+            return None
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Client shared by every calendar request of the process"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = InvestingClient()
+    return _client
+
+
+def iter_dividends_pages_post(country=5, filter_time='nextWeek', max_pages=MAX_PAGES):
+    """Yield the calendar page by page, raises InvestingRequestError when a page can not be fetched"""
+    return get_client().iter_calendar_pages(country=country, filter_time=filter_time, max_pages=max_pages)
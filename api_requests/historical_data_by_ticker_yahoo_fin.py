@@ -1,5 +1,37 @@
 from yahoo_fin.stock_info import get_data
+import yfinance as yf
+import pandas as pd
+
+# yfinance columns renamed to the ones yahoo_fin's get_data returns
+PRICE_COLUMNS = {'Open': 'open', 'High': 'high', 'Low': 'low', 'Close': 'close',
+                 'Adj Close': 'adjclose', 'Volume': 'volume'}
 
 
 def get_historical_data_get(ticker='KO', start_date='2022-10-14', end_date='2023-10-24'):
     return get_data(ticker, start_date=start_date, end_date=end_date, index_as_date=False)
+
+
+def get_historical_data_batch_get(tickers=('KO',), start_date='2022-10-14', end_date='2023-10-24'):
+    """
+    Get historical data for several tickers in one bulk download sharing a single session.
+    Returns a dict of frames with the columns of get_historical_data_get, tickers without data are left out
+    """
+    tickers = list(tickers)
+    data = yf.download(tickers, start=pd.to_datetime(start_date), end=pd.to_datetime(end_date),
+                       group_by='ticker', auto_adjust=False, progress=False)
+    if not isinstance(data.columns, pd.MultiIndex):
+        data = pd.concat({tickers[0]: data}, axis=1)
+
+    frames = {}
+    for ticker in tickers:
+        if ticker not in data.columns.get_level_values(0):
+            continue
+        df = data[ticker].dropna(how='all')
+        if df.empty:
+            continue
+        df = df.rename(columns=PRICE_COLUMNS)[list(PRICE_COLUMNS.values())]
+        df.index.name = 'date'
+        df = df.reset_index()
+        df['ticker'] = ticker
+        frames[ticker] = df
+    return frames
@@ -1,16 +1,61 @@
+import logging
+
+import requests
 import yfinance as yf
 import pandas as pd
 
-def get_historical_dividends_get(ticker='KO'):
-    t = yf.Ticker(ticker)
-    dividends = t.dividends
-    if dividends is None or dividends.empty:
+logger = logging.getLogger(__name__)
+
+# Yahoo's chart endpoint, with events=div and quarterly bars it answers the dividends and a few dozen closes
+CHART_URL = 'https://query2.finance.yahoo.com/v8/finance/chart/{ticker}'
+CHART_PARAMS = {'range': 'max', 'interval': '3mo', 'events': 'div'}
+CHART_HEADERS = {'User-Agent': 'Mozilla/5.0'}
+
+
+def dividends_frame(ticker, dividends):
+    """Frame of date, dividend and ticker of a yfinance dividends series, dates are left as yfinance gives them"""
+    # yfinance answers [] instead of a series for tickers without data
+    if not isinstance(dividends, pd.Series) or dividends.empty:
         return pd.DataFrame(columns=['date', 'dividend', 'ticker'])
-    df = dividends.reset_index()
+    df = dividends[dividends > 0].reset_index()
     df.columns = ['date', 'dividend']
     df['ticker'] = ticker
     return df
 
+def chart_dividends(result):
+    """Dividends series of a chart endpoint result, dated at midnight of the exchange's day as yfinance does"""
+    events = list((result.get('events') or {}).get('dividends', {}).values())
+    if not events:
+        return pd.Series(dtype=float)
+    timezone = result.get('meta', {}).get('exchangeTimezoneName') or 'UTC'
+    dates = pd.to_datetime([event['date'] for event in events], unit='s', utc=True).tz_convert(timezone).normalize()
+    return pd.Series([float(event['amount']) for event in events], index=dates, name='Dividends').sort_index()
+
+def get_historical_dividends_get(ticker='KO'):
+    t = yf.Ticker(ticker)
+    return dividends_frame(ticker, t.dividends)
+
+def get_historical_dividends_batch_get(tickers=('KO',), session=None):
+    """
+    Get historical dividends of several tickers from the chart endpoint with events=div, one request per ticker
+    on a single keep-alive session, without their daily price histories. Returns a dict of frames with the
+    columns of get_historical_dividends_get, tickers that could not be downloaded are left out while tickers
+    that never paid get an empty frame
+    """
+    session = session or requests.Session()
+    frames = {}
+    for ticker in dict.fromkeys(tickers):
+        try:
+            response = session.get(CHART_URL.format(ticker=ticker), params=CHART_PARAMS, headers=CHART_HEADERS,
+                                   timeout=30)
+            response.raise_for_status()
+            result = response.json()['chart']['result'][0]
+        except Exception as e:
+            logger.warning(f"Dividends of {ticker} could not be downloaded: {e}")
+            continue
+        frames[ticker] = dividends_frame(ticker, chart_dividends(result))
+    return frames
+
 def get_historical_dividends(ticker='KO', time_delta=60):
     """
     Get historical dividends for a ticker using yfinance
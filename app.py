@@ -1,8 +1,13 @@
+import threading
+import uuid
 from datetime import date, timedelta
-from dash import Dash, html, Input, Output, callback, dcc, dash_table
+from dash import Dash, html, Input, Output, State, callback, callback_context, dcc, dash_table, no_update
+from dash.exceptions import PreventUpdate
 import dash_ag_grid as dag
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
+from flask import jsonify, request
 
 from config import AppConfig
 from components import DividendComponents
@@ -10,6 +15,22 @@ import get_historical_data_by_ticker
 import get_dividends
 import get_dividends_historical_by_ticker
 import calculate_dividend_summary
+import dividend_yield
+import income_projection
+from misc.cache_gc import CacheCollector
+from misc.cache_index import cache_index
+from misc.fetcher import fetcher
+from misc.downsample import downsample_prices
+from misc.figure_cache import FigureCache
+from misc.prefetch import Prefetcher
+from misc.result_store import ResultStore
+from misc.revalidate import notifier
+from misc.utils import calendar_tickers
+from misc.utils import load_latest_response
+from misc.utils import row_ticker
+from dividend_analytics import payout_status
+from scheduler import RefreshScheduler
+from screener import universe
 
 class DividendAnalysisApp:
     """Main application class for Dividend Analysis"""
@@ -17,13 +38,34 @@ class DividendAnalysisApp:
     def __init__(self, config_path: str = './conf/general.conf'):
         self.config = AppConfig.from_file(config_path)
         self.components = DividendComponents(self.config)
+        self.prefetcher = Prefetcher(
+            self._warm_tickers,
+            max_workers=self.config.prefetch_workers,
+            requests_per_second=self.config.prefetch_requests_per_second,
+            batch_size=self.config.prefetch_batch_size
+        )
+        self.results = ResultStore(max_bytes=self.config.results_max_mb * 1024 * 1024)
+        self.figures = FigureCache(max_bytes=self.config.figures_max_mb * 1024 * 1024)
+        self.scheduler = RefreshScheduler(self.config)
+        self.cache_collector = CacheCollector(
+            max_bytes=self.config.cache_max_size_mb * 1024 * 1024,
+            interval_minutes=self.config.cache_gc_interval_minutes
+        )
+        self._background_started = False
+        self._background_lock = threading.Lock()
         self.app = self._create_dash_app()
         self._setup_callbacks()
+        self._setup_api_routes()
+        # started by the process serving requests, whether the dev server or a WSGI server such as gunicorn
+        self.app.server.before_request(self._start_background_jobs)
     
     def _create_dash_app(self) -> Dash:
         """Create and configure the Dash app"""
         app = Dash(__name__)
-        app.layout = self._create_layout()
+        # the layout is built for each page load, so a new page starts at the current revalidation version
+        app.layout = self._create_layout
+        # the stock price graph is created by a callback, its zoom callback targets it before it exists
+        app.validation_layout = html.Div([self._create_layout(), dcc.Graph(id='stocks-graph')])
         return app
     
     def _create_layout(self) -> html.Div:
@@ -31,62 +73,143 @@ class DividendAnalysisApp:
         return html.Div([
             self.components.create_header(),
             self.components.create_footer(),
-            html.Div([html.Div(id='dividends_grid', children=[])]),
-            html.Div([dag.AgGrid(id="dividends_general_grid")], style={'display': 'none'}),
-            html.Div([
-                html.Footer(
-                    "Info taken from investing.com", 
-                    className="plotly-footnote",
-                    style={
-                        'text-align': 'left', 
-                        'font-family': self.config.font_figure,
-                        'margin-top': '5px', 
-                        'fontSize': self.config.footer_size, 
-                        'color': self.config.light_gray,
-                        'margin-right': '10px'
-                    }
-                )
+            dcc.Tabs(id='tabs', value='calendar', children=[
+                dcc.Tab(label='Calendar', value='calendar', children=[
+                    html.Div([html.Div(id='dividends_grid', children=[])]),
+                    html.Div(
+                        id='prefetch-progress',
+                        style={
+                            'text-align': 'left',
+                            'font-family': self.config.font_figure,
+                            'fontSize': self.config.footer_size,
+                            'color': self.config.dark_gray
+                        }
+                    ),
+                    html.Div([dag.AgGrid(id="dividends_general_grid")], style={'display': 'none'}),
+                    html.Div([
+                        html.Footer(
+                            "Info taken from investing.com", 
+                            className="plotly-footnote",
+                            style={
+                                'text-align': 'left', 
+                                'font-family': self.config.font_figure,
+                                'margin-top': '5px', 
+                                'fontSize': self.config.footer_size, 
+                                'color': self.config.light_gray,
+                                'margin-right': '10px'
+                            }
+                        )
+                    ]),
+                    html.Div([html.Div(id='stocks', children=[])]),
+                    html.Div([html.Div(id='yields', children=[])]),
+                    html.Div([html.Div(id='dividends_hist', children=[])]),
+                    html.Div(
+                        id="title-dividend_Payout",
+                        style={
+                            'textAlign': 'center', 
+                            'font-family': self.config.font_figure, 
+                            'color': self.config.dark_gray
+                        }
+                    ),
+                    html.Div(
+                        style={
+                            'color': 'black', 
+                            "display": "flex", 
+                            "justify-content": "center", 
+                            "align-items": "center",
+                            'padding': '15px', 
+                            "height": "8vh", 
+                            'font': self.config.font_figure
+                        }, 
+                        id='dividends_summary', 
+                        children=[]
+                    ),
+                    html.Div(
+                        style={
+                            'display': 'flex', 
+                            "textAlign": "center", 
+                            'marginLeft': 'auto', 
+                            'marginRight': 'auto',
+                            'justifyContent': 'center', 
+                            'alignItems': 'center', 
+                            'font': self.config.font_figure
+                        }, 
+                        id="dividends_full"
+                    )
+                ]),
+                dcc.Tab(label='Screener', value='screener', children=[self.components.create_screener()]),
+                dcc.Tab(label='Income', value='income', children=[self.components.create_income_projection()])
             ]),
-            html.Div([html.Div(id='stocks', children=[])]),
-            html.Div([html.Div(id='dividends_hist', children=[])]),
-            html.Div(
-                id="title-dividend_Payout",
-                style={
-                    'textAlign': 'center', 
-                    'font-family': self.config.font_figure, 
-                    'color': self.config.dark_gray
-                }
-            ),
-            html.Div(
-                style={
-                    'color': 'black', 
-                    "display": "flex", 
-                    "justify-content": "center", 
-                    "align-items": "center",
-                    'padding': '15px', 
-                    "height": "8vh", 
-                    'font': self.config.font_figure
-                }, 
-                id='dividends_summary', 
-                children=[]
-            ),
-            html.Div(
-                style={
-                    'display': 'flex', 
-                    "textAlign": "center", 
-                    'marginLeft': 'auto', 
-                    'marginRight': 'auto',
-                    'justifyContent': 'center', 
-                    'alignItems': 'center', 
-                    'font': self.config.font_figure
-                }, 
-                id="dividends_full"
-            ),
-            dcc.Store(id='store-data', data=[], storage_type='memory')
+            dcc.Store(id='store-data', data=[], storage_type='memory'),
+            # one per page load, the prefetch of a page is only cancelled by the same page
+            dcc.Store(id='session-id', data=uuid.uuid4().hex, storage_type='memory'),
+            # stale entries are served at once and refreshed in the background, the page polls for the new data
+            dcc.Store(id='revalidated', data={'version': notifier.version, 'keys': []}, storage_type='memory'),
+            dcc.Interval(id='revalidate-interval', interval=self.config.revalidate_poll_ms,
+                         disabled=not self.config.stale_while_revalidate),
+            dcc.Interval(id='prefetch-interval', interval=self.config.revalidate_poll_ms,
+                         disabled=not self.config.prefetch_enabled)
         ])
     
+    def _fetch_ticker(self, ticker: str) -> dict:
+        """Start both per-ticker fetches at once, callbacks firing for the same row share the same futures"""
+        start_date, end_date = self.config.price_window()
+        return {
+            'historical_dividends': fetcher.submit(
+                ('historical_dividends', ticker),
+                get_dividends_historical_by_ticker.get_historical_dividends,
+                ticker=ticker,
+                freshness=self.config.freshness['historical_dividends']
+            ),
+            'historical_data': fetcher.submit(
+                ('historical_data', ticker),
+                get_historical_data_by_ticker.get_historical_data,
+                ticker=ticker,
+                start_date=start_date,
+                end_date=end_date,
+                freshness=self.config.freshness['historical_data']
+            )
+        }
+    
+    def _warm_tickers(self, tickers: list):
+        """Fill the price, dividend and summary caches of several tickers with bulk downloads"""
+        key = tuple(tickers)
+        start_date, end_date = self.config.price_window()
+        dividends = fetcher.submit(
+            ('historical_dividends_batch', key),
+            get_dividends_historical_by_ticker.get_historical_dividends_batch,
+            tickers=tickers,
+            freshness=self.config.freshness['historical_dividends']
+        )
+        prices = fetcher.submit(
+            ('historical_data_batch', key),
+            get_historical_data_by_ticker.get_historical_data_batch,
+            tickers=tickers,
+            start_date=start_date,
+            end_date=end_date,
+            freshness=self.config.freshness['historical_data']
+        )
+        dividends = dividends.result()
+        dividend_yield.refresh_yields(prices.result(), dividends)
+        for dg in dividends.values():
+            if not dg.empty:
+                calculate_dividend_summary.get_dividend_summary(
+                    data=dg.to_dict('records'),
+                    freshness=self.config.freshness['dividends_summary']
+                )
+    
+    @staticmethod
+    def _skip_unless_revalidated(revalidated, *file_names):
+        """Stop a callback fired by a background refresh that did not touch any of file_names"""
+        if callback_context.triggered_id != 'revalidated':
+            return
+        if not set(file_names).intersection((revalidated or {}).get('keys', [])):
+            raise PreventUpdate
+    
     def _setup_callbacks(self):
         """Setup all Dash callbacks"""
+        self._setup_revalidation_callback()
+        self._setup_prefetch_progress_callback()
         self._setup_dividends_grid_callback()
         self._setup_store_data_callback()
         self._setup_historical_dividends_callback()
@@ -94,86 +217,264 @@ class DividendAnalysisApp:
         self._setup_dividend_summary_callback()
         self._setup_dividend_title_callback()
         self._setup_stocks_callback()
+        self._setup_stocks_zoom_callback()
+        self._setup_yields_callback()
+        self._setup_screener_callback()
+        self._setup_income_callback()
+    
+    def _setup_api_routes(self):
+        """JSON endpoints served next to the Dash pages"""
+        @self.app.server.route('/api/income-projection')
+        def income_projection_api():
+            # e.g. /api/income-projection?holdings=KO:100,PEP:50&percentiles=5,50,95&paths=5000
+            try:
+                holdings = income_projection.parse_holdings(request.args.get('holdings', ''))
+                if len(holdings) > income_projection.MAX_HOLDINGS:
+                    raise ValueError(f"At most {income_projection.MAX_HOLDINGS} holdings are projected")
+                percentiles = request.args.get('percentiles')
+                if percentiles:
+                    percentiles = [float(q) for q in percentiles.split(',')]
+                else:
+                    percentiles = income_projection.PERCENTILES
+                paths = min(int(request.args.get('paths', income_projection.PATHS)), income_projection.MAX_PATHS)
+                if paths < 1:
+                    raise ValueError("paths must be a positive number")
+                table = income_projection.income_percentiles(holdings, percentiles=percentiles, paths=paths)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            except (Exception, SystemExit) as e:
+                return jsonify({'error': f"Error projecting the dividend income: {e}"}), 500
+            return jsonify({'holdings': holdings, 'percentiles': table.round(2).to_dict('index'),
+                            'missing': table.attrs.get('missing', [])})
+    
+    def _setup_revalidation_callback(self):
+        @self.app.callback(
+            Output('revalidated', 'data'),
+            Input('revalidate-interval', 'n_intervals'),
+            State('revalidated', 'data')
+        )
+        def poll_revalidated(n_intervals, revalidated):
+            previous = (revalidated or {}).get('version', 0)
+            version, keys = notifier.changes_since(previous)
+            if version == previous:
+                return no_update
+            return {'version': version, 'keys': keys}
+    
+    def _setup_prefetch_progress_callback(self):
+        @self.app.callback(
+            Output('prefetch-progress', 'children'),
+            Input('prefetch-interval', 'n_intervals'),
+            State('session-id', 'data')
+        )
+        def show_prefetch_progress(n_intervals, session=None):
+            return self._prefetch_progress_text(self.prefetcher.progress(session))
+    
+    @staticmethod
+    def _prefetch_progress_text(progress: dict) -> str:
+        """Line shown under the calendar while its tickers are warmed, empty once the prefetch is over"""
+        if not progress['running']:
+            return ''
+        finished = progress['done'] + progress['failed']
+        failed = f", {progress['failed']} failed" if progress['failed'] else ''
+        return f"Loading the calendar companies: {finished}/{progress['total']}{failed}"
     
     def _setup_dividends_grid_callback(self):
         @self.app.callback(
             Output('dividends_grid', 'children'),
-            Input('dropdown_range', 'value')
+            Input('dropdown_range', 'value'),
+            Input('revalidated', 'data'),
+            State('session-id', 'data')
         )
-        def update_output(value):
+        def update_output(value, revalidated=None, session=None):
             if value is not None:
+                self._skip_unless_revalidated(
+                    revalidated,
+                    *(f'{get_dividends.INITIAL_PART_DIVIDENDS_BY_DATE}{country}_{value}' for country in self.config.countries)
+                )
                 df = get_dividends.get_dividends_next_week(
-                    country=self.config.country, 
+                    country=self.config.countries if len(self.config.countries) > 1 else self.config.country, 
                     filter_time=value
                 )
+                tickers = calendar_tickers(df)
+                if self.config.prefetch_enabled:
+                    self.prefetcher.start(tickers, session=session)
+                # only read from the yields computed by the prefetch, the column fills in as the caches are warmed
+                yields = dividend_yield.cached_forward_yields(
+                    (ticker for ticker in tickers if ticker),
+                    freshness=self.config.freshness['historical_data']
+                )
+                df['Fwd. Yield (%)'] = [yields.get(ticker) for ticker in tickers]
                 return self.components.create_dividends_grid(df.to_dict("records"))
             return []
     
     def _setup_store_data_callback(self):
         @self.app.callback(
             Output('store-data', 'data'),
-            Input('dividends_general_grid', 'selectedRows')
+            Input('dividends_general_grid', 'selectedRows'),
+            Input('revalidated', 'data')
         )
-        def store_data(row):
+        def store_data(row, revalidated=None):
             if row is not None:
-                cell = row[0]['Company (Ticker)']
-                ticker = cell[cell.find("(") + 1:cell.find(")")]
-                dg = get_dividends_historical_by_ticker.get_historical_dividends(
-                    ticker=ticker, 
-                    time_delta=self.config.dividends_days
+                ticker = row_ticker(row[0])
+                self._skip_unless_revalidated(
+                    revalidated,
+                    f'{get_dividends_historical_by_ticker.INITIAL_PART_HISTORICAL_DIVIDENDS_TICKER}{ticker}',
+                    f'{get_dividends_historical_by_ticker.INITIAL_PART_DIVIDENDS_SUMMARY}{ticker}'
                 )
-                dg["date"] = pd.to_datetime(dg["date"])
-                dg["YEAR"] = dg["date"].dt.year
-                dg["date"] = dg["date"].dt.date
-                dg.sort_values(by='date', ascending=False, inplace=True)
-                dg['YEAR'] = dg['YEAR'].where(dg['YEAR'] != dg['YEAR'].shift(), '')
-                return dg.to_dict('records')
+                # the dividend history stays on the server, the browser only holds the key of its results
+                key, _ = self._ticker_results(ticker)
+                return {'ticker': ticker, 'key': key}
             return []
     
+    def _ticker_results(self, ticker: str) -> tuple:
+        """Figure, table and summary of a ticker's dividends, computed once per version of its history and summary"""
+        dg = self._fetch_ticker(ticker)['historical_dividends'].result()
+        summary = cache_index.version(f'{get_dividends_historical_by_ticker.INITIAL_PART_DIVIDENDS_SUMMARY}{ticker}')
+        key = f"{ticker}:{int(pd.util.hash_pandas_object(dg, index=False).sum()):x}:{summary}"
+        return key, self.results.get_or_compute(key, self._compute_ticker_results, ticker, dg, key)
+    
+    def _stored_results(self, stored) -> dict:
+        """Results of the key held in store-data, computed again when this worker does not hold them"""
+        if not stored:
+            return None
+        results = self.results.get(stored['key'])
+        if results is None:
+            _, results = self._ticker_results(stored['ticker'])
+        return results
+    
+    def _compute_ticker_results(self, ticker: str, dg: pd.DataFrame, version: str) -> dict:
+        if dg.empty:
+            return {'figure': [], 'table': [], 'summary': []}
+        dff = dg.copy()
+        dff["date"] = pd.to_datetime(dff["date"])
+        dff["YEAR"] = dff["date"].dt.year
+        dff["date"] = dff["date"].dt.date
+        dff.sort_values(by='date', ascending=False, inplace=True)
+        dff['YEAR'] = dff['YEAR'].where(dff['YEAR'] != dff['YEAR'].shift(), '')
+        return {
+            'figure': self._historical_dividends_figure(ticker, dff, version),
+            'table': self._dividend_table(dff),
+            'summary': self._dividend_summary(dg.to_dict('records'))
+        }
+    
+    def _cached_figure(self, name: str, ticker: str, version: str, build):
+        """Graph of a serialized figure, built again only when the version of its data or the theme changes"""
+        key = (name, ticker, version, self.config.theme())
+        return dcc.Graph(figure=self.figures.get_or_build(key, build))
+    
+    def _historical_dividends_figure(self, ticker: str, dff: pd.DataFrame, version: str):
+        # Check if required columns exist
+        if 'date' in dff.columns and 'dividend' in dff.columns and len(dff) > 0:
+            return self._cached_figure(
+                'historical_dividends',
+                ticker,
+                version,
+                lambda: self._build_historical_dividends_figure(ticker, dff)
+            )
+        else:
+            return html.Div("No dividend data available for this ticker", 
+                          style={'textAlign': 'center', 'color': 'red'})
+    
+    def _build_historical_dividends_figure(self, ticker: str, dff: pd.DataFrame):
+        fig_historical_dividends = px.line(dff, x='date', y='dividend', markers=True)
+        fig_historical_dividends.update_layout(
+            title=dict(
+                text=f"<b>Historical Dividends Information for [{ticker}]</b>",
+                font=dict(
+                    family=self.config.font_figure, 
+                    size=self.config.font_size_title, 
+                    color=self.config.dark_gray
+                ),
+                y=0.9,
+                x=0.5,
+                xanchor='center',
+                yanchor='top'
+            ),
+            yaxis_title='<b>Dividends US$</b>',
+            xaxis_title=""
+        )
+        fig_historical_dividends.add_annotation(
+            text='Info taken from yahoo_fin', 
+            xref='x domain',
+            showarrow=False,
+            font=dict(
+                family=self.config.font_figure, 
+                size=self.config.footer_size, 
+                color=self.config.light_gray
+            ),
+            yref='y domain', 
+            y=-0.12
+        )
+        return fig_historical_dividends
+    
+    def _dividend_table(self, dff: pd.DataFrame):
+        try:
+            # Check if required columns exist
+            if 'YEAR' in dff.columns and 'dividend' in dff.columns and 'date' in dff.columns:
+                columns = [{"name": i, "id": i} for i in dff[['YEAR', 'dividend', 'date']]]
+                styles = self.config.get_style_config()
+                return dash_table.DataTable(
+                    data=dff.to_dict('records'), 
+                    columns=columns, 
+                    fill_width=False,
+                    style_header=styles['style_header'],
+                    style_cell=styles['style_cell'],
+                    style_data_conditional=styles['style_data_conditional'],
+                    style_data={'color': self.config.dark_gray},
+                    style_table=styles['style_table']
+                )
+            else:
+                return html.Div("No dividend table data available", 
+                              style={'textAlign': 'center', 'color': 'red'})
+        except Exception as e:
+            return html.Div(f"Error displaying dividend table: {str(e)}", 
+                          style={'textAlign': 'center', 'color': 'red'})
+    
+    def _dividend_summary(self, data: list):
+        try:
+            dg = calculate_dividend_summary.get_dividend_summary(
+                data=data, 
+                freshness=self.config.freshness['dividends_summary']
+            )
+            if dg is not None and not dg.empty:
+                columns = [{"name": i, "id": i} for i in dg.columns]
+                dg_data = dg.to_dict('records')
+                return dash_table.DataTable(
+                    data=dg_data, 
+                    columns=columns, 
+                    fill_width=False, 
+                    style_table={'overflowX': 'auto'},
+                    style_cell={
+                        'text-align': 'center', 
+                        "font-family": self.config.font_figure,
+                        'backgroundColor': '#cccccc'  # Fixed color value
+                    },
+                    style_data={
+                        'backgroundColor': '#E8E8E8', 
+                        'color': self.config.dark_gray
+                    },
+                    style_header={
+                        "backgroundColor": self.config.main_color, 
+                        "color": "#FFFFFF", 
+                        "padding": "0px",
+                        "border": "0"
+                    }
+                )
+            else:
+                return html.Div("No dividend summary available", 
+                              style={'textAlign': 'center', 'color': 'red'})
+        except Exception as e:
+            return html.Div(f"Error calculating dividend summary: {str(e)}", 
+                          style={'textAlign': 'center', 'color': 'red'})
+    
     def _setup_historical_dividends_callback(self):
         @self.app.callback(
             Output("dividends_hist", "children"),
             Input("store-data", "data")
         )
         def display_historical_dividends_figure(data):
-            if data is not None and len(data) > 0:
-                dff = pd.DataFrame(data)
-                # Check if required columns exist
-                if 'date' in dff.columns and 'dividend' in dff.columns and len(dff) > 0:
-                    fig_historical_dividends = px.line(dff, x='date', y='dividend', markers=True)
-                    fig_historical_dividends.update_layout(
-                        title=dict(
-                            text=f"<b>Historical Dividends Information for [{dff['ticker'][0]}]</b>",
-                            font=dict(
-                                family=self.config.font_figure, 
-                                size=self.config.font_size_title, 
-                                color=self.config.dark_gray
-                            ),
-                            y=0.9,
-                            x=0.5,
-                            xanchor='center',
-                            yanchor='top'
-                        ),
-                        yaxis_title='<b>Dividends US$</b>',
-                        xaxis_title=""
-                    )
-                    fig_historical_dividends.add_annotation(
-                        text='Info taken from yahoo_fin', 
-                        xref='x domain',
-                        showarrow=False,
-                        font=dict(
-                            family=self.config.font_figure, 
-                            size=self.config.footer_size, 
-                            color=self.config.light_gray
-                        ),
-                        yref='y domain', 
-                        y=-0.12
-                    )
-                    return dcc.Graph(figure=fig_historical_dividends)
-                else:
-                    return html.Div("No dividend data available for this ticker", 
-                                  style={'textAlign': 'center', 'color': 'red'})
-            return []
+            results = self._stored_results(data)
+            return results['figure'] if results else []
     
     def _setup_dividend_table_callback(self):
         @self.app.callback(
@@ -181,30 +482,8 @@ class DividendAnalysisApp:
             Input("store-data", "data")
         )
         def display_dividend_table(data):
-            if data is not None and len(data) > 0:
-                try:
-                    dff = pd.DataFrame(data)
-                    # Check if required columns exist
-                    if 'YEAR' in dff.columns and 'dividend' in dff.columns and 'date' in dff.columns:
-                        columns = [{"name": i, "id": i} for i in dff[['YEAR', 'dividend', 'date']]]
-                        styles = self.config.get_style_config()
-                        return dash_table.DataTable(
-                            data=dff.to_dict('records'), 
-                            columns=columns, 
-                            fill_width=False,
-                            style_header=styles['style_header'],
-                            style_cell=styles['style_cell'],
-                            style_data_conditional=styles['style_data_conditional'],
-                            style_data={'color': self.config.dark_gray},
-                            style_table=styles['style_table']
-                        )
-                    else:
-                        return html.Div("No dividend table data available", 
-                                      style={'textAlign': 'center', 'color': 'red'})
-                except Exception as e:
-                    return html.Div(f"Error displaying dividend table: {str(e)}", 
-                                  style={'textAlign': 'center', 'color': 'red'})
-            return []
+            results = self._stored_results(data)
+            return results['table'] if results else []
     
     def _setup_dividend_summary_callback(self):
         @self.app.callback(
@@ -212,43 +491,8 @@ class DividendAnalysisApp:
             Input("store-data", "data")
         )
         def display_dividend_summary(data):
-            if data is not None and len(data) > 0:
-                try:
-                    dg = calculate_dividend_summary.get_dividend_summary(
-                        data=data, 
-                        time_delta=self.config.dividends_days
-                    )
-                    if dg is not None and not dg.empty:
-                        columns = [{"name": i, "id": i} for i in dg.columns]
-                        dg_data = dg.to_dict('records')
-                        return dash_table.DataTable(
-                            data=dg_data, 
-                            columns=columns, 
-                            fill_width=False, 
-                            style_table={'overflowX': 'auto'},
-                            style_cell={
-                                'text-align': 'center', 
-                                "font-family": self.config.font_figure,
-                                'backgroundColor': '#cccccc'  # Fixed color value
-                            },
-                            style_data={
-                                'backgroundColor': '#E8E8E8', 
-                                'color': self.config.dark_gray
-                            },
-                            style_header={
-                                "backgroundColor": self.config.main_color, 
-                                "color": "#FFFFFF", 
-                                "padding": "0px",
-                                "border": "0"
-                            }
-                        )
-                    else:
-                        return html.Div("No dividend summary available", 
-                                      style={'textAlign': 'center', 'color': 'red'})
-                except Exception as e:
-                    return html.Div(f"Error calculating dividend summary: {str(e)}", 
-                                  style={'textAlign': 'center', 'color': 'red'})
-            return []
+            results = self._stored_results(data)
+            return results['summary'] if results else []
     
     def _setup_dividend_title_callback(self):
         @self.app.callback(
@@ -257,8 +501,7 @@ class DividendAnalysisApp:
         )
         def display_dividend_payout_title(row):
             if row is not None:
-                cell = row[0]['Company (Ticker)']
-                ticker = cell[cell.find("(") + 1:cell.find(")")]
+                ticker = row_ticker(row[0])
                 return html.Div([
                     html.H2(
                         f"Dividend Payout History for [{ticker}]", 
@@ -282,50 +525,308 @@ class DividendAnalysisApp:
     def _setup_stocks_callback(self):
         @self.app.callback(
             Output("stocks", "children"),
-            Input("dividends_general_grid", "selectedRows")
+            Input("dividends_general_grid", "selectedRows"),
+            Input('revalidated', 'data')
         )
-        def display_stocks_figure(row):
+        def display_stocks_figure(row, revalidated=None):
             if row is not None:
-                cell = row[0]['Company (Ticker)']
-                ticker = cell[cell.find("(") + 1:cell.find(")")]
-                df = get_historical_data_by_ticker.get_historical_data(
-                    ticker=ticker, 
-                    start_date=self.config.start_date,
-                    end_date=self.config.end_date, 
-                    days_delta=int(self.config.historical_data_days)
-                )
-                fig_historical_data = px.line(df, x='date', y='close')
-                fig_historical_data.update_layout(
-                    title=dict(
-                        text=f"<b>Stock Price (5 Years) for [{ticker}]</b>",
-                        font=dict(
-                            family=self.config.font_figure, 
-                            size=self.config.font_size_title, 
-                            color=self.config.dark_gray
-                        ),
-                        y=0.9,
-                        x=0.5,
-                        xanchor='center',
-                        yanchor='top'
-                    ),
-                    yaxis_title='<b>Stock Price US$</b>',
-                    xaxis_title=""
+                ticker = row_ticker(row[0])
+                self._skip_unless_revalidated(
+                    revalidated,
+                    f'{get_historical_data_by_ticker.INITIAL_PART_HISTORICAL_DATA_TICKER}{ticker}'
                 )
-                fig_historical_data.add_annotation(
-                    text='Info taken from yahoo_fin', 
-                    xref='x domain', 
-                    showarrow=False,
-                    font=dict(
-                        family=self.config.font_figure, 
-                        size=self.config.footer_size, 
-                        color=self.config.light_gray
-                    ), 
-                    yref='y domain', 
-                    y=-0.12
+                return dcc.Graph(id='stocks-graph', figure=self._stocks_figure(ticker))
+            return []
+    
+    def _setup_stocks_zoom_callback(self):
+        @self.app.callback(
+            Output('stocks-graph', 'figure'),
+            Input('stocks-graph', 'relayoutData'),
+            State('dividends_general_grid', 'selectedRows'),
+            prevent_initial_call=True
+        )
+        def zoom_stocks_figure(relayout, row):
+            if row is None:
+                raise PreventUpdate
+            window = self._zoom_window(relayout)
+            return self._stocks_figure(row_ticker(row[0]), window=window)
+    
+    @staticmethod
+    def _zoom_window(relayout) -> tuple:
+        """(start, end) of the x axis after a zoom or pan, None when zoomed back out"""
+        relayout = relayout or {}
+        if 'xaxis.range[0]' in relayout and 'xaxis.range[1]' in relayout:
+            return relayout['xaxis.range[0]'], relayout['xaxis.range[1]']
+        if 'xaxis.range' in relayout:
+            return tuple(relayout['xaxis.range'])
+        if relayout.get('xaxis.autorange'):
+            return None
+        # resizes and y axis changes do not change the points needed
+        raise PreventUpdate
+    
+    def _stocks_figure(self, ticker: str, window: tuple = None):
+        """Stock price figure, the full history is served serialized from cache, a zoomed window is drawn again"""
+        file_name = f'{get_historical_data_by_ticker.INITIAL_PART_HISTORICAL_DATA_TICKER}{ticker}'
+        # read before the prices, a refresh landing in between is drawn again on the next selection
+        version = cache_index.version(file_name)
+        if window is None:
+            df = self.results.get_or_compute(('prices', ticker, version), self._fetch_prices, ticker)
+            key = ('stocks', ticker, version, self.config.theme())
+            return self.figures.get_or_build(key, lambda: self._build_stocks_figure(ticker, df))
+        # a zoom redraws the prices the graph was drawn from, a worker that does not hold them reads the cache
+        df = self.results.get(('prices', ticker, version))
+        if df is None:
+            entry = load_latest_response(file_name)
+            if entry is None:
+                raise PreventUpdate
+            df = entry[0]
+        return self._build_stocks_figure(ticker, df, window)
+    
+    def _fetch_prices(self, ticker: str) -> pd.DataFrame:
+        return self._fetch_ticker(ticker)['historical_data'].result()
+    
+    def _build_stocks_figure(self, ticker: str, df: pd.DataFrame, window: tuple = None):
+        df = downsample_prices(df, self.config.max_points, window=window)
+        fig_historical_data = px.line(df, x='date', y='close')
+        fig_historical_data.update_layout(
+            title=dict(
+                text=f"<b>Stock Price (5 Years) for [{ticker}]</b>",
+                font=dict(
+                    family=self.config.font_figure, 
+                    size=self.config.font_size_title, 
+                    color=self.config.dark_gray
+                ),
+                y=0.9,
+                x=0.5,
+                xanchor='center',
+                yanchor='top'
+            ),
+            yaxis_title='<b>Stock Price US$</b>',
+            xaxis_title="",
+            # keeps the zoom while the points of the visible range are replaced
+            uirevision=ticker
+        )
+        if window is not None:
+            fig_historical_data.update_xaxes(range=list(window))
+        fig_historical_data.add_annotation(
+            text='Info taken from yahoo_fin', 
+            xref='x domain', 
+            showarrow=False,
+            font=dict(
+                family=self.config.font_figure, 
+                size=self.config.footer_size, 
+                color=self.config.light_gray
+            ), 
+            yref='y domain', 
+            y=-0.12
+        )
+        return fig_historical_data
+    
+    def _setup_yields_callback(self):
+        @self.app.callback(
+            Output("yields", "children"),
+            Input("dividends_general_grid", "selectedRows"),
+            Input('revalidated', 'data')
+        )
+        def display_yields_figure(row, revalidated=None):
+            if row is not None:
+                ticker = row_ticker(row[0])
+                self._skip_unless_revalidated(
+                    revalidated,
+                    f'{get_historical_data_by_ticker.INITIAL_PART_HISTORICAL_DATA_TICKER}{ticker}',
+                    f'{get_dividends_historical_by_ticker.INITIAL_PART_HISTORICAL_DIVIDENDS_TICKER}{ticker}'
                 )
-                return dcc.Graph(figure=fig_historical_data)
+                return self._yields_figure(ticker)
             return []
     
+    def _yields_figure(self, ticker: str):
+        """Trailing and forward yield figure, built again when the prices or the dividends change"""
+        version = '|'.join(str(cache_index.version(f'{part}{ticker}')) for part in (
+            get_historical_data_by_ticker.INITIAL_PART_HISTORICAL_DATA_TICKER,
+            get_dividends_historical_by_ticker.INITIAL_PART_HISTORICAL_DIVIDENDS_TICKER
+        ))
+        futures = self._fetch_ticker(ticker)
+        df, dg = futures['historical_data'].result(), futures['historical_dividends'].result()
+        if df is None or df.empty:
+            return html.Div("No stock price data available for this ticker", 
+                          style={'textAlign': 'center', 'color': 'red'})
+        return self._cached_figure(
+            'yields',
+            ticker,
+            version,
+            lambda: self._build_yields_figure(ticker, dividend_yield.get_yield_series(ticker, df, dg))
+        )
+    
+    def _build_yields_figure(self, ticker: str, series: pd.DataFrame):
+        series = downsample_prices(series, self.config.max_points, y='forward_yield')
+        fig_yields = px.line(
+            series.rename(columns={'trailing_yield': 'Trailing', 'forward_yield': 'Forward'}),
+            x='date',
+            y=['Trailing', 'Forward']
+        )
+        fig_yields.update_layout(
+            title=dict(
+                text=f"<b>Dividend Yield for [{ticker}]</b>",
+                font=dict(
+                    family=self.config.font_figure, 
+                    size=self.config.font_size_title, 
+                    color=self.config.dark_gray
+                ),
+                y=0.9,
+                x=0.5,
+                xanchor='center',
+                yanchor='top'
+            ),
+            yaxis_title='<b>Yield %</b>',
+            xaxis_title="",
+            legend_title_text=""
+        )
+        fig_yields.add_annotation(
+            text='Info taken from yahoo_fin', 
+            xref='x domain', 
+            showarrow=False,
+            font=dict(
+                family=self.config.font_figure, 
+                size=self.config.footer_size, 
+                color=self.config.light_gray
+            ), 
+            yref='y domain', 
+            y=-0.12
+        )
+        return fig_yields
+    
+    def _setup_screener_callback(self):
+        @self.app.callback(
+            Output('screener_grid', 'rowData'),
+            Input('tabs', 'value'),
+            Input('screener-min-yield', 'value'),
+            Input('screener-min-streak', 'value'),
+            Input('screener-min-cagr', 'value'),
+            Input('screener-calendar', 'value'),
+            Input('screener-sort', 'value'),
+            Input('screener-options', 'value'),
+            Input('revalidated', 'data')
+        )
+        def update_screener(tab, min_yield, min_streak, min_cagr, calendar, sort_by, options, revalidated=None):
+            if tab != 'screener':
+                raise PreventUpdate
+            filters = self._screener_filters(min_yield, min_streak, min_cagr, calendar, options)
+            df = universe.screen(filters, sort_by=sort_by or 'forward_yield', limit=self.config.screener_max_rows)
+            return self._screener_rows(df)
+    
+    @staticmethod
+    def _screener_filters(min_yield=None, min_streak=None, min_cagr=None, calendar=None, options=None) -> list:
+        """Screener filters of the values set in the controls, the empty ones do not filter"""
+        filters = []
+        if min_yield is not None:
+            filters.append(('forward_yield', '>=', min_yield))
+        if min_streak is not None:
+            filters.append(('increase_streak', '>=', min_streak))
+        if min_cagr is not None:
+            filters.append(('cagr_5y', '>=', min_cagr / 100))
+        if calendar:
+            # a calendar holds the narrower ones, e.g. this week's covers tomorrow's ex-dividend dates
+            filters.append((f'in_{calendar}', '==', True))
+        if 'exclude_cuts' in (options or []):
+            filters += [('cut', '==', False), ('suspended', '==', False)]
+        return filters
+    
+    @staticmethod
+    def _screener_rows(df: pd.DataFrame) -> list:
+        rows = df.assign(status=payout_status(df), cagr_5y=df['cagr_5y'] * 100).reset_index()
+        rows = rows.round({'close': 2, 'forward_yield': 2, 'trailing_yield': 2, 'cagr_5y': 2})
+        columns = ['ticker', 'company', 'close', 'forward_yield', 'trailing_yield', 'cagr_5y', 'increase_streak',
+                   'frequency', 'status', 'calendar', 'payment_date']
+        rows = rows[columns].astype(object)
+        return rows.where(rows.notna(), None).to_dict('records')
+    
+    def _setup_income_callback(self):
+        @self.app.callback(
+            Output('income_projection', 'children'),
+            Input('income-project', 'n_clicks'),
+            State('income-holdings', 'value')
+        )
+        def project_income(n_clicks, holdings):
+            if not n_clicks:
+                raise PreventUpdate
+            return self._income_projection(holdings)
+    
+    def _income_projection(self, text: str):
+        try:
+            holdings = income_projection.parse_holdings(text)
+            table = income_projection.income_percentiles(holdings)
+        except ValueError as e:
+            return html.Div(str(e), style={'textAlign': 'center', 'color': 'red'})
+        except (Exception, SystemExit) as e:
+            return html.Div(f"Error projecting the dividend income: {str(e)}", 
+                          style={'textAlign': 'center', 'color': 'red'})
+        if not table['mean'].any():
+            return html.Div("No current dividends to project for these holdings", 
+                          style={'textAlign': 'center', 'color': 'red'})
+        totals = table.loc[['Total']].round(2)
+        missing = table.attrs.get('missing', [])
+        return html.Div([
+            dcc.Graph(figure=self._build_income_figure(table.drop(index='Total'))),
+            html.Div(f"No current dividends to project for {', '.join(missing)}" if missing else None,
+                     style={'textAlign': 'center', 'color': 'red'}),
+            dash_table.DataTable(
+                data=totals.to_dict('records'),
+                columns=[{"name": f"{column} (US$)", "id": column} for column in totals.columns],
+                fill_width=False,
+                style_table={'overflowX': 'auto', 'margin': 'auto'},
+                style_cell={'text-align': 'center', "font-family": self.config.font_figure},
+                style_data={'backgroundColor': '#E8E8E8', 'color': self.config.dark_gray},
+                style_header={"backgroundColor": self.config.main_color, "color": "#FFFFFF", "border": "0"}
+            )
+        ])
+    
+    def _build_income_figure(self, table: pd.DataFrame):
+        """Median monthly income with the bands between the outer percentiles around it"""
+        percentiles = [column for column in table.columns if column.startswith('p')]
+        fig_income = go.Figure()
+        # bands from the outermost pair of percentiles inwards, each one filled down to its lower percentile
+        for lower, upper in zip(percentiles[:len(percentiles) // 2], reversed(percentiles)):
+            fig_income.add_trace(go.Scatter(x=table.index, y=table[lower], mode='lines', line=dict(width=0),
+                                            showlegend=False, hoverinfo='skip'))
+            fig_income.add_trace(go.Scatter(x=table.index, y=table[upper], mode='lines', line=dict(width=0),
+                                            fill='tonexty', fillcolor='rgba(99, 110, 250, 0.2)',
+                                            name=f'{lower} - {upper}'))
+        middle = percentiles[len(percentiles) // 2] if len(percentiles) % 2 else None
+        if middle is not None:
+            fig_income.add_trace(go.Scatter(x=table.index, y=table[middle], mode='lines+markers', name=middle,
+                                            line=dict(color=self.config.main_color)))
+        fig_income.update_layout(
+            title=dict(
+                text="<b>Projected Monthly Dividend Income</b>",
+                font=dict(
+                    family=self.config.font_figure, 
+                    size=self.config.font_size_title, 
+                    color=self.config.dark_gray
+                ),
+                y=0.9,
+                x=0.5,
+                xanchor='center',
+                yanchor='top'
+            ),
+            yaxis_title='<b>Income US$</b>',
+            xaxis_title="",
+            legend_title_text="Percentiles"
+        )
+        return fig_income
+    
+    def _start_background_jobs(self):
+        """Start the cache collector and the refresh scheduler with the first request served by this process"""
+        # the reloader's parent process of the dev server never serves a request, it does not run them twice
+        if self._background_started:
+            return
+        with self._background_lock:
+            if self._background_started:
+                return
+            self._background_started = True
+        self.cache_collector.start()
+        if self.config.scheduler_enabled:
+            self.scheduler.start()
+    
     def run(self, debug: bool = True, host: str = '127.0.0.1', port: str = '8050'):
         """Run the application"""
         self.app.run(debug=debug, host=host, port=port)
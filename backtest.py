@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Dividend capture backtest over the cached prices and dividends: buy at the close ENTRY_OFFSET trading days before
+each ex-dividend date, sell at the close EXIT_OFFSET trading days after it and collect the dividend. Tickers are
+split in shards run on a pool of spawned processes, and the trades are cached per hash of the parameters and of the versions
+of the cached data, so a repeated run is read from csv_files. From the repository root:
+
+    python backtest.py --entry 1 --exit 1 KO PEP T
+"""
+import argparse
+import configparser
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from dividend_analytics import long_format
+from get_dividends_historical_by_ticker import INITIAL_PART_HISTORICAL_DIVIDENDS_TICKER
+from get_dividends_historical_by_ticker import payment_dates
+from get_historical_data_by_ticker import INITIAL_PART_HISTORICAL_DATA_TICKER
+from misc.cache_index import cache_index
+from misc.utils import load_latest_response
+from misc.utils import save_response
+
+logger = logging.getLogger(__name__)
+
+config = configparser.ConfigParser()
+config.read('./conf/general.conf')
+INITIAL_PART_BACKTEST = config.get('FILE_NAMES', 'INITIAL_PART_BACKTEST', fallback='backtest_')
+ENTRY_OFFSET = config.getint('BACKTEST', 'ENTRY_OFFSET', fallback=1)
+EXIT_OFFSET = config.getint('BACKTEST', 'EXIT_OFFSET', fallback=1)
+COST_BPS = config.getfloat('BACKTEST', 'COST_BPS', fallback=0.0)
+# processes of the pool, 0 for one per CPU core
+WORKERS = config.getint('BACKTEST', 'WORKERS', fallback=0)
+SHARD_SIZE = config.getint('BACKTEST', 'SHARD_SIZE', fallback=50)
+
+TRADE_COLUMNS = ['ticker', 'ex_date', 'dividend', 'entry_date', 'entry_price', 'exit_date', 'exit_price',
+                 'price_return', 'dividend_return', 'total_return']
+
+
+def long_prices(frames):
+    """One frame of ticker, date and close rows sorted by ticker and date, from a {ticker: price frame} dict"""
+    frames = [pd.DataFrame({'ticker': ticker, 'date': payment_dates(df['date']),
+                            'close': pd.to_numeric(df['close'], errors='coerce')})
+              for ticker, df in frames.items() if df is not None and not df.empty]
+    if not frames:
+        return pd.DataFrame({'ticker': pd.Series(dtype=object), 'date': pd.Series(dtype='datetime64[ns]'),
+                             'close': pd.Series(dtype=float)})
+    df = pd.concat(frames, ignore_index=True).dropna(subset=['close'])
+    return df.sort_values(['ticker', 'date'], kind='stable').reset_index(drop=True)
+
+
+def capture_trades(prices, dividends, entry_offset=ENTRY_OFFSET, exit_offset=EXIT_OFFSET, cost_bps=COST_BPS):
+    """
+    One trade per ex-dividend date of long prices (ticker, date, close) and dividends (ticker, date, dividend)
+    frames, all tickers at once. Ex-dates whose entry or exit day is outside the price history are left out.
+    Returns are fractions, total_return is net of cost_bps paid on the entry and on the exit
+    """
+    if entry_offset < 1 or exit_offset < 0:
+        raise ValueError("The entry must be at least 1 trading day before the ex-date and the exit on or after it")
+    prices = long_prices(prices) if isinstance(prices, dict) else prices
+    dividends = long_format(dividends)
+    if prices.empty or dividends.empty:
+        return pd.DataFrame(columns=TRADE_COLUMNS)
+    tickers = pd.Categorical(prices['ticker'])
+    price_codes = tickers.codes.astype(np.int64)
+    dividend_codes = pd.Categorical(dividends['ticker'], categories=tickers.categories).codes.astype(np.int64)
+    price_days = prices['date'].to_numpy().astype('datetime64[D]').astype(np.int64)
+    dividend_days = dividends['date'].to_numpy().astype('datetime64[D]').astype(np.int64)
+    # one sorted key over every ticker, its code and then the day counted from the earliest one
+    origin = min(price_days.min(), dividend_days.min())
+    span = max(price_days.max(), dividend_days.max()) - origin + 1
+    ex = np.searchsorted(price_codes * span + price_days - origin, dividend_codes * span + dividend_days - origin,
+                         side='left')
+    entry, exit = ex - entry_offset, ex + exit_offset
+
+    last = len(prices) - 1
+    valid = (dividend_codes >= 0) & (entry >= 0) & (exit <= last)
+    # the ex-date, the entry and the exit must all fall in the history of the same ticker
+    for position in (ex, entry, exit):
+        valid &= price_codes[np.clip(position, 0, last)] == dividend_codes
+    entry, exit, ex_rows = entry[valid], exit[valid], dividends[valid]
+
+    close = prices['close'].to_numpy()
+    dates = prices['date'].to_numpy()
+    trades = pd.DataFrame({
+        'ticker': ex_rows['ticker'].to_numpy(),
+        'ex_date': ex_rows['date'].to_numpy(),
+        'dividend': ex_rows['dividend'].to_numpy(),
+        'entry_date': dates[entry],
+        'entry_price': close[entry],
+        'exit_date': dates[exit],
+        'exit_price': close[exit],
+    })
+    trades['price_return'] = trades['exit_price'] / trades['entry_price'] - 1
+    trades['dividend_return'] = trades['dividend'] / trades['entry_price']
+    trades['total_return'] = trades['price_return'] + trades['dividend_return'] - 2 * cost_bps / 10000
+    return trades[TRADE_COLUMNS]
+
+
+def load_shard(tickers, index=cache_index):
+    """Prices and dividends of tickers cached in index, nothing is requested for the ones not cached"""
+    prices, dividends = {}, {}
+    for ticker in tickers:
+        entry = load_latest_response(f'{INITIAL_PART_HISTORICAL_DATA_TICKER}{ticker}', index=index)
+        if entry is not None:
+            prices[ticker] = entry[0]
+        entry = load_latest_response(f'{INITIAL_PART_HISTORICAL_DIVIDENDS_TICKER}{ticker}', index=index)
+        if entry is not None:
+            dividends[ticker] = entry[0].assign(ticker=ticker)
+    return prices, dividends
+
+
+def backtest_shard(tickers, entry_offset, exit_offset, cost_bps, index=cache_index):
+    """Trades of a shard of tickers, run in a worker process"""
+    prices, dividends = load_shard(tickers, index)
+    return capture_trades(prices, dividends, entry_offset=entry_offset, exit_offset=exit_offset, cost_bps=cost_bps)
+
+
+def cached_tickers(index=cache_index):
+    """Tickers with both prices and dividends cached"""
+    prices = {key[len(INITIAL_PART_HISTORICAL_DATA_TICKER):] for key in
+              index.versions(INITIAL_PART_HISTORICAL_DATA_TICKER)}
+    dividends = {key[len(INITIAL_PART_HISTORICAL_DIVIDENDS_TICKER):] for key in
+                 index.versions(INITIAL_PART_HISTORICAL_DIVIDENDS_TICKER)}
+    return sorted(prices & dividends)
+
+
+def parameters_hash(tickers, entry_offset, exit_offset, cost_bps, index=cache_index):
+    """
+    Hash of the parameters of a run and of the versions of the cached entries it reads, a refreshed price or
+    dividend history gives a new hash
+    """
+    versions = {**index.versions(INITIAL_PART_HISTORICAL_DATA_TICKER),
+                **index.versions(INITIAL_PART_HISTORICAL_DIVIDENDS_TICKER)}
+    data = {ticker: [versions.get(f'{INITIAL_PART_HISTORICAL_DATA_TICKER}{ticker}'),
+                     versions.get(f'{INITIAL_PART_HISTORICAL_DIVIDENDS_TICKER}{ticker}')] for ticker in tickers}
+    parameters = {'entry_offset': entry_offset, 'exit_offset': exit_offset, 'cost_bps': cost_bps, 'data': data}
+    return hashlib.sha1(json.dumps(parameters, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def backtest(tickers=None, entry_offset=ENTRY_OFFSET, exit_offset=EXIT_OFFSET, cost_bps=COST_BPS, workers=WORKERS,
+             shard_size=SHARD_SIZE, index=cache_index):
+    """
+    Trades of every ex-date of tickers (every ticker cached when None). Shards of shard_size tickers run on a
+    pool of workers spawned processes (inline with 1) and read the entries of index, the result is cached per
+    parameters_hash
+    """
+    tickers = sorted(set(tickers)) if tickers is not None else cached_tickers(index)
+    file_name = f'{INITIAL_PART_BACKTEST}{parameters_hash(tickers, entry_offset, exit_offset, cost_bps, index)}'
+    cached = load_latest_response(file_name)
+    if cached is not None:
+        trades = cached[0]
+        for column in ('ex_date', 'entry_date', 'exit_date'):
+            trades[column] = payment_dates(trades[column])
+        return trades
+
+    shards = [tickers[i:i + shard_size] for i in range(0, len(tickers), shard_size)]
+    run = partial(backtest_shard, entry_offset=entry_offset, exit_offset=exit_offset, cost_bps=cost_bps,
+                  index=index)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(shards) <= 1:
+        results = [run(shard) for shard in shards]
+    else:
+        # spawned, a forked worker would share the index's sqlite connection with this process
+        with ProcessPoolExecutor(max_workers=min(workers, len(shards)),
+                                 mp_context=multiprocessing.get_context('spawn')) as pool:
+            results = list(pool.map(run, shards))
+    results = [df for df in results if not df.empty]
+    trades = pd.concat(results, ignore_index=True) if results else pd.DataFrame(columns=TRADE_COLUMNS)
+
+    final_part = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    save_response(trades, f'{file_name}_{final_part}', index=False)
+    return trades
+
+
+def summarize(trades):
+    """Per ticker: trades, mean and median total return, share of winning trades and mean price and dividend part"""
+    grouped = trades.groupby('ticker')
+    return pd.DataFrame({
+        'trades': grouped.size(),
+        'mean_return': grouped['total_return'].mean(),
+        'median_return': grouped['total_return'].median(),
+        'win_rate': (trades['total_return'] > 0).groupby(trades['ticker']).mean(),
+        'mean_price_return': grouped['price_return'].mean(),
+        'mean_dividend_return': grouped['dividend_return'].mean(),
+    })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest buying before the ex-dividend dates and selling after")
+    parser.add_argument('tickers', nargs='*', help="tickers to test, every cached one when none is given")
+    parser.add_argument('--entry', type=int, default=ENTRY_OFFSET, help="trading days before the ex-date to buy")
+    parser.add_argument('--exit', type=int, default=EXIT_OFFSET, help="trading days after the ex-date to sell")
+    parser.add_argument('--cost-bps', type=float, default=COST_BPS, help="cost of each buy and sell in bps")
+    parser.add_argument('--workers', type=int, default=WORKERS, help="processes, 0 for one per CPU core")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    trades = backtest(args.tickers or None, entry_offset=args.entry, exit_offset=args.exit, cost_bps=args.cost_bps,
+                      workers=args.workers)
+    with pd.option_context('display.max_rows', None, 'display.width', 160):
+        print(summarize(trades).sort_values('mean_return', ascending=False))
+
+
+if __name__ == '__main__':
+    main()
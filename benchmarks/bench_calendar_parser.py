@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the investing.com calendar parser.
+
+Parses calendars of growing size and prints the time per row, which stays flat when parsing scales linearly.
+Rows are generated, or replicated from a saved response given with --response (the JSON returned by
+InvestingClient.post_calendar).
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from misc.utils import parse_investing_calendar
+
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
+
+
+def generated_rows(rows):
+    """Calendar of rows rows over the five week days, shaped like investing.com's response"""
+    parts = []
+    per_day = max(1, rows // len(DAYS))
+    for n in range(rows):
+        if n % per_day == 0:
+            day = DAYS[(n // per_day) % len(DAYS)]
+            parts.append(f'<tr>\n<td colspan="7" class="theDay">{day}, October 23, 2023</td>\n</tr>')
+        parts.append(
+            f'<tr event_attr_ID="{n}">\n'
+            f'<td class="flag"><span title="United States" class="ceFlags USA middle"></span></td>\n'
+            f'<td class="left noWrap"><span class="earnCalCompanyName middle">Company {n}</span>'
+            f'&nbsp;(<a href="/equities/c{n}" class="bold">T{n}</a>)</td>\n'
+            f'<td>Oct 23, 2023</td>\n'
+            f'<td>0.{n % 10000:04d}</td>\n'
+            f'<td><span class="ceDivIcons quarterly" title="Quarterly"></span></td>\n'
+            f'<td>Nov 15, 2023</td>\n'
+            f'<td>{n % 7}.25%</td>\n'
+            f'</tr>')
+    return '\n'.join(parts)
+
+
+def replicated_rows(html, times):
+    return '\n'.join([html] * times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--response', help='saved JSON response of the calendar endpoint')
+    parser.add_argument('--sizes', default='1000,2000,4000,8000,16000,32000',
+                        help='rows (or copies of the saved response) to parse, comma separated')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per size, the best one is reported')
+    args = parser.parse_args()
+
+    saved = None
+    if args.response:
+        with open(args.response) as f:
+            saved = json.load(f)['data']
+
+    print(f"{'size':>8} {'rows':>8} {'seconds':>10} {'us/row':>8}")
+    for size in (int(size) for size in args.sizes.split(',')):
+        html = replicated_rows(saved, size) if saved is not None else generated_rows(size)
+        best = float('inf')
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            df, _, _ = parse_investing_calendar(html)
+            best = min(best, time.perf_counter() - started)
+        print(f"{size:>8} {len(df):>8} {best:>10.4f} {best / max(len(df), 1) * 1e6:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,43 @@
 from datetime import datetime
-from misc.utils import get_latest_file
-from misc.utils import save_response_to_csv
+from misc.utils import load_cached_response
+from misc.utils import save_response
+from misc.freshness import FRESHNESS
+from misc.revalidate import STALE_WHILE_REVALIDATE
+from misc.revalidate import serve_stale_and_revalidate
+from dividend_analytics import CAGR_YEARS
+from dividend_analytics import dividend_analytics
+from dividend_analytics import payout_status
 import pandas as pd
 import configparser
 
 config = configparser.ConfigParser()
 config.read('./conf/general.conf')
 INITIAL_PART_DIVIDENDS_SUMMARY = config.get('FILE_NAMES', 'INITIAL_PART_DIVIDENDS_SUMMARY')
+ANALYTICS_COLUMNS = ['TTM Div. (US$)', *[f'Div. CAGR {years}Y (%)' for years in CAGR_YEARS], 'Years of Increases',
+                     'Payout Status', 'Regularity (%)']
 
 
-def get_dividend_summary(data=None, time_delta=60):
+def current_summary(df):
+    """df unless it was saved before the analytics columns existed, those summaries are computed again"""
+    return df if df is not None and set(ANALYTICS_COLUMNS) <= set(df.columns) else None
+
+
+def analytics_summary(data):
+    """Analytics columns of the summary of one ticker's dividends"""
+    analytics = dividend_analytics(data)
+    row = analytics.iloc[0]
+
+    def percent(value, digits=2):
+        return round(value * 100, digits) if pd.notna(value) else None
+
+    status = payout_status(analytics).iloc[0]
+    values = [round(row['ttm_dividend'], 4), *[percent(row[f'cagr_{years}y']) for years in CAGR_YEARS],
+              int(row['increase_streak']), status, percent(row['regularity'], 0)]
+    return dict(zip(ANALYTICS_COLUMNS, values))
+
+
+def get_dividend_summary(data=None, freshness=FRESHNESS['dividends_summary'],
+                         stale_while_revalidate=STALE_WHILE_REVALIDATE):
     # Validate input data
     if data is None or len(data) == 0:
         return None
@@ -24,17 +52,17 @@ def get_dividend_summary(data=None, time_delta=60):
     
     ticker = data[0]['ticker']
     file_name = f'{INITIAL_PART_DIVIDENDS_SUMMARY}{ticker}'
-    latest_file = get_latest_file(file_name=file_name, days_delta=time_delta)
-
-    if latest_file:
-        try:
-           return pd.read_csv(latest_file, index_col=None)
-        except:
-            raise SystemExit(
-                f"\033[91m Can not open file {latest_file} or does not have proper format. \033[0m")
+    cached_df = current_summary(load_cached_response(file_name, freshness=freshness))
+    if cached_df is None and stale_while_revalidate:
+        cached_df = current_summary(serve_stale_and_revalidate(file_name, get_dividend_summary, data=data,
+                                                               freshness=freshness, stale_while_revalidate=False))
+
+    if cached_df is not None:
+        return cached_df
     else:
         final_part = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        file_name = f'{INITIAL_PART_DIVIDENDS_SUMMARY}{ticker}_{final_part}.csv'
+        file_name = f'{INITIAL_PART_DIVIDENDS_SUMMARY}{ticker}_{final_part}'
+        analytics = analytics_summary(data)
         df = pd.DataFrame(data)
         df["date"] = pd.to_datetime(df["date"])
         df.sort_values(by='date', ascending=True, inplace=True)
@@ -44,5 +72,6 @@ def get_dividend_summary(data=None, time_delta=60):
         data = [[df["date"].dt.year.iloc[0], df["dividend"].iloc[0],
                  "Quarterly" if df["mode"].iloc[0] == 4 else "Monthly" if df["mode"].iloc[0] == 12 else "Other"]]
         dg = pd.DataFrame(data, columns=['First Div. Paid (Year)', 'First Div. Paid (US$)', 'Div. Frequency'])
-        save_response_to_csv(dg, file_name)
+        dg = dg.assign(**analytics)
+        save_response(dg, file_name)
     return dg
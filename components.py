@@ -12,7 +12,8 @@ class DividendComponents:
     
     def get_column_definitions(self) -> List[Dict[str, Any]]:
         """Get column definitions for the dividends grid"""
-        return [
+        country = [{"field": "Country"}] if len(self.config.countries) > 1 else []
+        return country + [
             {"field": "Date"},
             {"field": "Company (Ticker)", "resizable": True},
             {
@@ -23,9 +24,125 @@ class DividendComponents:
             },
             {"field": "Dividend"},
             {"field": "Payment Date"},
-            {"field": "Yield"}
+            {"field": "Yield"},
+            {"field": "Fwd. Yield (%)", "filter": "agNumberColumnFilter", "type": "numericColumn"}
+        ]
+    
+    def get_screener_column_definitions(self) -> List[Dict[str, Any]]:
+        """Get column definitions for the screener grid"""
+        number = {"filter": "agNumberColumnFilter", "type": "numericColumn"}
+        return [
+            {"field": "ticker", "headerName": "Ticker"},
+            {"field": "company", "headerName": "Company", "resizable": True},
+            {"field": "close", "headerName": "Close (US$)", **number},
+            {"field": "forward_yield", "headerName": "Fwd. Yield (%)", **number},
+            {"field": "trailing_yield", "headerName": "TTM Yield (%)", **number},
+            {"field": "cagr_5y", "headerName": "Div. CAGR 5Y (%)", **number},
+            {"field": "increase_streak", "headerName": "Years of Increases", **number},
+            {"field": "frequency", "headerName": "Div. Frequency"},
+            {"field": "status", "headerName": "Payout Status"},
+            {"field": "calendar", "headerName": "Calendar"},
+            {"field": "payment_date", "headerName": "Payment Date"}
         ]
     
+    def create_screener(self) -> html.Div:
+        """Create the screener controls and its results grid"""
+        control_style = {
+            'width': '200px', 
+            'font-family': self.config.font_figure, 
+            "color": self.config.dark_gray, 
+            'margin-right': '10px'
+        }
+        return html.Div([
+            html.Div([
+                dcc.Input(id='screener-min-yield', type='number', min=0, step=0.5,
+                          placeholder='Min. Fwd. Yield (%)', style=control_style),
+                dcc.Input(id='screener-min-streak', type='number', min=0, step=1,
+                          placeholder='Min. Years of Increases', style=control_style),
+                dcc.Input(id='screener-min-cagr', type='number', step=1,
+                          placeholder='Min. Div. CAGR 5Y (%)', style=control_style),
+                dcc.Dropdown(
+                    id='screener-calendar',
+                    options=[
+                        {'label': 'Ex-Dividend Tomorrow', 'value': 'tomorrow'},
+                        {'label': 'Ex-Dividend This Week', 'value': 'thisWeek'},
+                        {'label': 'Ex-Dividend Next Week', 'value': 'nextWeek'}
+                    ],
+                    placeholder="Any ex-dividend date",
+                    style=control_style
+                ),
+                dcc.Dropdown(
+                    id='screener-sort',
+                    options=[
+                        {'label': 'Sort by Fwd. Yield', 'value': 'forward_yield'},
+                        {'label': 'Sort by TTM Yield', 'value': 'trailing_yield'},
+                        {'label': 'Sort by Div. CAGR 5Y', 'value': 'cagr_5y'},
+                        {'label': 'Sort by Years of Increases', 'value': 'increase_streak'}
+                    ],
+                    value='forward_yield',
+                    clearable=False,
+                    style=control_style
+                ),
+                dcc.Checklist(
+                    id='screener-options',
+                    options=[{'label': ' Exclude cuts and suspensions', 'value': 'exclude_cuts'}],
+                    value=['exclude_cuts'],
+                    style={'font-family': self.config.font_figure, "color": self.config.dark_gray}
+                )
+            ], style={'display': 'flex', 'align-items': 'center', 'padding': '10px'}),
+            dag.AgGrid(
+                id="screener_grid",
+                rowData=[],
+                className="ag-theme-alpine",
+                columnDefs=self.get_screener_column_definitions(),
+                defaultColDef={"filter": True, "sortable": True},
+                columnSize="sizeToFit"
+            ),
+            html.Footer(
+                "Screens the companies whose prices and dividends are cached", 
+                className="plotly-footnote",
+                style={
+                    'text-align': 'left', 
+                    'font-family': self.config.font_figure,
+                    'margin-top': '5px', 
+                    'fontSize': self.config.footer_size, 
+                    'color': self.config.light_gray
+                }
+            )
+        ])
+    
+    def create_income_projection(self) -> html.Div:
+        """Create the holdings input of the income projection and the place of its results"""
+        return html.Div([
+            html.Div([
+                dcc.Textarea(
+                    id='income-holdings',
+                    placeholder='Holdings as TICKER:SHARES, e.g. KO:100, PEP:50, O:200',
+                    style={
+                        'width': '600px',
+                        'height': '60px',
+                        'font-family': self.config.font_figure,
+                        "color": self.config.dark_gray,
+                        'margin-right': '10px'
+                    }
+                ),
+                html.Button('Project Income', id='income-project', n_clicks=0,
+                            style={'font-family': self.config.font_figure})
+            ], style={'display': 'flex', 'align-items': 'center', 'padding': '10px'}),
+            dcc.Loading(html.Div(id='income_projection', children=[])),
+            html.Footer(
+                "Monte Carlo simulation of the dividend growth and cuts of each holding's history",
+                className="plotly-footnote",
+                style={
+                    'text-align': 'left',
+                    'font-family': self.config.font_figure,
+                    'margin-top': '5px',
+                    'fontSize': self.config.footer_size,
+                    'color': self.config.light_gray
+                }
+            )
+        ])
+
     def create_header(self) -> html.Div:
         """Create the app header with dropdown"""
         return html.Div([
@@ -1,15 +1,18 @@
 # Nuevo archivo: config.py
 import configparser
-from dataclasses import dataclass
-from typing import Dict, Any, Optional
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional
 from datetime import date, timedelta
 
+from misc.freshness import FreshnessPolicy, load_policies
+
 @dataclass
 class AppConfig:
     """Configuration class for the Dividend Analysis App"""
     
     # Investing.com settings
     country: int = 5
+    countries: List[int] = field(default_factory=lambda: [5])
     filter_time: str = 'nextWeek'
     url: str = 'https://www.investing.com'
     endpoint: str = '/dividends-calendar/Service/getCalendarFilteredData'
@@ -17,6 +20,8 @@ class AppConfig:
     # Figure settings
     font_figure: str = 'Verdana'
     font_size_title: int = 20
+    # points of the stock price line sent to the browser, 0 sends every day
+    max_points: int = 500
     
     # Font sizes
     title_size: int = 15
@@ -32,6 +37,37 @@ class AppConfig:
     historical_data_days: float = 1.0
     dividends_days: int = 60
     
+    # How long each cached dataset is served, by dataset name
+    freshness: Dict[str, FreshnessPolicy] = field(default_factory=lambda: load_policies(configparser.ConfigParser()))
+    
+    # Background prefetch of the calendar tickers
+    prefetch_enabled: bool = False
+    prefetch_workers: int = 2
+    prefetch_requests_per_second: float = 1.0
+    prefetch_batch_size: int = 50
+    
+    # Refreshes run after midnight for the calendars and after the close for the tickers
+    scheduler_enabled: bool = False
+    scheduler_after_close_minutes: int = 30
+    scheduler_filters: List[str] = field(default_factory=lambda: ['nextWeek', 'thisWeek', 'tomorrow'])
+    
+    # Server-side store of the figures and tables computed per ticker
+    results_max_mb: int = 64
+    
+    # Serialized figures kept per ticker, dataset version and theme
+    figures_max_mb: int = 32
+    
+    # Garbage collection of csv_files
+    cache_max_size_mb: int = 0
+    cache_gc_interval_minutes: int = 60
+    
+    # Stale entries are served while a background refresh replaces them
+    stale_while_revalidate: bool = True
+    revalidate_poll_ms: int = 5000
+    
+    # Screener over every cached ticker
+    screener_max_rows: int = 500
+    
     # Date ranges
     start_date: str = ""
     end_date: str = ""
@@ -43,17 +79,19 @@ class AppConfig:
             config = configparser.ConfigParser()
             config.read(config_path)
             
-            # Calculate dates
-            end_date = date.today()
-            start_date = end_date - timedelta(days=1825)  # 5 years
+            countries = [int(country) for country in config.get('INVESTING', 'COUNTRY').split(',')]
+            
+            start_date, end_date = cls.price_window()
             
             return cls(
-                country=config.getint('INVESTING', 'COUNTRY'),
+                country=countries[0],
+                countries=countries,
                 filter_time=config.get('INVESTING', 'FILTER'),
                 url=config.get('INVESTING', 'URL'),
                 endpoint=config.get('INVESTING', 'ENDPOINT'),
                 font_figure=config.get('FIGURE', 'FONT_FIGURE'),
                 font_size_title=config.getint('FIGURE', 'FONT_SIZE_TITLE_FIGURE'),
+                max_points=config.getint('FIGURE', 'MAX_POINTS', fallback=500),
                 title_size=config.getint('FONT_SIZE', 'TITLE_SIZE'),
                 footer_size=config.getint('FONT_SIZE', 'FOOTER_SIZE'),
                 font_color=config.get('COLOR', 'FONT_COLOR'),
@@ -62,8 +100,23 @@ class AppConfig:
                 light_gray=config.get('COLOR', 'LIGHT_GRAY'),
                 historical_data_days=config.getfloat('TIME_DELTA_DAYS', 'HISTORICAL_DATA'),
                 dividends_days=config.getint('TIME_DELTA_DAYS', 'DIVIDENDS'),
-                start_date=start_date.strftime('%m/%d/%Y'),
-                end_date=end_date.strftime('%m/%d/%Y')
+                freshness=load_policies(config),
+                prefetch_enabled=config.getboolean('PREFETCH', 'ENABLED', fallback=False),
+                prefetch_workers=config.getint('PREFETCH', 'WORKERS', fallback=2),
+                prefetch_requests_per_second=config.getfloat('PREFETCH', 'REQUESTS_PER_SECOND', fallback=1.0),
+                prefetch_batch_size=config.getint('FETCH', 'BATCH_SIZE', fallback=50),
+                scheduler_enabled=config.getboolean('SCHEDULER', 'ENABLED', fallback=False),
+                scheduler_after_close_minutes=config.getint('SCHEDULER', 'AFTER_CLOSE_MINUTES', fallback=30),
+                scheduler_filters=config.get('SCHEDULER', 'FILTERS', fallback='nextWeek,thisWeek,tomorrow').split(','),
+                results_max_mb=config.getint('CACHE', 'RESULTS_MAX_MB', fallback=64),
+                figures_max_mb=config.getint('CACHE', 'FIGURES_MAX_MB', fallback=32),
+                cache_max_size_mb=config.getint('CACHE', 'MAX_SIZE_MB', fallback=0),
+                cache_gc_interval_minutes=config.getint('CACHE', 'GC_INTERVAL_MINUTES', fallback=60),
+                stale_while_revalidate=config.getboolean('CACHE', 'STALE_WHILE_REVALIDATE', fallback=True),
+                revalidate_poll_ms=config.getint('CACHE', 'REVALIDATE_POLL_MS', fallback=5000),
+                screener_max_rows=config.getint('SCREENER', 'MAX_ROWS', fallback=500),
+                start_date=start_date,
+                end_date=end_date
             )
         except FileNotFoundError:
             raise FileNotFoundError(f"Configuration file not found: {config_path}")
@@ -72,6 +125,20 @@ class AppConfig:
         except Exception as e:
             raise Exception(f"Unexpected error loading configuration: {e}")
     
+    @staticmethod
+    def price_window(today: Optional[date] = None) -> tuple:
+        """
+        Start and end dates of the stock prices as of today: 5 years back, and tomorrow since the end date is
+        exclusive. Long running processes ask for it at each fetch, start_date and end_date are those of startup
+        """
+        today = today or date.today()
+        return (today - timedelta(days=1825)).strftime('%m/%d/%Y'), (today + timedelta(days=1)).strftime('%m/%d/%Y')
+    
+    def theme(self) -> tuple:
+        """Settings the figures are drawn with, cached figures are kept per theme"""
+        return (self.font_figure, self.font_size_title, self.footer_size, self.main_color,
+                self.dark_gray, self.light_gray, self.max_points)
+    
     def get_style_config(self) -> Dict[str, Any]:
         """Get style configuration for Dash components"""
         return {
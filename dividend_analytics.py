@@ -0,0 +1,127 @@
+"""
+Dividend analytics of many tickers at once: trailing twelve month dividend, growth rates, streaks of increases,
+cuts, suspensions and payout regularity. Everything is computed with groupby and NumPy over one long frame of
+(ticker, date, dividend) rows, so a whole calendar is scored in a single pass
+"""
+from datetime import datetime
+import configparser
+
+import numpy as np
+import pandas as pd
+
+from get_dividends_historical_by_ticker import payment_dates
+
+config = configparser.ConfigParser()
+config.read('./conf/general.conf')
+CAGR_YEARS = [int(years) for years in config.get('ANALYTICS', 'CAGR_YEARS', fallback='1,3,5,10').split(',')]
+# a payment is a cut when it is this share below the median of the payments before it
+CUT_THRESHOLD = config.getfloat('ANALYTICS', 'CUT_THRESHOLD', fallback=0.1)
+CUT_LOOKBACK_PAYMENTS = config.getint('ANALYTICS', 'CUT_LOOKBACK_PAYMENTS', fallback=4)
+# a ticker is suspended when its last payment is older than this many usual gaps between payments
+SUSPENSION_GAPS = config.getfloat('ANALYTICS', 'SUSPENSION_GAPS', fallback=2.0)
+# gaps within this share of the usual gap count as regular
+REGULARITY_TOLERANCE = config.getfloat('ANALYTICS', 'REGULARITY_TOLERANCE', fallback=0.25)
+
+FREQUENCIES = {1: 'Annual', 2: 'Semi-Annual', 4: 'Quarterly', 12: 'Monthly'}
+COLUMNS = ['payments', 'first_payment', 'last_payment', 'last_dividend', 'ttm_dividend',
+           *[f'cagr_{years}y' for years in CAGR_YEARS], 'increase_streak', 'last_cut', 'cut', 'suspended',
+           'payments_per_year', 'frequency', 'regularity']
+
+
+def payout_status(table):
+    """'Suspended', 'Cut' or 'Paying' for each row of a dividend_analytics frame"""
+    return pd.Series(np.select([table['suspended'].astype(bool), table['cut'].astype(bool)], ['Suspended', 'Cut'],
+                               'Paying'), index=table.index)
+
+
+def long_format(data):
+    """
+    One frame of ticker, date and dividend rows sorted by ticker and date, from a frame, a list of records or the
+    {ticker: frame} dict of get_historical_dividends_batch
+    """
+    if isinstance(data, dict):
+        frames = [df for df in data.values() if df is not None and not df.empty]
+        data = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    df = pd.DataFrame(data)
+    if df.empty or not {'ticker', 'date', 'dividend'} <= set(df.columns):
+        return pd.DataFrame({'ticker': pd.Series(dtype=object), 'date': pd.Series(dtype='datetime64[ns]'),
+                             'dividend': pd.Series(dtype=float)})
+    df = df[['ticker', 'date', 'dividend']].copy()
+    df['date'] = payment_dates(df['date'])
+    df['dividend'] = pd.to_numeric(df['dividend'], errors='coerce')
+    df = df.dropna(subset=['dividend'])
+    return df.sort_values(['ticker', 'date'], kind='stable').reset_index(drop=True)
+
+
+def annual_dividends(df, last_year):
+    """
+    Ticker by year frame of the dividends paid each calendar year up to last_year. Years without payments after
+    the first one are 0, years before it are NaN
+    """
+    years = df['date'].dt.year
+    first_year = years.groupby(df['ticker']).min()
+    columns = np.arange(min(first_year.min(), last_year), last_year + 1)
+    annual = (df.groupby([df['ticker'], years])['dividend'].sum()
+              .unstack(fill_value=0.0)
+              .reindex(index=first_year.index, columns=columns, fill_value=0.0))
+    return annual.mask(columns[None, :] < first_year.to_numpy()[:, None])
+
+
+def dividend_analytics(data, as_of=None):
+    """
+    One row per ticker with its payments, last payment, trailing twelve month dividend, dividend CAGR over
+    CAGR_YEARS (from the last complete year), consecutive years of increases, last cut, cut and suspension flags,
+    and the payments per year with the share of gaps between payments that match it (regularity)
+    """
+    df = long_format(data)
+    as_of = pd.Timestamp(as_of or datetime.now())
+    df = df[df['date'] <= as_of]
+    tickers = df.groupby('ticker', sort=True)
+    result = pd.DataFrame({
+        'payments': tickers.size(),
+        'first_payment': tickers['date'].min(),
+        'last_payment': tickers['date'].max(),
+        'last_dividend': tickers['dividend'].last(),
+    })
+    result.index.name = 'ticker'
+    if df.empty:
+        return result.reindex(columns=COLUMNS)
+
+    ttm = df['date'] > as_of - pd.DateOffset(years=1)
+    result['ttm_dividend'] = df['dividend'].where(ttm, 0.0).groupby(df['ticker']).sum()
+
+    # growth is measured on complete calendar years, the current one is still being paid
+    annual = annual_dividends(df, as_of.year - 1)
+    values = annual.to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for years in CAGR_YEARS:
+            if years < values.shape[1]:
+                base, last = values[:, -1 - years], values[:, -1]
+                cagr = np.where(base > 0, (last / base) ** (1 / years) - 1, np.nan)
+            else:
+                cagr = np.full(len(values), np.nan)
+            result[f'cagr_{years}y'] = cagr
+    increased = values[:, 1:] > values[:, :-1]
+    # trailing run of increases: product of the reversed flags is 1 until the first year without one
+    result['increase_streak'] = np.cumprod(increased[:, ::-1], axis=1).sum(axis=1)
+
+    previous = df.groupby('ticker')['dividend'].shift()
+    usual = (previous.groupby(df['ticker']).rolling(CUT_LOOKBACK_PAYMENTS, min_periods=1).median()
+             .reset_index(level=0, drop=True))
+    below = df['dividend'] < usual * (1 - CUT_THRESHOLD)
+    # the median takes a few payments to reach a lower level, the cut is the first payment below it
+    cuts = below & ~below.groupby(df['ticker']).shift(fill_value=False)
+    result['last_cut'] = df['date'].where(cuts).groupby(df['ticker']).max()
+    result['cut'] = (result['last_cut'] > as_of - pd.DateOffset(years=1)).fillna(False)
+
+    gaps = tickers['date'].diff().dt.days
+    usual_gap = gaps.groupby(df['ticker']).median()
+    since_last = (as_of - result['last_payment']).dt.days
+    result['suspended'] = (since_last > SUSPENSION_GAPS * usual_gap).fillna(False)
+    payments_per_year = (365.25 / usual_gap).round()
+    result['payments_per_year'] = payments_per_year
+    result['frequency'] = payments_per_year.map(FREQUENCIES).fillna('Other')
+    expected = gaps.groupby(df['ticker']).transform('median')
+    regular = ((gaps - expected).abs() <= REGULARITY_TOLERANCE * expected).astype(float)
+    result['regularity'] = regular.where(gaps.notna()).groupby(df['ticker']).mean()
+    return result
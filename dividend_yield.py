@@ -0,0 +1,151 @@
+"""
+Daily trailing and forward dividend yields of a ticker, joined from its cached prices and dividends with as-of
+merges. The series is cached and the joins of a refresh only cover the days added to the prices since. The
+prices and dividends are still prepared in full and the whole series is saved again, so a refresh costs as much
+as reading the window and the payment history
+"""
+from datetime import datetime
+import configparser
+
+import numpy as np
+import pandas as pd
+
+from dividend_analytics import SUSPENSION_GAPS
+from get_dividends_historical_by_ticker import payment_dates
+from misc.freshness import FRESHNESS
+from misc.utils import load_cached_response
+from misc.utils import load_latest_response
+from misc.utils import memory_cache
+from misc.utils import save_response
+
+config = configparser.ConfigParser()
+config.read('./conf/general.conf')
+INITIAL_PART_YIELD_TICKER = config.get('FILE_NAMES', 'INITIAL_PART_YIELD_TICKER', fallback='dividend_yield_')
+# the payments per year of the forward dividend follow the median of the last gaps between payments
+FREQUENCY_LOOKBACK_PAYMENTS = 4
+
+COLUMNS = ['date', 'close', 'ttm_dividend', 'forward_dividend', 'trailing_yield', 'forward_yield', 'paid',
+           'payments']
+
+
+def prepare_prices(prices):
+    df = pd.DataFrame({'date': payment_dates(prices['date']).astype('datetime64[ns]'),
+                       'close': pd.to_numeric(prices['close'], errors='coerce')})
+    return df.dropna().sort_values('date', kind='stable').drop_duplicates('date', keep='last').reset_index(drop=True)
+
+
+def prepare_dividends(dividends):
+    """
+    Payments with the running totals the series is joined on: amount paid and payments made so far, and the
+    forward dividend implied by each payment
+    """
+    if dividends is None or dividends.empty:
+        return pd.DataFrame({'date': pd.Series(dtype='datetime64[ns]'), 'paid': pd.Series(dtype=float),
+                             'payments': pd.Series(dtype=float), 'forward_dividend': pd.Series(dtype=float),
+                             'expires': pd.Series(dtype='datetime64[ns]')})
+    df = pd.DataFrame({'date': payment_dates(dividends['date']).astype('datetime64[ns]'),
+                       'dividend': pd.to_numeric(dividends['dividend'], errors='coerce')})
+    df = df.dropna().sort_values('date', kind='stable').reset_index(drop=True)
+    df['paid'] = df['dividend'].cumsum()
+    df['payments'] = np.arange(1, len(df) + 1, dtype=float)
+    usual_gap = df['date'].diff().dt.days.rolling(FREQUENCY_LOOKBACK_PAYMENTS, min_periods=1).median()
+    df['forward_dividend'] = df['dividend'] * (365.25 / usual_gap).round()
+    # without a payment for SUSPENSION_GAPS usual gaps the dividend is taken as suspended
+    df['expires'] = df['date'] + pd.to_timedelta(SUSPENSION_GAPS * usual_gap, unit='D')
+    return df[['date', 'paid', 'payments', 'forward_dividend', 'expires']]
+
+
+def yield_series(prices, dividends):
+    """
+    Yields of each day of prices (date and close), from the dividends paid until that day. The trailing
+    dividend is what was paid in the last 365 days, the forward one the last payment times the payments per year
+    """
+    prices = prices.reset_index(drop=True)
+    known = pd.merge_asof(prices, dividends, on='date', direction='backward')
+    year_ago = pd.merge_asof(prices[['date']].assign(date=prices['date'] - pd.Timedelta(days=365)),
+                             dividends[['date', 'paid']], on='date', direction='backward')
+    df = prices.copy()
+    df['paid'] = known['paid'].fillna(0.0)
+    df['payments'] = known['payments'].fillna(0.0)
+    df['ttm_dividend'] = df['paid'] - year_ago['paid'].fillna(0.0).to_numpy()
+    df['forward_dividend'] = known['forward_dividend'].where(df['date'] <= known['expires'], 0.0).fillna(0.0)
+    df['trailing_yield'] = df['ttm_dividend'] / df['close'] * 100
+    df['forward_yield'] = df['forward_dividend'] / df['close'] * 100
+    return df[COLUMNS]
+
+
+def cached_series(file_name):
+    series = memory_cache.get(file_name)
+    if series is None:
+        entry = load_latest_response(file_name)
+        if entry is None:
+            return None
+        series, created = entry
+        memory_cache.set(file_name, series, created=created)
+    series = series.copy()
+    series['date'] = payment_dates(series['date']).astype('datetime64[ns]')
+    return series
+
+
+def is_current(series, dividends):
+    """Whether the dividends paid until the last day of series are still the ones it was computed with"""
+    if series is None or series.empty or not set(COLUMNS) <= set(series.columns):
+        return False
+    last = series.iloc[-1]
+    # a payment added or corrected before the last cached day changes the days already computed
+    paid = dividends[dividends['date'] <= last['date']]
+    total = paid['paid'].iloc[-1] if len(paid) else 0.0
+    return len(paid) == last['payments'] and np.isclose(total, last['paid'])
+
+
+def get_yield_series(ticker, prices, dividends):
+    """
+    Daily yields of ticker over the days of prices. The cached series is reused while the dividends it was
+    computed with are unchanged, only the days from its last one on are joined again, and the series is saved
+    whole when it changed
+    """
+    if prices is None or prices.empty:
+        return pd.DataFrame(columns=COLUMNS)
+    prices = prepare_prices(prices)
+    dividends = prepare_dividends(dividends)
+    file_name = f'{INITIAL_PART_YIELD_TICKER}{ticker}'
+    series = cached_series(file_name)
+    if is_current(series, dividends):
+        last = series.iloc[-1]
+        # the last cached day is joined again, its close may have been cached before the market closed
+        new_prices = prices[prices['date'] >= last['date']]
+        if len(new_prices) <= 1 and (new_prices.empty or np.isclose(new_prices['close'].iloc[0], last['close'])):
+            return series[series['date'] >= prices['date'].iloc[0]].reset_index(drop=True)
+        series = pd.concat([series.loc[series['date'] < last['date'], COLUMNS], yield_series(new_prices, dividends)],
+                           ignore_index=True)
+    else:
+        series = yield_series(prices, dividends)
+    # the price window rolls forward, the days before its start are dropped
+    series = series[series['date'] >= prices['date'].iloc[0]].reset_index(drop=True)
+    final_part = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    save_response(series, f'{file_name}_{final_part}', index=False)
+    return series
+
+
+def refresh_yields(prices, dividends):
+    """
+    Extend the cached yield series of the tickers of prices and dividends, {ticker: frame} dicts just fetched.
+    Run where the caches are warmed, so the pages only read the series
+    """
+    for ticker, df in prices.items():
+        dg = dividends.get(ticker)
+        if df is not None and not df.empty and dg is not None and not dg.empty:
+            get_yield_series(ticker, df, dg)
+
+
+def cached_forward_yields(tickers, freshness=FRESHNESS['historical_data']):
+    """
+    Latest forward yield (%) of each of tickers whose yield series is cached and fresh, nothing is computed or
+    requested for the others
+    """
+    yields = {}
+    for ticker in dict.fromkeys(tickers):
+        series = load_cached_response(f'{INITIAL_PART_YIELD_TICKER}{ticker}', freshness=freshness)
+        if series is not None and not series.empty:
+            yields[ticker] = round(float(series['forward_yield'].iloc[-1]), 2)
+    return yields
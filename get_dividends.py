@@ -1,26 +1,101 @@
 from datetime import datetime
-from misc.utils import tune_investing_response_and_save
-from misc.utils import get_latest_file
-from api_requests.dividends_by_date_investing import get_dividends_next_week_post
+from misc.fetcher import fetcher
+from misc.utils import append_to_spool
+from misc.utils import fill_lock
+from misc.utils import headers
+from misc.utils import load_cached_response
+from misc.utils import load_latest_response
+from misc.utils import parse_investing_calendar
+from misc.utils import save_spooled_response
+from misc.utils import spool_path
+from api_requests.dividends_by_date_investing import InvestingRequestError
+from api_requests.dividends_by_date_investing import MAX_PAGES
+from api_requests.dividends_by_date_investing import iter_dividends_pages_post
+from misc.freshness import FRESHNESS
+from misc.revalidate import STALE_WHILE_REVALIDATE
+from misc.revalidate import serve_stale_and_revalidate
+import logging
+import os
 import pandas as pd
 import configparser
 
+logger = logging.getLogger(__name__)
+
 config = configparser.ConfigParser()
 config.read('./conf/general.conf')
 INITIAL_PART_DIVIDENDS_BY_DATE = config.get('FILE_NAMES', 'INITIAL_PART_DIVIDENDS_BY_DATE')
+PAGING = config.getboolean('INVESTING', 'PAGING', fallback=True)
+
+COUNTRY_NAMES = {5: 'United States', 29: 'Argentina', 32: 'Brazil', 37: 'China'}
+
+
+def get_dividends_next_week(country=5, filter_time='nextWeek', freshness=FRESHNESS['dividends_by_date'],
+                            stale_while_revalidate=STALE_WHILE_REVALIDATE):
+    """Calendar of a country, or of a list of countries merged with a Country column"""
+    if isinstance(country, (list, tuple)):
+        return get_dividends_next_week_by_countries(country, filter_time=filter_time, freshness=freshness)
+    file_name = f'{INITIAL_PART_DIVIDENDS_BY_DATE}{country}_{filter_time}'
+    if stale_while_revalidate and load_cached_response(file_name, freshness=freshness) is None:
+        stale_df = serve_stale_and_revalidate(file_name, get_dividends_next_week, country=country,
+                                              filter_time=filter_time, freshness=freshness, stale_while_revalidate=False)
+        if stale_df is not None:
+            return stale_df
+    try:
+        # iter_dividends_next_week looks the entry up again once the lock is held, a worker that waited reads it
+        with fill_lock(file_name):
+            pages = list(iter_dividends_next_week(country=country, filter_time=filter_time, freshness=freshness))
+    except InvestingRequestError as e:
+        # failed responses are never cached, the last calendar fetched is better than none
+        logger.error(f"Calendar for country {country} could not be refreshed: {e}")
+        latest = load_latest_response(file_name)
+        return latest[0] if latest is not None else pd.DataFrame(columns=headers)
+    if not pages:
+        return pd.DataFrame(columns=headers)
+    return pd.concat(pages, ignore_index=True)
 
 
-def get_dividends_next_week(country=5, filter_time='nextWeek', days_delta=120):
+def iter_dividends_next_week(country=5, filter_time='nextWeek', freshness=FRESHNESS['dividends_by_date'],
+                             paging=PAGING):
+    """
+    Yield the calendar as frames so rows can be used as they arrive. A cached calendar is yielded whole,
+    otherwise each page is parsed and appended to a spool file as soon as it is received. The spool becomes the
+    cache entry once the last page is in, a calendar missing pages is never served
+    """
     file_name = f'{INITIAL_PART_DIVIDENDS_BY_DATE}{country}_{filter_time}'
-    latest_file = get_latest_file(file_name, days_delta=days_delta)
-    if latest_file:
-        try:
-            return pd.read_csv(latest_file)
-        except:
-            raise SystemExit(
-                f"\033[91m Can not open file {latest_file} or does not have proper format. \033[0m")
-    else:
-        final_part = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        file_name = f'{INITIAL_PART_DIVIDENDS_BY_DATE}{country}_{filter_time}_{final_part}.csv'
-        response_json = get_dividends_next_week_post(country=country, filter_time=filter_time)
-        return tune_investing_response_and_save(response_json, file_name)
+    cached_df = load_cached_response(file_name, freshness=freshness)
+    if cached_df is not None:
+        yield cached_df
+        return
+
+    final_part = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    spool = spool_path(f'{file_name}_{final_part}')
+    current_day = None
+    try:
+        for response_json in iter_dividends_pages_post(country=country, filter_time=filter_time,
+                                                       max_pages=MAX_PAGES if paging else 1):
+            page_df, _, current_day = parse_investing_calendar(response_json["data"], current_day=current_day)
+            if page_df.empty:
+                continue
+            append_to_spool(page_df, spool)
+            yield page_df
+        if os.path.exists(spool):
+            save_spooled_response(spool, f'{file_name}_{final_part}')
+    finally:
+        # the spool of a calendar missing its last pages is dropped, older complete calendars stay cached
+        if os.path.exists(spool):
+            os.remove(spool)
+
+
+def get_dividends_next_week_by_countries(countries=(5,), filter_time='nextWeek',
+                                         freshness=FRESHNESS['dividends_by_date']):
+    """Fetch the calendars of several countries concurrently, each one keeps its own cache entry"""
+    futures = [(country, fetcher.submit((INITIAL_PART_DIVIDENDS_BY_DATE, country, filter_time),
+                                        get_dividends_next_week, country=country, filter_time=filter_time,
+                                        freshness=freshness))
+               for country in dict.fromkeys(countries)]
+    frames = []
+    for country, future in futures:
+        df = future.result().copy()
+        df.insert(0, 'Country', COUNTRY_NAMES.get(country, str(country)))
+        frames.append(df)
+    return pd.concat(frames, ignore_index=True)
@@ -1,28 +1,133 @@
-from datetime import datetime
 from api_requests.historical_dividends_by_ticker_yahoo_fin import get_historical_dividends_get
-from misc.utils import get_latest_file
-from misc.utils import save_response_to_csv
+from api_requests.historical_dividends_by_ticker_yahoo_fin import get_historical_dividends_batch_get
+from misc.utils import fill_lock
+from misc.utils import fill_locks
+from misc.utils import invalidate_response
+from misc.utils import load_cached_response
+from misc.utils import load_latest_response
+from misc.utils import save_canonical_response
+from misc.utils import touch_response
+from misc.freshness import FRESHNESS
+from misc.revalidate import STALE_WHILE_REVALIDATE
+from misc.revalidate import serve_stale_and_revalidate
+import numpy as np
 import pandas as pd
 import configparser
 
 config = configparser.ConfigParser()
 config.read('./conf/general.conf')
 INITIAL_PART_HISTORICAL_DIVIDENDS_TICKER = config.get('FILE_NAMES', 'INITIAL_PART_HISTORICAL_DIVIDENDS_TICKER')
+INITIAL_PART_DIVIDENDS_SUMMARY = config.get('FILE_NAMES', 'INITIAL_PART_DIVIDENDS_SUMMARY')
+BATCH_SIZE = config.getint('FETCH', 'BATCH_SIZE', fallback=50)
 
 
-def get_historical_dividends(ticker='KO', time_delta=60):
+def get_historical_dividends(ticker='KO', freshness=FRESHNESS['historical_dividends'],
+                             stale_while_revalidate=STALE_WHILE_REVALIDATE):
     file_name = f'{INITIAL_PART_HISTORICAL_DIVIDENDS_TICKER}{ticker}'
-    latest_file = get_latest_file(file_name=file_name, days_delta=time_delta)
-
-    if latest_file:
-        try:
-            return pd.read_csv(latest_file)
-        except:
-            raise SystemExit(
-                f"\033[91m Can not open file {latest_file} or does not have proper format. \033[0m")
-    else:
-        final_part = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        file_name = f'{INITIAL_PART_HISTORICAL_DIVIDENDS_TICKER}{ticker}_{final_part}.csv'
+    cached_df = load_cached_response(file_name, freshness=freshness)
+    if cached_df is None and stale_while_revalidate:
+        cached_df = serve_stale_and_revalidate(file_name, get_historical_dividends, ticker=ticker, freshness=freshness,
+                                               stale_while_revalidate=False)
+
+    if cached_df is not None:
+        return cached_df
+    with fill_lock(file_name):
+        # another worker may have filled the entry while this one waited
+        cached_df = load_cached_response(file_name, freshness=freshness)
+        if cached_df is not None:
+            return cached_df
         response_df = get_historical_dividends_get(ticker)
-        save_response_to_csv(response_df, file_name)
+        return upsert_historical_dividends(ticker, response_df)
+
+
+def get_historical_dividends_batch(tickers=('KO',), freshness=FRESHNESS['historical_dividends'], batch_size=BATCH_SIZE):
+    """
+    Historical dividends of several tickers, the ones not cached are bulk downloaded and cached one by one. Each
+    batch holds the fill locks of its tickers, a ticker another worker is fetching is read once it is saved
+    """
+    frames = {}
+    misses = []
+    for ticker in dict.fromkeys(tickers):
+        cached_df = load_cached_response(f'{INITIAL_PART_HISTORICAL_DIVIDENDS_TICKER}{ticker}', freshness=freshness)
+        if cached_df is not None:
+            frames[ticker] = cached_df
+        else:
+            misses.append(ticker)
+
+    # sorted, a batch only waits for tickers after the ones it holds
+    misses.sort()
+    for i in range(0, len(misses), batch_size):
+        batch = misses[i:i + batch_size]
+        with fill_locks([f'{INITIAL_PART_HISTORICAL_DIVIDENDS_TICKER}{ticker}' for ticker in batch]):
+            missing = []
+            for ticker in batch:
+                # another worker may have filled the entry while this one waited
+                cached_df = load_cached_response(f'{INITIAL_PART_HISTORICAL_DIVIDENDS_TICKER}{ticker}',
+                                                 freshness=freshness)
+                if cached_df is not None:
+                    frames[ticker] = cached_df
+                else:
+                    missing.append(ticker)
+            if missing:
+                for ticker, response_df in get_historical_dividends_batch_get(missing).items():
+                    frames[ticker] = upsert_historical_dividends(ticker, response_df)
+    return frames
+
+
+def payment_dates(dates):
+    """Payment days as naive datetimes on the exchange's wall clock, whether read from yfinance or a csv file"""
+    if isinstance(dates.dtype, pd.DatetimeTZDtype):
+        return dates.dt.tz_localize(None)
+    if pd.api.types.is_datetime64_dtype(dates):
+        return dates
+    # csv files hold '2023-03-14 00:00:00-04:00', the offset is dropped to keep the local day
+    return pd.to_datetime(dates.astype(str).str[:19])
+
+
+def normalize_dividends(df):
+    df = df.copy()
+    df['date'] = payment_dates(df['date'])
+    return df
+
+
+def merge_dividends(cached_df, response_df):
+    """
+    Upsert the payments of response_df into cached_df: new payments are added and the amounts of the ones held
+    are overwritten, so corrected amounts replace the cached ones. Returns (series, new or changed rows)
+    """
+    cached_df = normalize_dividends(cached_df)
+    response_df = normalize_dividends(response_df)
+    cached_keys = pd.MultiIndex.from_arrays([cached_df['ticker'].astype(str), cached_df['date'].dt.normalize()])
+    response_keys = pd.MultiIndex.from_arrays([response_df['ticker'].astype(str), response_df['date'].dt.normalize()])
+    cached_amounts = pd.Series(pd.to_numeric(cached_df['dividend'], errors='coerce').to_numpy(), index=cached_keys)
+    cached_amounts = cached_amounts[~cached_amounts.index.duplicated(keep='last')].reindex(response_keys)
+    response_amounts = pd.to_numeric(response_df['dividend'], errors='coerce').to_numpy()
+    changed = int((~np.isclose(response_amounts, cached_amounts.to_numpy(dtype=float))).sum())
+    if not changed:
+        return cached_df, 0
+    merged = pd.concat([cached_df[~cached_keys.isin(response_keys)], response_df], ignore_index=True)
+    return merged.sort_values(by='date', kind='stable').reset_index(drop=True), changed
+
+
+def upsert_historical_dividends(ticker, response_df):
+    """
+    Merge a freshly downloaded series into the one kept for the ticker. The summary is only recomputed
+    when payments were added or corrected, otherwise both entries just start their TTL again
+    """
+    file_name = f'{INITIAL_PART_HISTORICAL_DIVIDENDS_TICKER}{ticker}'
+    summary_name = f'{INITIAL_PART_DIVIDENDS_SUMMARY}{ticker}'
+    latest = load_latest_response(file_name)
+
+    if latest is None:
+        response_df = normalize_dividends(response_df)
+        save_canonical_response(response_df, file_name)
         return response_df
+
+    merged, changed = merge_dividends(latest[0], response_df)
+    if changed:
+        save_canonical_response(merged, file_name)
+        invalidate_response(summary_name)
+    else:
+        touch_response(file_name)
+        touch_response(summary_name)
+    return merged
@@ -1,28 +1,167 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from api_requests.historical_data_by_ticker_yahoo_fin import get_historical_data_get
-from misc.utils import get_latest_file
-from misc.utils import save_response_to_csv
+from api_requests.historical_data_by_ticker_yahoo_fin import get_historical_data_batch_get
+from misc.utils import fill_lock
+from misc.utils import fill_locks
+from misc.utils import load_cached_response
+from misc.utils import load_latest_response
+from misc.utils import save_response
+from misc.freshness import FRESHNESS
+from misc.revalidate import STALE_WHILE_REVALIDATE
+from misc.revalidate import serve_stale_and_revalidate
+import logging
 import pandas as pd
 import configparser
 
+logger = logging.getLogger(__name__)
+
 config = configparser.ConfigParser()
 config.read('./conf/general.conf')
 INITIAL_PART_HISTORICAL_DATA_TICKER = config.get('FILE_NAMES', 'INITIAL_PART_HISTORICAL_DATA_TICKER')
+BATCH_SIZE = config.getint('FETCH', 'BATCH_SIZE', fallback=50)
+INCREMENTAL_REFRESH = config.getboolean('CACHE', 'INCREMENTAL_REFRESH', fallback=True)
 
 
-def get_historical_data(ticker='KO', start_date='', end_date='', days_delta=1):
+def get_historical_data(ticker='KO', start_date='', end_date='', freshness=FRESHNESS['historical_data'],
+                        incremental=INCREMENTAL_REFRESH,
+                        stale_while_revalidate=STALE_WHILE_REVALIDATE):
     file_name = f'{INITIAL_PART_HISTORICAL_DATA_TICKER}{ticker}'
-    latest_file = get_latest_file(file_name=file_name, days_delta=days_delta)
+    cached_df = load_cached_response(file_name, freshness=freshness)
+    if cached_df is None and stale_while_revalidate:
+        cached_df = serve_stale_and_revalidate(file_name, get_historical_data, ticker=ticker, start_date=start_date,
+                                               end_date=end_date, freshness=freshness, incremental=incremental,
+                                               stale_while_revalidate=False)
 
-    if latest_file:
-        try:
-            return pd.read_csv(latest_file)
-        except:
-            raise SystemExit(
-                f"\033[91m Can not open file {latest_file} or does not have proper format. \033[0m")
-    else:
+    if cached_df is not None:
+        return cached_df
+    with fill_lock(file_name):
+        # another worker may have filled the entry while this one waited
+        cached_df = load_cached_response(file_name, freshness=freshness)
+        if cached_df is not None:
+            return cached_df
+        latest = load_latest_response(file_name) if incremental else None
         final_part = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        file_name = f'{INITIAL_PART_HISTORICAL_DATA_TICKER}{ticker}_{final_part}.csv'
-        response_json = get_historical_data_get(ticker, start_date, end_date)
-        save_response_to_csv(response_json, file_name, index=False)
+        file_name = f'{INITIAL_PART_HISTORICAL_DATA_TICKER}{ticker}_{final_part}'
+        if latest is not None:
+            response_json = refresh_historical_data(latest[0], ticker, start_date, end_date)
+            if response_json is None:
+                return latest[0]
+        else:
+            response_json = get_historical_data_get(ticker, start_date, end_date)
+        save_response(response_json, file_name, index=False)
     return response_json
+
+
+def refresh_historical_data(cached_df, ticker='KO', start_date='', end_date=''):
+    """
+    Fetch only the days from the last cached date on, append them and roll the start of the window forward.
+    The last cached day is fetched again, a bar cached while the market was open is replaced by its final close.
+    Returns None when the missing days could not be fetched
+    """
+    cached_df = cached_df.copy()
+    cached_df['date'] = pd.to_datetime(cached_df['date'])
+    fetch_from = cached_df['date'].max().normalize()
+
+    if has_days_to_fetch(fetch_from, end_date):
+        try:
+            new_df = get_historical_data_get(ticker, fetch_from.strftime('%m/%d/%Y'), end_date)
+        except Exception as e:
+            logger.warning(f"Incremental refresh of {ticker} failed: {e}")
+            return None
+        cached_df = merge_prices(cached_df, new_df)
+    return window_prices(cached_df, start_date)
+
+
+def has_days_to_fetch(fetch_from, end_date=''):
+    """Whether a weekday falls between fetch_from and end_date, which is exclusive and today when empty"""
+    end = pd.to_datetime(end_date) if end_date else pd.Timestamp(datetime.now().date())
+    return len(pd.bdate_range(fetch_from, end - timedelta(days=1))) > 0
+
+
+def merge_prices(cached_df, new_df):
+    """Append the fetched days to the cached ones, a day fetched again replaces its cached bar"""
+    new_df = new_df.copy()
+    new_df['date'] = pd.to_datetime(new_df['date'])
+    return pd.concat([cached_df, new_df], ignore_index=True).drop_duplicates(subset='date', keep='last')
+
+
+def window_prices(df, start_date=''):
+    if start_date:
+        df = df[df['date'] >= pd.to_datetime(start_date)]
+    return df.sort_values(by='date').reset_index(drop=True)
+
+
+def refresh_historical_data_batch(cached, start_date='', end_date=''):
+    """
+    refresh_historical_data of a {ticker: frame} dict in one bulk download, from the earliest last cached date
+    of the frames on. Returns the refreshed frames, the tickers the download failed for or left out are not
+    """
+    cached = {ticker: df.assign(date=pd.to_datetime(df['date'])) for ticker, df in cached.items()}
+    fetch_from = min(df['date'].max().normalize() for df in cached.values())
+    if not has_days_to_fetch(fetch_from, end_date):
+        return {ticker: window_prices(df, start_date) for ticker, df in cached.items()}
+    try:
+        response = get_historical_data_batch_get(list(cached), fetch_from.strftime('%m/%d/%Y'), end_date)
+    except Exception as e:
+        logger.warning(f"Incremental refresh of {', '.join(cached)} failed: {e}")
+        return {}
+    return {ticker: window_prices(merge_prices(cached[ticker], response_df), start_date)
+            for ticker, response_df in response.items() if ticker in cached}
+
+
+def get_historical_data_batch(tickers=('KO',), start_date='', end_date='', freshness=FRESHNESS['historical_data'],
+                              batch_size=BATCH_SIZE, incremental=INCREMENTAL_REFRESH):
+    """
+    Historical data of several tickers, the ones not cached are bulk downloaded and cached one by one. With
+    incremental, expired entries are bulk refreshed from their last cached dates on rather than downloaded again.
+    Each batch holds the fill locks of its tickers, a ticker another worker is fetching is read once it is saved
+    """
+    frames = {}
+    misses = []
+    for ticker in dict.fromkeys(tickers):
+        cached_df = load_cached_response(f'{INITIAL_PART_HISTORICAL_DATA_TICKER}{ticker}', freshness=freshness)
+        if cached_df is not None:
+            frames[ticker] = cached_df
+        else:
+            misses.append(ticker)
+
+    # sorted, a batch only waits for tickers after the ones it holds
+    misses.sort()
+    for i in range(0, len(misses), batch_size):
+        batch = misses[i:i + batch_size]
+        with fill_locks([f'{INITIAL_PART_HISTORICAL_DATA_TICKER}{ticker}' for ticker in batch]):
+            fill_batch(batch, frames, start_date, end_date, freshness, incremental)
+    return frames
+
+
+def fill_batch(tickers, frames, start_date, end_date, freshness, incremental):
+    """Download into frames the prices of the tickers still missing once their fill locks are held"""
+    missing = []
+    expired = {}
+    for ticker in tickers:
+        file_name = f'{INITIAL_PART_HISTORICAL_DATA_TICKER}{ticker}'
+        # another worker may have filled the entry while this one waited
+        cached_df = load_cached_response(file_name, freshness=freshness)
+        if cached_df is not None:
+            frames[ticker] = cached_df
+            continue
+        latest = load_latest_response(file_name) if incremental else None
+        if latest is not None:
+            expired[ticker] = latest[0]
+        else:
+            missing.append(ticker)
+
+    if missing:
+        save_batch(get_historical_data_batch_get(missing, start_date, end_date), frames)
+    if expired:
+        response = refresh_historical_data_batch(expired, start_date, end_date)
+        save_batch(response, frames)
+        # a ticker the refresh failed for keeps its expired entry, it is tried again on the next run
+        frames.update({ticker: df for ticker, df in expired.items() if ticker not in response})
+
+
+def save_batch(response, frames):
+    final_part = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    for ticker, response_df in response.items():
+        save_response(response_df, f'{INITIAL_PART_HISTORICAL_DATA_TICKER}{ticker}_{final_part}', index=False)
+        frames[ticker] = response_df
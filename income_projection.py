@@ -0,0 +1,235 @@
+"""
+Monthly dividend income of a portfolio, projected with a Monte Carlo simulation. Each holding pays in the months
+of the year it paid its last payments, its dividend grows at each payment by a draw of the growth of its past
+complete years and is cut with the frequency of its past cuts. Paths are simulated with NumPy for shards of
+holdings at once, the shards run on a long-lived pool of spawned processes:
+
+    from income_projection import income_percentiles
+    income_percentiles({'KO': 100, 'PEP': 50}, percentiles=(5, 50, 95))
+"""
+import configparser
+import logging
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from dividend_analytics import CUT_THRESHOLD
+from dividend_analytics import annual_dividends
+from dividend_analytics import dividend_analytics
+from dividend_analytics import long_format
+from get_dividends_historical_by_ticker import INITIAL_PART_HISTORICAL_DIVIDENDS_TICKER
+from get_dividends_historical_by_ticker import get_historical_dividends_batch
+from misc.utils import load_latest_response
+
+logger = logging.getLogger(__name__)
+
+config = configparser.ConfigParser()
+config.read('./conf/general.conf')
+MONTHS = config.getint('PROJECTION', 'MONTHS', fallback=12)
+PATHS = config.getint('PROJECTION', 'PATHS', fallback=10000)
+PERCENTILES = [float(q) for q in config.get('PROJECTION', 'PERCENTILES', fallback='5,25,50,75,95').split(',')]
+# growth and cuts are drawn from this many complete years before the current one
+HISTORY_YEARS = config.getint('PROJECTION', 'HISTORY_YEARS', fallback=10)
+# share of the dividend lost on a cut, for the holdings that never cut it
+CUT_SIZE = config.getfloat('PROJECTION', 'CUT_SIZE', fallback=0.5)
+# yearly volatility of the dividend growth of holdings with less than two years of growth
+GROWTH_VOLATILITY = config.getfloat('PROJECTION', 'GROWTH_VOLATILITY', fallback=0.05)
+# processes of the pool, 0 for one per CPU core
+WORKERS = config.getint('PROJECTION', 'WORKERS', fallback=0)
+SHARD_SIZE = config.getint('PROJECTION', 'SHARD_SIZE', fallback=25)
+# bounds of a projection requested through the API
+MAX_HOLDINGS = config.getint('PROJECTION', 'MAX_HOLDINGS', fallback=100)
+MAX_PATHS = config.getint('PROJECTION', 'MAX_PATHS', fallback=PATHS)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+PARAMETER_COLUMNS = ['shares', 'last_dividend', 'payments_per_year', 'growth_mean', 'growth_volatility',
+                     'cut_probability', 'cut_size']
+
+
+def parse_holdings(text):
+    """{ticker: shares} of 'KO:100, PEP 50' like text, one holding per comma or line"""
+    holdings = {}
+    for item in re.split(r'[,;\n]+', text or ''):
+        if not item.strip():
+            continue
+        match = re.fullmatch(r'\s*([A-Za-z0-9.\-^=]+)\s*[:= ]\s*(\d+(?:\.\d*)?)\s*', item)
+        if match is None:
+            raise ValueError(f"Holdings are written as TICKER:SHARES, not '{item.strip()}'")
+        ticker = match.group(1).upper()
+        holdings[ticker] = holdings.get(ticker, 0.0) + float(match.group(2))
+    if not holdings:
+        raise ValueError("No holdings were entered")
+    return holdings
+
+
+def growth_statistics(df, as_of):
+    """
+    Ticker frame of the mean and volatility of the yearly log growth of the dividend, the probability of a cut
+    in a year and its mean size, over the HISTORY_YEARS complete years before as_of
+    """
+    annual = annual_dividends(df, as_of.year - 1)
+    values = annual.to_numpy(dtype=float)
+    # the first year is seldom paid in full, its growth would be overstated
+    paying = ~np.isnan(values)
+    values[np.arange(len(values)), paying.argmax(axis=1)] = np.nan
+    values = values[:, -HISTORY_YEARS - 1:]
+    previous, current = values[:, :-1], values[:, 1:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = current / previous
+        valid = (previous > 0) & ~np.isnan(current)
+        cut = valid & (ratio < 1 - CUT_THRESHOLD)
+        growth = pd.DataFrame(np.where(valid & ~cut, np.log(ratio), np.nan), index=annual.index)
+    cut_depth = pd.DataFrame(np.where(cut, 1 - ratio, np.nan), index=annual.index)
+    return pd.DataFrame({
+        'growth_mean': growth.mean(axis=1).fillna(0.0),
+        'growth_volatility': growth.std(axis=1).fillna(GROWTH_VOLATILITY),
+        # half a cut is added to the count, a short history without cuts never rules them out
+        'cut_probability': (cut.sum(axis=1) + 0.5) / (valid.sum(axis=1) + 1),
+        'cut_size': cut_depth.mean(axis=1).fillna(CUT_SIZE),
+    }, index=annual.index)
+
+
+def payment_months(df, payments_per_year):
+    """Ticker by month of the year (1 to 12) frame of the number of payments among the last payments_per_year"""
+    last = df.groupby('ticker').cumcount(ascending=False) < df['ticker'].map(payments_per_year).fillna(1)
+    recent = df[last]
+    counts = recent.groupby([recent['ticker'], recent['date'].dt.month]).size().unstack(fill_value=0)
+    return counts.reindex(index=payments_per_year.index, columns=range(1, 13), fill_value=0).fillna(0).astype(int)
+
+
+def holding_parameters(holdings, dividends, as_of=None):
+    """
+    One row per holding with the dividend history to be simulated: shares, last dividend, payments per year as
+    inferred by dividend_analytics, growth_statistics, and its payments in each month of the year (columns 1 to
+    12). Suspended holdings and those without payments are left out
+    """
+    df = long_format(dividends)
+    as_of = pd.Timestamp(as_of or datetime.now())
+    df = df[df['ticker'].isin(list(holdings)) & (df['date'] <= as_of)]
+    analytics = dividend_analytics(df, as_of=as_of)
+    analytics = analytics[~analytics['suspended'].astype(bool) & (analytics['last_dividend'] > 0)]
+    if analytics.empty:
+        return pd.DataFrame(columns=PARAMETER_COLUMNS + list(range(1, 13)))
+    df = df[df['ticker'].isin(analytics.index)]
+    payments_per_year = analytics['payments_per_year'].fillna(1).clip(lower=1)
+    parameters = pd.DataFrame({
+        'shares': pd.Series(holdings, dtype=float).reindex(analytics.index),
+        'last_dividend': analytics['last_dividend'].astype(float),
+        'payments_per_year': payments_per_year,
+    }).join(growth_statistics(df, as_of))
+    return parameters.join(payment_months(df, payments_per_year))
+
+
+def holding_dividends(tickers, max_requests=MAX_HOLDINGS):
+    """
+    {ticker: frame} of the dividends of tickers, the cached ones whatever their age. The ones never cached, at most
+    max_requests of them, are downloaded with get_historical_dividends_batch
+    """
+    frames, uncached = {}, []
+    for ticker in dict.fromkeys(tickers):
+        entry = load_latest_response(f'{INITIAL_PART_HISTORICAL_DIVIDENDS_TICKER}{ticker}')
+        if entry is None:
+            uncached.append(ticker)
+        else:
+            frames[ticker] = entry[0]
+    if uncached[:max_requests]:
+        frames.update(get_historical_dividends_batch(uncached[:max_requests]))
+    return {ticker: df.assign(ticker=ticker) for ticker, df in frames.items() if not df.empty}
+
+
+def shard_pool(workers):
+    """
+    Pool of workers processes kept for the life of the app, spawned rather than forked so they do not inherit
+    the locks of the app's threads
+    """
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _pools[workers] = pool
+        return pool
+
+
+def simulate_shard(shard, seed, paths):
+    """
+    Income of each path in each month of a shard of holdings, a dict of PARAMETER_COLUMNS arrays and the
+    (holdings, months) payments 'schedule'. Run in a worker process
+    """
+    rng = np.random.default_rng(seed)
+    schedule = shard['schedule']
+    # draws are only made for the months each holding pays in
+    holding, month = np.nonzero(schedule)
+    shape = (paths, len(holding))
+    per_payment = 1 / shard['payments_per_year'][holding]
+    drift = shard['growth_mean'][holding] * per_payment
+    volatility = shard['growth_volatility'][holding] * np.sqrt(per_payment)
+    cut_chance = 1 - (1 - shard['cut_probability'][holding]) ** per_payment
+    with np.errstate(divide='ignore'):
+        cut = np.log1p(-np.clip(shard['cut_size'][holding], 0, 1))
+    # the dividend changes at each payment: a cut, or a draw of its usual growth
+    draws = drift + volatility * rng.standard_normal(shape, dtype=np.float32)
+    growth = np.zeros((paths, *schedule.shape), dtype=np.float32)
+    growth[:, holding, month] = np.where(rng.random(shape, dtype=np.float32) < cut_chance, cut, draws)
+    dividends = np.exp(np.cumsum(growth, axis=2)) * (shard['shares'] * shard['last_dividend'])[:, None]
+    return (dividends * schedule).sum(axis=1)
+
+
+def project_income(holdings, months=MONTHS, paths=PATHS, workers=WORKERS, shard_size=SHARD_SIZE, seed=None,
+                   as_of=None, dividends=None):
+    """
+    Paths by month frame of the simulated income of holdings, a {ticker: shares} dict, over the months after
+    as_of. dividends is a {ticker: frame} dict, read with holding_dividends when None. Shards of shard_size
+    holdings run on the shard_pool of workers processes (inline with 1), a seed gives the same paths for any
+    number of workers. The holdings left out for want of current dividends are listed in attrs['missing']
+    """
+    as_of = pd.Timestamp(as_of or datetime.now())
+    if dividends is None:
+        dividends = holding_dividends(holdings)
+    parameters = holding_parameters(holdings, dividends, as_of=as_of)
+    missing = sorted(set(holdings) - set(parameters.index))
+    if missing:
+        logger.warning(f"No current dividends to project for {', '.join(missing)}")
+
+    labels = pd.period_range(as_of.to_period('M') + 1, periods=months, freq='M')
+    schedule = parameters[list(range(1, 13))].to_numpy(dtype=np.float32)[:, labels.month - 1]
+    arrays = {column: parameters[column].to_numpy(dtype=np.float32) for column in PARAMETER_COLUMNS}
+    shards = [{**{column: values[i:i + shard_size] for column, values in arrays.items()},
+               'schedule': schedule[i:i + shard_size]} for i in range(0, len(parameters), shard_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(shards))
+
+    run = partial(simulate_shard, paths=paths)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(shards) <= 1:
+        results = [run(shard, shard_seed) for shard, shard_seed in zip(shards, seeds)]
+    else:
+        results = list(shard_pool(workers).map(run, shards, seeds))
+    income = np.sum(results, axis=0, dtype=np.float64) if results else np.zeros((paths, months))
+    income = pd.DataFrame(income, columns=labels.strftime('%Y-%m'))
+    income.attrs['missing'] = missing
+    return income
+
+
+def income_percentiles(holdings, percentiles=PERCENTILES, **kwargs):
+    """
+    Percentiles (columns p5, p50...) and mean of the projected income of each month and of the income of all of
+    them ('Total' row), the percentiles of the total are taken over the paths. kwargs go to project_income, the
+    holdings it left out are listed in attrs['missing']
+    """
+    income = project_income(holdings, **kwargs)
+    missing = income.attrs['missing']
+    income['Total'] = income.sum(axis=1)
+    table = pd.DataFrame(np.percentile(income.to_numpy(), percentiles, axis=0).T, index=income.columns,
+                         columns=[f'p{q:g}' for q in percentiles])
+    table['mean'] = income.mean().to_numpy()
+    table.index.name = 'month'
+    table.attrs['missing'] = missing
+    return table
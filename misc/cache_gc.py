@@ -0,0 +1,124 @@
+"""
+Garbage collector of csv_files: keeps the newest valid entry of each key and evicts the least recently read keys
+while the directory is over its size cap. From the repository root:
+
+    python -m misc.cache_gc [--max-size-mb 512] [--dry-run]
+"""
+import argparse
+import configparser
+import logging
+import os
+import threading
+import time
+
+from misc.cache_index import cache_index
+from misc.storage import STORAGES
+from misc.utils import memory_cache
+
+logger = logging.getLogger(__name__)
+
+config = configparser.ConfigParser()
+config.read('./conf/general.conf')
+MAX_SIZE_MB = config.getint('CACHE', 'MAX_SIZE_MB', fallback=0)
+GC_INTERVAL_MINUTES = config.getint('CACHE', 'GC_INTERVAL_MINUTES', fallback=60)
+# temporary files of writes still in progress, and files just written but not indexed yet, are younger than this
+TMP_FILE_MAX_AGE_SECONDS = 3600
+
+
+def is_valid(path):
+    return os.path.isfile(path) and os.path.getsize(path) > 0
+
+
+def collect(index=cache_index, max_bytes=MAX_SIZE_MB * 1024 * 1024, dry_run=False):
+    """
+    Run one pass and return what it did. Superseded and invalid entries are removed first, then whole keys,
+    least recently read first, until the cache fits in max_bytes (no cap when 0). Cached files missing from the
+    index are orphans and removed: they were invalidated on purpose, indexing them again would serve them
+    """
+    report = {'files_removed': 0, 'keys_evicted': 0, 'bytes_reclaimed': 0, 'bytes_kept': 0}
+    entries = index.all_entries()
+    indexed = {os.path.basename(path) for _, path, _, _, _ in entries}
+
+    def remove(path):
+        exists = os.path.isfile(path)
+        size = os.path.getsize(path) if exists else 0
+        if not dry_run:
+            if exists:
+                os.remove(path)
+            index.remove(path)
+        report['files_removed'] += 1
+        report['bytes_reclaimed'] += size
+
+    for name in os.listdir(index.cache_dir):
+        path = os.path.join(index.cache_dir, name)
+        if not os.path.isfile(path) or time.time() - os.path.getmtime(path) <= TMP_FILE_MAX_AGE_SECONDS:
+            continue
+        # temporary files left behind by a worker killed in the middle of a write, and orphaned cached files
+        if name.endswith('.tmp') or (name.rsplit('.', 1)[-1] in STORAGES and name not in indexed):
+            remove(path)
+
+    kept = {}
+    for key, path, created, size, accessed in entries:
+        if key in kept or not is_valid(path):
+            remove(path)
+        else:
+            kept[key] = (path, os.path.getsize(path), accessed)
+
+    total = sum(size for _, size, _ in kept.values())
+    if max_bytes:
+        for key, (path, size, _) in sorted(kept.items(), key=lambda item: item[1][2]):
+            if total <= max_bytes:
+                break
+            remove(path)
+            if not dry_run:
+                memory_cache.invalidate(key)
+            report['keys_evicted'] += 1
+            total -= size
+    report['bytes_kept'] = total
+    return report
+
+
+class CacheCollector:
+    """Runs collect() every interval_minutes on a daemon thread"""
+
+    def __init__(self, max_bytes=MAX_SIZE_MB * 1024 * 1024, interval_minutes=GC_INTERVAL_MINUTES, index=cache_index):
+        self.max_bytes = max_bytes
+        self.interval = interval_minutes * 60
+        self.index = index
+        self.last_report = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self.last_report = collect(self.index, max_bytes=self.max_bytes)
+                logger.info(f"Cache garbage collection reclaimed {self.last_report['bytes_reclaimed']} bytes")
+            except Exception as e:
+                logger.error(f"Cache garbage collection failed: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self.interval > 0 and (self._thread is None or not self._thread.is_alive()):
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, name='cache-gc', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Remove superseded cached files and enforce the cache size cap")
+    parser.add_argument('--max-size-mb', type=int, default=MAX_SIZE_MB, help="size cap, 0 for none")
+    parser.add_argument('--dry-run', action='store_true', help="report what would be removed without removing it")
+    args = parser.parse_args(argv)
+
+    report = collect(max_bytes=args.max_size_mb * 1024 * 1024, dry_run=args.dry_run)
+    action = 'Would reclaim' if args.dry_run else 'Reclaimed'
+    print(f"{action} {report['bytes_reclaimed'] / 1024 / 1024:.1f} MB from {report['files_removed']} files "
+          f"({report['keys_evicted']} keys evicted), {report['bytes_kept'] / 1024 / 1024:.1f} MB kept")
+
+
+if __name__ == '__main__':
+    main()
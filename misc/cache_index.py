@@ -0,0 +1,226 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+CACHE_DIR = './csv_files'
+INDEX_FILE = '.cache_index.sqlite3'
+# reads are written to the index in one batch at most this often, so cache hits do not commit on every lookup
+ACCESS_RESOLUTION_SECONDS = 60
+
+# <key>_<YYYY-mm-dd_HH-MM-SS>.<ext>, the naming used by every getter when saving a response
+TIMESTAMPED_FILE = re.compile(r'^(?P<key>.+)_\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}\.\w+$')
+
+
+def key_from_filename(filename):
+    """Return the cache key of a file saved as <key>_<timestamp>.<ext>"""
+    match = TIMESTAMPED_FILE.match(os.path.basename(filename))
+    if match:
+        return match.group('key')
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+class CacheIndex:
+    """On-disk index of the files cached in csv_files, keyed by dataset/ticker/params"""
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, INDEX_FILE)
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        # {key: time} of the reads not written yet
+        self._accessed = {}
+        self._accessed_flushed = 0.0
+        # {key: version} read while the index file was unchanged, see version()
+        self._versions = {}
+        self._versions_stamp = None
+
+    def __getstate__(self):
+        # a worker process opens its own connection, a sqlite connection must not cross processes
+        return {'cache_dir': self.cache_dir}
+
+    def __setstate__(self, state):
+        self.__init__(state['cache_dir'])
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            with self._lock:
+                first_run = not os.path.exists(self.index_path)
+                connection = sqlite3.connect(self.index_path, timeout=30)
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS entries ("
+                    "key TEXT NOT NULL, "
+                    "filename TEXT PRIMARY KEY, "
+                    "created REAL NOT NULL, "
+                    "size INTEGER NOT NULL DEFAULT 0, "
+                    "accessed REAL, "
+                    "checksum TEXT)")
+                # indexes created before reads and checksums were tracked
+                columns = [row[1] for row in connection.execute("PRAGMA table_info(entries)")]
+                for column, column_type in (('accessed', 'REAL'), ('checksum', 'TEXT')):
+                    if column not in columns:
+                        connection.execute(f"ALTER TABLE entries ADD COLUMN {column} {column_type}")
+                connection.execute("CREATE INDEX IF NOT EXISTS entries_key_created ON entries (key, created)")
+                connection.commit()
+                self._local.connection = connection
+                if first_run:
+                    self.migrate()
+        return connection
+
+    def _path(self, filename):
+        return f'{self.cache_dir}/{filename}'
+
+    def _stamp(self):
+        try:
+            stat = os.stat(self.index_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _written(self):
+        # the file's mtime may not tick between two writes, the versions are dropped as well
+        with self._lock:
+            self._versions_stamp = None
+
+    def register(self, key, path, created=None, checksum=None):
+        """Add (or replace) the entry for a file that has just been written to the cache"""
+        filename = os.path.basename(path)
+        if created is None:
+            created = os.path.getctime(path)
+        connection = self._connect()
+        connection.execute(
+            "INSERT OR REPLACE INTO entries (key, filename, created, size, accessed, checksum) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, filename, created, os.path.getsize(path), time.time(), checksum))
+        connection.commit()
+        self._written()
+
+    def checksum(self, path):
+        """Checksum recorded when path was written, None for files cached before checksums were kept"""
+        row = self._connect().execute("SELECT checksum FROM entries WHERE filename = ?",
+                                      (os.path.basename(path),)).fetchone()
+        return row[0] if row else None
+
+    def remove(self, path):
+        connection = self._connect()
+        connection.execute("DELETE FROM entries WHERE filename = ?", (os.path.basename(path),))
+        connection.commit()
+        self._written()
+
+    def touch(self, key, created=None):
+        """Mark the freshest entry for key as just checked, so its TTL starts again"""
+        connection = self._connect()
+        connection.execute(
+            "UPDATE entries SET created = ? WHERE filename = "
+            "(SELECT filename FROM entries WHERE key = ? ORDER BY created DESC LIMIT 1)",
+            (created or datetime.now().timestamp(), key))
+        connection.commit()
+        self._written()
+
+    def mark_accessed(self, key):
+        """
+        Record a read of key, the garbage collector evicts the least recently read keys first. Reads are kept in
+        memory and written together every ACCESS_RESOLUTION_SECONDS
+        """
+        now = time.time()
+        with self._lock:
+            self._accessed[key] = now
+            if now - self._accessed_flushed < ACCESS_RESOLUTION_SECONDS:
+                return
+        self.flush_accessed()
+
+    def flush_accessed(self):
+        """Write the reads recorded by mark_accessed in one transaction"""
+        with self._lock:
+            accessed, self._accessed = self._accessed, {}
+            self._accessed_flushed = time.time()
+        if not accessed:
+            return
+        connection = self._connect()
+        connection.executemany("UPDATE entries SET accessed = ? WHERE key = ?",
+                               [(when, key) for key, when in accessed.items()])
+        connection.commit()
+
+    def all_entries(self):
+        """(key, path, created, size, accessed) of every entry, freshest entry of each key first"""
+        self.flush_accessed()
+        rows = self._connect().execute(
+            "SELECT key, filename, created, size, COALESCE(accessed, created) FROM entries "
+            "ORDER BY key, created DESC")
+        return [(key, self._path(filename), created, size, accessed)
+                for key, filename, created, size, accessed in rows]
+
+    def version(self, key):
+        """
+        Identifies the content of the freshest entry for key, it changes whenever the entry is written again.
+        Versions are kept in memory until the index file changes, whichever process wrote it
+        """
+        stamp = self._stamp()
+        with self._lock:
+            if stamp is None or stamp != self._versions_stamp:
+                self._versions = {}
+                self._versions_stamp = stamp
+            elif key in self._versions:
+                return self._versions[key]
+        row = self._connect().execute(
+            "SELECT filename, checksum, size FROM entries WHERE key = ? ORDER BY created DESC LIMIT 1",
+            (key,)).fetchone()
+        version = None if row is None else f'{row[0]}:{row[1] or row[2]}'
+        with self._lock:
+            if stamp is not None and stamp == self._versions_stamp:
+                self._versions[key] = version
+        return version
+
+    def versions(self, prefix=''):
+        """{key: version} of every key starting with prefix, in one query"""
+        # sqlite returns the columns of the row holding MAX(created) for each key
+        rows = self._connect().execute(
+            "SELECT key, filename, checksum, size, MAX(created) FROM entries WHERE substr(key, 1, ?) = ? "
+            "GROUP BY key", (len(prefix), prefix))
+        return {key: f'{filename}:{checksum or size}' for key, filename, checksum, size, _ in rows}
+
+    def entries(self, key):
+        """Paths of every entry for key, freshest first"""
+        rows = self._connect().execute("SELECT filename FROM entries WHERE key = ? ORDER BY created DESC", (key,))
+        return [self._path(row[0]) for row in rows]
+
+    def remove_key(self, key):
+        connection = self._connect()
+        connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+        connection.commit()
+        self._written()
+
+    def latest(self, key):
+        """Return (path, created datetime) of the freshest entry for key, or None"""
+        connection = self._connect()
+        while True:
+            row = connection.execute(
+                "SELECT filename, created FROM entries WHERE key = ? ORDER BY created DESC LIMIT 1",
+                (key,)).fetchone()
+            if row is None:
+                return None
+            path = self._path(row[0])
+            if os.path.exists(path):
+                return path, datetime.fromtimestamp(row[1])
+            # the file was deleted by hand, forget it and look at the next one
+            self.remove(path)
+
+    def migrate(self):
+        """Register the timestamped files that were cached before the index existed"""
+        connection = self._connect()
+        rows = []
+        for filename in os.listdir(self.cache_dir):
+            if TIMESTAMPED_FILE.match(filename):
+                path = self._path(filename)
+                rows.append((key_from_filename(filename), filename, os.path.getctime(path), os.path.getsize(path)))
+        connection.executemany("INSERT OR IGNORE INTO entries (key, filename, created, size) VALUES (?, ?, ?, ?)",
+                               rows)
+        connection.commit()
+        self._written()
+        return len(rows)
+
+
+cache_index = CacheIndex()
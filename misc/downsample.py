@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+
+def lttb(x, y, threshold):
+    """
+    Indices of the points kept by largest-triangle-three-buckets. The first and last points are always kept,
+    every bucket in between keeps the point forming the largest triangle with its neighbours, which preserves
+    peaks and troughs that plain decimation drops
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # threshold - 2 buckets over the points between the first and the last one
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    kept = np.empty(threshold, dtype=int)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        kept[i + 1] = a
+    return kept
+
+
+def downsample_prices(df, max_points, window=None, x='date', y='close'):
+    """
+    Rows of a price history reduced to max_points with LTTB (all of them when max_points is 0). With a
+    (start, end) window only the rows in it are kept, plus one on each side so lines reach the plot edges
+    """
+    df = df.dropna(subset=[y])
+    dates = pd.to_datetime(df[x])
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_localize(None)
+    if not dates.is_monotonic_increasing:
+        order = np.argsort(dates.to_numpy(), kind='stable')
+        df, dates = df.iloc[order], dates.iloc[order]
+    if window is not None:
+        values = dates.to_numpy()
+        first = max(np.searchsorted(values, np.datetime64(pd.Timestamp(window[0])), side='left') - 1, 0)
+        last = np.searchsorted(values, np.datetime64(pd.Timestamp(window[1])), side='right') + 1
+        df, dates = df.iloc[first:last], dates.iloc[first:last]
+    if not max_points or len(df) <= max_points:
+        return df
+    return df.iloc[lttb(dates.to_numpy().astype('int64'), df[y].to_numpy(), max_points)]
@@ -0,0 +1,38 @@
+import configparser
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+config = configparser.ConfigParser()
+config.read('./conf/general.conf')
+FETCH_WORKERS = config.getint('FETCH', 'WORKERS', fallback=8)
+
+
+class FetchOrchestrator:
+    """Runs fetches on a shared thread pool, callers asking for a key already in flight share its future"""
+
+    def __init__(self, max_workers=FETCH_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fetch')
+        self._in_flight = {}
+        # reentrant, a future that is already done runs its callback inside submit
+        self._lock = threading.RLock()
+
+    def submit(self, key, fn, *args, **kwargs):
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is None or future.done():
+                future = self._executor.submit(fn, *args, **kwargs)
+                self._in_flight[key] = future
+                future.add_done_callback(lambda _: self._forget(key, future))
+            return future
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def in_flight(self):
+        with self._lock:
+            return [key for key, future in self._in_flight.items() if not future.done()]
+
+
+fetcher = FetchOrchestrator()
@@ -0,0 +1,28 @@
+import json
+
+from misc.memory_cache import MemoryCache
+
+
+class FigureCache:
+    """
+    Plotly figures serialized once and kept as plain dicts by (figure, ticker, dataset version, theme), a hit
+    returns the kept dict as is. A new version of the cached dataset or a new theme is a new key, so entries never
+    need to be invalidated
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self._cache = MemoryCache(max_bytes=max_bytes)
+
+    def get_or_build(self, key, build):
+        """Figure of key as a plain dict, build() is only called when key was not serialized yet"""
+        figure = self._cache.get(key)
+        if figure is None:
+            serialized = build().to_json()
+            figure = json.loads(serialized)
+            # without a dataset version the figure can not be told apart from the next one
+            if None not in key:
+                self._cache.set(key, figure, size=len(serialized))
+        return figure
+
+    def stats(self):
+        return self._cache.stats()
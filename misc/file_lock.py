@@ -0,0 +1,74 @@
+import logging
+import os
+import time
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+logger = logging.getLogger(__name__)
+
+
+class FileLock:
+    """
+    Exclusive lock shared by the threads and processes using the same lock file, e.g. the gunicorn workers of the
+    app. Waits up to timeout seconds, then goes on unlocked rather than blocking a request forever
+    """
+
+    def __init__(self, path, timeout=120.0, poll=0.05):
+        self.path = path
+        self.timeout = timeout
+        self.poll = poll
+        self.locked = False
+        self._file = None
+
+    def _try_lock(self):
+        try:
+            if os.name == 'nt':
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    def acquire(self, blocking=True):
+        """Take the lock, waiting up to timeout seconds or trying once when not blocking, returns whether it was"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._file = open(self.path, 'a+b')
+        if not blocking:
+            self.locked = self._try_lock()
+            if not self.locked:
+                self._file.close()
+                self._file = None
+            return self.locked
+        deadline = time.monotonic() + self.timeout
+        while not self._try_lock():
+            if time.monotonic() >= deadline:
+                logger.warning(f"Gave up waiting for {self.path} after {self.timeout:.0f}s, going on unlocked")
+                return False
+            time.sleep(self.poll)
+        self.locked = True
+        return True
+
+    def release(self):
+        if self._file is None:
+            return
+        if self.locked:
+            if os.name == 'nt':
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self.locked = False
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
@@ -0,0 +1,89 @@
+import configparser
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta
+
+from misc.market_calendar import get_market_calendar
+
+UNITS = {'s': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days', 'w': 'weeks'}
+MARKET_CLOSE = 'market_close'
+END_OF_DAY = 'end_of_day'
+
+# dataset: (option of the FRESHNESS section, option of TIME_DELTA_DAYS used when it is missing, default)
+DATASETS = {
+    'historical_data': ('HISTORICAL_DATA', 'HISTORICAL_DATA', '1d'),
+    'historical_dividends': ('DIVIDENDS', 'DIVIDENDS', '60d'),
+    'dividends_summary': ('DIVIDENDS_SUMMARY', 'DIVIDENDS', '60d'),
+    'dividends_by_date': ('DIVIDENDS_BY_DATE', 'DIVIDENDS_BY_DATE', END_OF_DAY),
+}
+
+
+def parse_duration(value):
+    """'90m', '12h', '60d' or '2w' as a timedelta, a bare number is read as days"""
+    text = str(value).strip().lower()
+    unit = UNITS.get(text[-1:])
+    try:
+        return timedelta(**{unit or 'days': float(text[:-1] if unit else text)})
+    except ValueError:
+        raise ValueError(f"Invalid duration {value!r}, expected a number followed by one of {', '.join(UNITS)}")
+
+
+@dataclass(frozen=True)
+class FreshnessPolicy:
+    """How long a cached dataset is served before it is fetched again"""
+
+    max_age: timedelta = timedelta(days=1)
+    # expire at the first close of the country's exchange after the entry was saved instead of after max_age,
+    # so nothing expires over weekends and holidays
+    market_close: bool = False
+    country: int = 5
+    # expire at the first local midnight after the entry was saved, for data that depends on the current day
+    end_of_day: bool = False
+
+    @classmethod
+    def parse(cls, value, country=5):
+        """Policy of a setting, either a duration, market_close or end_of_day"""
+        text = str(value).strip().lower()
+        if text == MARKET_CLOSE:
+            return cls(market_close=True, country=country)
+        if text == END_OF_DAY:
+            return cls(end_of_day=True)
+        return cls(max_age=parse_duration(value))
+
+    def expires_at(self, created):
+        """Naive local datetime at which an entry saved at created stops being fresh"""
+        if self.market_close:
+            return get_market_calendar(self.country).next_close(created)
+        if self.end_of_day:
+            return datetime.combine(created.date() + timedelta(days=1), time())
+        return created + self.max_age
+
+    def is_fresh(self, created, now=None):
+        return (now or datetime.now()) < self.expires_at(created)
+
+
+# a policy no entry satisfies, used to force a refresh
+EXPIRED = FreshnessPolicy(max_age=timedelta(0))
+
+
+def as_policy(value):
+    """Accept a policy, a duration string or a number of days"""
+    if isinstance(value, FreshnessPolicy):
+        return value
+    return FreshnessPolicy.parse(value)
+
+
+def load_policies(config):
+    """Freshness policy of every dataset, read from FRESHNESS and falling back to the days of TIME_DELTA_DAYS"""
+    country = int(config.get('INVESTING', 'COUNTRY', fallback='5').split(',')[0])
+    policies = {}
+    for dataset, (option, days_option, default) in DATASETS.items():
+        value = config.get('FRESHNESS', option, fallback=None)
+        if value is None:
+            value = config.get('TIME_DELTA_DAYS', days_option, fallback=default)
+        policies[dataset] = FreshnessPolicy.parse(value, country=country)
+    return policies
+
+
+config = configparser.ConfigParser()
+config.read('./conf/general.conf')
+FRESHNESS = load_policies(config)
@@ -0,0 +1,96 @@
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+
+def nth_weekday(year, month, weekday, n):
+    """n-th weekday (0 is Monday) of a month, a negative n counts from the end of the month"""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = (date(year, month + 1, 1) if month < 12 else date(year + 1, 1, 1)) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7 + 7 * (-n - 1))
+
+
+def easter(year):
+    """Gregorian Easter Sunday (anonymous algorithm)"""
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def observed(day):
+    """Fixed date holidays falling on a weekend are observed on the closest weekday"""
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+def nyse_holidays(year):
+    holidays = {
+        nth_weekday(year, 1, 0, 3),  # Martin Luther King Jr. Day
+        nth_weekday(year, 2, 0, 3),  # Washington's Birthday
+        easter(year) - timedelta(days=2),  # Good Friday
+        nth_weekday(year, 5, 0, -1),  # Memorial Day
+        observed(date(year, 7, 4)),
+        nth_weekday(year, 9, 0, 1),  # Labor Day
+        nth_weekday(year, 11, 3, 4),  # Thanksgiving
+        observed(date(year, 12, 25)),
+    }
+    # New Year's Day on a Saturday is not moved back into the previous year
+    if date(year, 1, 1).weekday() != 5:
+        holidays.add(observed(date(year, 1, 1)))
+    if year >= 2022:
+        holidays.add(observed(date(year, 6, 19)))  # Juneteenth
+    return holidays
+
+
+class MarketCalendar:
+    """Trading days and closing time of an exchange, holidays are given by a function of the year"""
+
+    def __init__(self, name, timezone, close_time, holidays=None):
+        self.name = name
+        self.tz = ZoneInfo(timezone)
+        self.close_time = close_time
+        self._holidays = lru_cache(maxsize=None)(holidays or (lambda year: set()))
+
+    def is_trading_day(self, day):
+        return day.weekday() < 5 and day not in self._holidays(day.year)
+
+    def next_trading_day(self, day):
+        """First trading day on or after day"""
+        while not self.is_trading_day(day):
+            day += timedelta(days=1)
+        return day
+
+    def next_close(self, after):
+        """Naive local datetime of the first close strictly after the naive local datetime after"""
+        local = after.astimezone(self.tz)
+        day = self.next_trading_day(local.date())
+        close = datetime.combine(day, self.close_time, tzinfo=self.tz)
+        if close <= local:
+            close = datetime.combine(self.next_trading_day(day + timedelta(days=1)), self.close_time, tzinfo=self.tz)
+        return close.astimezone().replace(tzinfo=None)
+
+
+# investing.com country ids to the exchange whose calendar they follow
+EXCHANGES = {
+    5: MarketCalendar('NYSE', 'America/New_York', time(16, 0), nyse_holidays),
+    29: MarketCalendar('BYMA', 'America/Argentina/Buenos_Aires', time(17, 0)),
+    32: MarketCalendar('B3', 'America/Sao_Paulo', time(17, 0)),
+    37: MarketCalendar('SSE', 'Asia/Shanghai', time(15, 0)),
+}
+
+
+def get_market_calendar(country=5):
+    """Calendar of the exchange of an investing.com country, the NYSE's when the country is unknown"""
+    return EXCHANGES.get(country, EXCHANGES[5])
@@ -0,0 +1,89 @@
+import sys
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import pandas as pd
+
+
+def size_of(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(size_of(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(size_of(item) for item in value)
+    if hasattr(value, 'to_plotly_json'):
+        # Dash components hold their rows and figures in their properties
+        return sys.getsizeof(value) + size_of(value.to_plotly_json())
+    return sys.getsizeof(value)
+
+
+class MemoryCache:
+    """In-process LRU cache bounded by the byte size of the values it holds"""
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, max_age=None, is_fresh=None):
+        """
+        Return the value cached for key, or None when missing, older than max_age or when is_fresh,
+        called with the time the value was created, returns False
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (max_age is not None and datetime.now() - entry[1] >= max_age
+                                      or is_fresh is not None and not is_fresh(entry[1])):
+                self._pop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, created=None, size=None):
+        """Cache value under key, size is its byte size when known better than size_of does"""
+        size = size_of(value) if size is None else size
+        with self._lock:
+            self._pop(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, created or datetime.now(), size)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+
+    def touch(self, key, created=None):
+        """Restart the age of an entry whose source was checked and found unchanged"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = (entry[0], created or datetime.now(), entry[2])
+
+    def invalidate(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.size, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,94 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class Prefetcher:
+    """
+    Warms the per-ticker caches in the background, with bounded concurrency and a rate limit shared by every
+    prefetch. warm is called with lists of up to batch_size tickers. Each session, e.g. a browser tab, has a
+    prefetch of its own, a new one cancels only the previous prefetch of the same session
+    """
+
+    def __init__(self, warm, max_workers=2, requests_per_second=1.0, batch_size=1):
+        self.warm = warm
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='prefetch')
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+        # {session: (cancelled, progress)} of the last prefetch of each session
+        self._runs = {}
+
+    def start(self, tickers, session=None):
+        """Cancel the running prefetch of session, if any, and start warming tickers"""
+        tickers = list(dict.fromkeys(ticker for ticker in tickers if ticker))
+        cancelled = threading.Event()
+        progress = {'total': len(tickers), 'done': 0, 'failed': 0}
+        with self._lock:
+            previous = self._runs.pop(session, None)
+            # the sessions whose prefetch is over are forgotten, their progress reads as an empty one
+            self._runs = {key: run for key, run in self._runs.items() if self._running(*run)}
+            self._runs[session] = (cancelled, progress)
+        if previous is not None:
+            previous[0].set()
+        threading.Thread(target=self._run, args=(tickers, progress, cancelled),
+                         name='prefetch-dispatch', daemon=True).start()
+
+    def cancel(self, session=None):
+        """Stop dispatching the tickers of session, warm ups already running are left to finish"""
+        with self._lock:
+            run = self._runs.get(session)
+        if run is not None:
+            run[0].set()
+
+    def progress(self, session=None):
+        with self._lock:
+            cancelled, progress = self._runs.get(session, (None, {'total': 0, 'done': 0, 'failed': 0}))
+            progress = dict(progress)
+            running = cancelled is not None and self._running(cancelled, progress)
+        progress['cancelled'] = cancelled is not None and cancelled.is_set()
+        progress['running'] = running
+        return progress
+
+    @staticmethod
+    def _running(cancelled, progress):
+        return not cancelled.is_set() and progress['done'] + progress['failed'] < progress['total']
+
+    def _run(self, tickers, progress, cancelled):
+        slots = threading.BoundedSemaphore(self.max_workers)
+        for i in range(0, len(tickers), self.batch_size):
+            while not slots.acquire(timeout=0.1):
+                if cancelled.is_set():
+                    return
+            # rate limit between the start of two warm ups of any session, cancel() interrupts the wait
+            with self._lock:
+                now = time.monotonic()
+                wait = max(0.0, self._next_start - now)
+                self._next_start = max(self._next_start, now) + self.interval
+            if cancelled.wait(wait):
+                slots.release()
+                return
+            self._executor.submit(self._warm_batch, tickers[i:i + self.batch_size], progress, slots)
+
+    def _warm_batch(self, batch, progress, slots):
+        try:
+            self.warm(batch)
+            self._count(progress, 'done', len(batch))
+        except (Exception, SystemExit) as e:
+            # a failed cache write raises SystemExit, it must not end the prefetch thread without counting
+            logger.error(f"Prefetch of {', '.join(batch)} failed: {e}")
+            self._count(progress, 'failed', len(batch))
+        finally:
+            slots.release()
+
+    def _count(self, progress, field, count):
+        with self._lock:
+            progress[field] += count
+            finished = progress['done'] + progress['failed']
+        if finished == progress['total'] or finished // 25 != (finished - count) // 25:
+            logger.info(f"Prefetched {finished}/{progress['total']} tickers ({progress['failed']} failed)")
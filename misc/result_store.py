@@ -0,0 +1,25 @@
+from misc.memory_cache import MemoryCache
+
+
+class ResultStore:
+    """
+    Server-side store of the results computed for the page, the browser's dcc.Store only keeps their key.
+    Results live in the memory of the process, a worker that does not hold a key computes it again
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self._cache = MemoryCache(max_bytes=max_bytes)
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def get_or_compute(self, key, compute, *args, **kwargs):
+        """Return the results stored for key, computing and storing them when missing"""
+        results = self._cache.get(key)
+        if results is None:
+            results = compute(*args, **kwargs)
+            self._cache.set(key, results)
+        return results
+
+    def stats(self):
+        return self._cache.stats()
@@ -0,0 +1,63 @@
+import configparser
+import logging
+import threading
+from collections import deque
+
+from misc.cache_index import cache_index
+from misc.fetcher import fetcher
+from misc.utils import load_latest_response
+
+logger = logging.getLogger(__name__)
+
+config = configparser.ConfigParser()
+config.read('./conf/general.conf')
+STALE_WHILE_REVALIDATE = config.getboolean('CACHE', 'STALE_WHILE_REVALIDATE', fallback=True)
+
+
+class RevalidationNotifier:
+    """Records the cache entries replaced by background refreshes, so the UI can poll for new data"""
+
+    def __init__(self, history=1000):
+        self.version = 0
+        self._changes = deque(maxlen=history)
+        self._lock = threading.Lock()
+
+    def notify(self, key):
+        with self._lock:
+            self.version += 1
+            self._changes.append((self.version, key))
+
+    def changes_since(self, version):
+        """Return the current version and the keys refreshed after version"""
+        with self._lock:
+            return self.version, sorted({key for changed, key in self._changes if changed > version})
+
+
+notifier = RevalidationNotifier()
+
+
+def serve_stale_and_revalidate(file_name, refresh, *args, **kwargs):
+    """
+    Return the newest cached frame for file_name whatever its age, and start refresh(*args, **kwargs) in the
+    background to replace it. Returns None when nothing was ever cached, the caller then fetches synchronously
+    """
+    latest = load_latest_response(file_name)
+    if latest is None:
+        return None
+    version = cache_index.version(file_name)
+    future = fetcher.submit(('revalidate', file_name), refresh, *args, **kwargs)
+    future.add_done_callback(lambda done: _notify(file_name, version, done))
+    return latest[0]
+
+
+def _notify(file_name, version, future):
+    """
+    Notify the refresh of file_name only when it wrote a new entry. Getters falling back to the stale frame on
+    a failed fetch return normally, notifying them would redraw the page and start the same refresh again
+    """
+    if future.exception() is not None:
+        logger.error(f"Background refresh of {file_name} failed: {future.exception()}")
+    elif cache_index.version(file_name) == version:
+        logger.debug(f"Background refresh of {file_name} did not write a new entry")
+    else:
+        notifier.notify(file_name)
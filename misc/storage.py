@@ -0,0 +1,42 @@
+import os
+import pandas as pd
+
+
+class CsvStorage:
+    """Plain text storage, kept so existing files load and data can be exported"""
+    extension = 'csv'
+
+    def write(self, df, path, index=False):
+        df.to_csv(path, index=index, float_format='%.6f')
+
+    def read(self, path):
+        return pd.read_csv(path)
+
+
+class FeatherStorage:
+    """Binary columnar storage that keeps column types and is read through a memory map"""
+    extension = 'feather'
+
+    def write(self, df, path, index=False):
+        df = df.reset_index() if index else df.reset_index(drop=True)
+        # uncompressed buffers can be mapped straight from disk instead of being decoded
+        df.to_feather(path, compression='uncompressed')
+
+    def read(self, path):
+        from pyarrow import feather
+        return feather.read_table(path, memory_map=True).to_pandas()
+
+
+STORAGES = {storage.extension: storage for storage in (CsvStorage(), FeatherStorage())}
+
+
+def get_storage(name='csv'):
+    try:
+        return STORAGES[name.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown cache format: {name}. Use one of {', '.join(STORAGES)}")
+
+
+def get_storage_for_file(path):
+    """Storage able to read a cached file, chosen from its extension"""
+    return get_storage(os.path.splitext(path)[1].lstrip('.'))
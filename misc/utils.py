@@ -1,71 +1,264 @@
-import numpy as np
+import configparser
+import logging
 import os
+import threading
+import zlib
 import pandas as pd
-from datetime import datetime, timedelta
-from bs4 import BeautifulSoup
+from contextlib import ExitStack, contextmanager
+from io import BytesIO
+from lxml import etree
+from misc.cache_index import CACHE_DIR, cache_index, key_from_filename
+from misc.file_lock import FileLock
+from misc.freshness import as_policy
+from misc.memory_cache import MemoryCache
+from misc.storage import get_storage, get_storage_for_file
+
+logger = logging.getLogger(__name__)
+
+config = configparser.ConfigParser()
+config.read('./conf/general.conf')
+CACHE_FORMAT = config.get('CACHE', 'FORMAT', fallback='csv')
+MEMORY_CACHE_MB = config.getint('CACHE', 'MEMORY_MAX_MB', fallback=256)
+
+memory_cache = MemoryCache(max_bytes=MEMORY_CACHE_MB * 1024 * 1024)
 
 days_list = ['Monday,', 'Tuesday,', 'Wednesday,', 'Thursday,', 'Friday,', 'Saturday,', 'Sunday,']
 headers = ["Date", "Company (Ticker)", "Ex-Dividend Date", "Dividend", "Payment Date", "Yield"]
+# cells of a calendar row read into the headers after Date, the flag and dividend type cells hold no text
+row_cells = [1, 2, 3, 5, 6]
 
 
-def tune_investing_response_and_save(response, filename):
-    soup = BeautifulSoup(response["data"], 'html.parser')
-
-    li_tags = soup.find_all('a')
+def parse_investing_calendar(html, current_day=None):
+    """
+    Parse the rows of an investing.com calendar in a single streaming pass. Cells are read by position, a blank
+    one is kept as NaN. Returns the calendar frame, with the ticker of each row's link in a Ticker column, the
+    tickers of its rows and the last day header seen, so a following page whose first rows belong to that day
+    can be parsed on its own
+    """
+    columns = [[] for _ in headers]
     tickers = []
-    for li in li_tags:
-        tickers.append(li.get_text())
-    cleantext = BeautifulSoup(response["data"], "lxml").text
-
-    list_of_results = cleantext.splitlines()
-    list_of_results[:] = [item for item in list_of_results if item]
-
-    position_list = []
-    for k, v in enumerate(list_of_results):
-        if v.split(" ", 1)[0] in days_list:
-            position_list.append((v, k))
-
-    position_list_rev = []
-    counter = int(len(list_of_results))
-    for k, v in reversed(list(enumerate(list_of_results))):
-        if v.split(" ", 1)[0] in days_list:
-            position_list_rev.append((v, int((counter - 1 - k) / 5)))
-            counter = k
-
-    position_list_rev.reverse()
-    clearl_list = [i for i in list_of_results if i.split(" ", 1)[0] not in days_list]
-    contador = 0
-    for k, v in enumerate(position_list_rev):
-        for _ in range(0, v[1]):
-            clearl_list.insert(contador, v[0])
-            contador += 6
-
-    list_as_df = pd.DataFrame(np.reshape(np.array(clearl_list), (int(len(clearl_list) / 6), 6)),
-                              columns=headers)
+    if html:
+        rows = etree.iterparse(BytesIO(html.encode('utf-8')), events=('end',), tag='tr', html=True, recover=True)
+        for _, row in rows:
+            cells = [''.join(cell.itertext()).strip() for cell in row.iterfind('td')]
+            if len(cells) == 1 and cells[0].split(" ", 1)[0] in days_list:
+                current_day = cells[0]
+            elif len(cells) > row_cells[-1]:
+                columns[0].append(current_day)
+                for column, position in zip(columns[1:], row_cells):
+                    column.append(cells[position] or None)
+                link = row.find('.//a')
+                tickers.append(link.text if link is not None else None)
+            row.clear()
+
+    list_as_df = pd.DataFrame(dict(zip(headers, columns)), columns=headers).fillna(float('nan'))
     list_as_df["Dividend"] = pd.to_numeric(list_as_df["Dividend"], errors='coerce')
-    # list_as_df["Dividend"]= list_as_df["Dividend"].round(6)
-    save_response_to_csv(list_as_df, filename)
-    return list_as_df
+    list_as_df["Ticker"] = pd.Series(tickers, dtype=object)
+    return list_as_df, tickers, current_day
+
 
+class CorruptCacheFile(Exception):
+    """A cached file does not match the checksum recorded when it was written"""
 
-def save_response_to_csv(list_as_df, filename, index=False):
+
+def file_checksum(path):
+    crc = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            crc = zlib.crc32(chunk, crc)
+    return f'{crc:08x}'
+
+
+def write_atomic(write, path, register=None):
+    """
+    Call write with a temporary path and rename it over path once complete, so no reader, in this process or
+    another, ever opens a partial file. register(checksum) records the file in the index under the same
+    write_lock as the rename, a reader checking the checksum never sees the file and its record disagree.
+    Returns the checksum of the file
+    """
+    tmp_path = f'{path}.{os.getpid()}-{threading.get_ident()}.tmp'
     try:
-        list_as_df.to_csv(f'./csv_files/{filename}', index = index, float_format='%.6f')
+        write(tmp_path)
+        checksum = file_checksum(tmp_path)
+        with write_lock(path):
+            os.replace(tmp_path, path)
+            if register is not None:
+                register(checksum)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return checksum
+
+
+def write_lock(path):
+    """Lock held while a cached file of path's key is swapped in and registered, or checked against its checksum"""
+    return FileLock(os.path.join(CACHE_DIR, '.locks', f'{key_from_filename(path)}.write.lock'))
+
+
+def fill_lock(file_name):
+    """
+    Lock held while the entry of file_name is fetched and saved. Threads and worker processes missing the same
+    key wait for it and then read the entry, so a miss causes a single upstream fetch
+    """
+    return FileLock(os.path.join(CACHE_DIR, '.locks', f'{file_name}.lock'))
+
+
+@contextmanager
+def fill_locks(file_names):
+    """
+    fill_lock of each of file_names, taken in sorted order so batches missing the same keys in any order cannot
+    deadlock
+    """
+    with ExitStack() as locks:
+        for file_name in sorted(set(file_names)):
+            locks.enter_context(fill_lock(file_name))
+        yield
+
+
+def save_response(list_as_df, filename, index=False):
+    """Save a response in the configured cache format, filename is given without extension"""
+    storage = get_storage(CACHE_FORMAT)
+    path = f'./csv_files/{filename}.{storage.extension}'
+    key = key_from_filename(path)
+    try:
+        write_atomic(lambda tmp_path: storage.write(list_as_df, tmp_path, index=index), path,
+                     register=lambda checksum: cache_index.register(key, path, checksum=checksum))
     except:
         raise SystemExit(
             f"\033[91m Can not save file {filename} on local system. \033[0m")
+    memory_cache.set(key, list_as_df.copy())
+    return path
+
+
+def spool_path(filename):
+    """Temporary csv file the rows of the entry filename (without extension) are appended to as they arrive"""
+    return f'./csv_files/{filename}.csv.{os.getpid()}-{threading.get_ident()}.tmp'
+
+
+def append_to_spool(list_as_df, spool):
+    """Append the rows of a frame to a spool file, the first call writes the header"""
+    list_as_df.to_csv(spool, mode='a', header=not os.path.exists(spool), index=False, float_format='%.6f')
+
+
+def save_spooled_response(spool, filename):
+    """Swap a complete spool file in as the csv entry filename (without extension) and register it"""
+    path = f'./csv_files/{filename}.csv'
+    key = key_from_filename(path)
+    try:
+        write_atomic(lambda tmp_path: os.replace(spool, tmp_path), path,
+                     register=lambda checksum: cache_index.register(key, path, checksum=checksum))
+    except:
+        raise SystemExit(
+            f"\033[91m Can not save file {filename} on local system. \033[0m")
+    memory_cache.invalidate(key)
+    return path
+
+
+def save_canonical_response(list_as_df, filename, index=False):
+    """Save the single series kept for a key, filename is the key itself, older entries are deleted"""
+    path = save_response(list_as_df, filename, index=index)
+    for old_path in cache_index.entries(filename):
+        if os.path.basename(old_path) != os.path.basename(path):
+            cache_index.remove(old_path)
+            if os.path.exists(old_path):
+                os.remove(old_path)
+    return path
+
+
+def touch_response(file_name):
+    """Restart the TTL of a cached entry that was checked against its source and is unchanged"""
+    cache_index.touch(file_name)
+    memory_cache.touch(file_name)
+
+
+def invalidate_response(file_name):
+    """Delete the cached entries for file_name so the next lookup recomputes it"""
+    for path in cache_index.entries(file_name):
+        with write_lock(path):
+            cache_index.remove(path)
+            if os.path.exists(path):
+                os.remove(path)
+    cache_index.remove_key(file_name)
+    memory_cache.invalidate(file_name)
+
+
+def read_cached_file(path, checksum=None):
+    """Read a cached file whatever format it was saved with, checked against its checksum when given"""
+    if checksum is not None and file_checksum(path) != checksum:
+        raise CorruptCacheFile(f"{path} does not match its checksum")
+    return get_storage_for_file(path).read(path)
+
+
+def read_latest_entry(file_name, is_fresh=None, index=None):
+    """
+    Return (frame, created) of the newest entry for file_name in index (the cache_index when None), or None when
+    there is none or is_fresh rejects it. Entries failing their checksum are deleted and the previous one is tried
+    """
+    index = cache_index if index is None else index
+    while True:
+        entry = index.latest(file_name)
+        if not entry or (is_fresh is not None and not is_fresh(entry[1])):
+            return None
+        latest_file, created = entry
+        try:
+            return read_cached_file(latest_file, checksum=index.checksum(latest_file)), created
+        except CorruptCacheFile as e:
+            with write_lock(latest_file):
+                # a file rewritten under the same name may have been swapped in after its checksum was read
+                if os.path.exists(latest_file) and file_checksum(latest_file) == index.checksum(latest_file):
+                    continue
+                logger.warning(f"Dropping cached file: {e}")
+                index.remove(latest_file)
+                if os.path.exists(latest_file):
+                    os.remove(latest_file)
+        except:
+            raise SystemExit(
+                f"\033[91m Can not open file {latest_file} or does not have proper format. \033[0m")
+
+
+def parse_ticker(cell):
+    """Ticker out of a "Company (Ticker)" calendar cell, company names may hold parentheses too"""
+    return cell[cell.rfind("(") + 1:cell.rfind(")")]
+
+
+def row_ticker(row):
+    """Ticker of a calendar grid row, the one of its link or, in calendars cached without it, of its company cell"""
+    ticker = row.get('Ticker')
+    return ticker if isinstance(ticker, str) and ticker else parse_ticker(row['Company (Ticker)'])
+
+
+def calendar_tickers(df):
+    """
+    Ticker of each row of a calendar, the one of the row's link read by parse_investing_calendar or, in
+    calendars cached without it, the one of its "Company (Ticker)" cell
+    """
+    cells = [parse_ticker(cell) for cell in df.get('Company (Ticker)', [])]
+    if 'Ticker' not in df:
+        return cells
+    return [ticker if isinstance(ticker, str) and ticker else cell for ticker, cell in zip(df['Ticker'], cells)]
+
 
+def load_cached_response(file_name, freshness=1):
+    """Return the cached frame for file_name while it is fresh, from memory when possible, or None"""
+    policy = as_policy(freshness)
+    df = memory_cache.get(file_name, is_fresh=policy.is_fresh)
+    if df is None:
+        entry = read_latest_entry(file_name, is_fresh=policy.is_fresh)
+        if entry is None:
+            return None
+        df, created = entry
+        memory_cache.set(file_name, df, created=created)
+    cache_index.mark_accessed(file_name)
+    return df.copy()
 
-def get_latest_file(file_name='', days_delta=1):
-    latest_file = ''
-    list_of_files = []
-    for filename in os.listdir('./csv_files/'):
-        if filename.startswith(f'{file_name}') and filename.endswith('csv'):
-            list_of_files.append(f'./csv_files/{filename}')
 
-    if list_of_files:
-        latest_file = max(list_of_files, key=os.path.getctime)
-        c_time = os.path.getctime(latest_file)
-        if datetime.now() - datetime.fromtimestamp(c_time) >= timedelta(hours=days_delta):
-            latest_file = None
-    return latest_file
+def load_latest_response(file_name, index=None):
+    """
+    Return (frame, created) of the newest cached entry for file_name whatever its age, or None. index is the
+    cache index to read, the cache_index when None
+    """
+    index = cache_index if index is None else index
+    entry = read_latest_entry(file_name, index=index)
+    if entry is not None:
+        index.mark_accessed(file_name)
+    return entry
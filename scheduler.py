@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Refreshes the dividend calendars after midnight and the per-ticker caches after the exchange closes, so the app
+mostly reads from cache. Runs inside the app (SCHEDULER ENABLED=true), in the one worker process holding its leader
+lock, or from cron:
+
+    python scheduler.py --once
+"""
+import argparse
+import logging
+import os
+import threading
+from datetime import datetime, time, timedelta
+
+from config import AppConfig
+import get_dividends
+import get_dividends_historical_by_ticker
+import get_historical_data_by_ticker
+import calculate_dividend_summary
+import dividend_yield
+from misc.cache_index import CACHE_DIR
+from misc.file_lock import FileLock
+from misc.market_calendar import get_market_calendar
+from misc.utils import calendar_tickers
+
+logger = logging.getLogger(__name__)
+
+# held by the process running the scheduler, the other worker processes of the app wait to take over
+LEADER_LOCK = os.path.join(CACHE_DIR, '.locks', 'scheduler.lock')
+
+
+class RefreshScheduler:
+    """Runs the calendar refresh after each midnight and the ticker refresh after each close of the market"""
+
+    def __init__(self, config: AppConfig):
+        self.config = config
+        self.market = get_market_calendar(config.country)
+        self._stop = threading.Event()
+        self._thread = None
+        now = datetime.now()
+        self.next_runs = {'calendars': self._next_calendars_run(now), 'tickers': self._next_tickers_run(now)}
+
+    def _next_calendars_run(self, now):
+        return datetime.combine(now.date() + timedelta(days=1), time()) + timedelta(minutes=1)
+
+    def _next_tickers_run(self, now):
+        # next_close is looked up from a moment shifted back by the delay, a run due right now is not skipped
+        delay = timedelta(minutes=self.config.scheduler_after_close_minutes)
+        return self.market.next_close(now - delay) + delay
+
+    def refresh_calendars(self):
+        """Fetch every configured calendar whose entry expired, returns the tickers they list"""
+        tickers = []
+        for country in self.config.countries:
+            for filter_time in self.config.scheduler_filters:
+                df = get_dividends.get_dividends_next_week(
+                    country=country,
+                    filter_time=filter_time,
+                    freshness=self.config.freshness['dividends_by_date'],
+                    stale_while_revalidate=False
+                )
+                tickers.extend(calendar_tickers(df))
+        return [ticker for ticker in dict.fromkeys(tickers) if ticker]
+
+    def refresh_tickers(self, tickers=None):
+        """Fetch the prices, dividends and summaries of the calendar tickers whose entries expired"""
+        tickers = self.refresh_calendars() if tickers is None else tickers
+        # the window moves with each run, so today's close is included
+        start_date, end_date = self.config.price_window()
+        prices = get_historical_data_by_ticker.get_historical_data_batch(
+            tickers=tickers,
+            start_date=start_date,
+            end_date=end_date,
+            freshness=self.config.freshness['historical_data'],
+            batch_size=self.config.prefetch_batch_size
+        )
+        dividends = get_dividends_historical_by_ticker.get_historical_dividends_batch(
+            tickers=tickers,
+            freshness=self.config.freshness['historical_dividends'],
+            batch_size=self.config.prefetch_batch_size
+        )
+        dividend_yield.refresh_yields(prices, dividends)
+        for dg in dividends.values():
+            if not dg.empty:
+                calculate_dividend_summary.get_dividend_summary(
+                    data=dg.to_dict('records'),
+                    freshness=self.config.freshness['dividends_summary'],
+                    stale_while_revalidate=False
+                )
+        logger.info(f"Refreshed the caches of {len(tickers)} tickers")
+
+    def run_once(self):
+        """Refresh whatever expired, the freshness policies keep this free of requests on closed market days"""
+        self.refresh_tickers(self.refresh_calendars())
+
+    def run_pending(self, now=None):
+        """Run the jobs that are due and schedule their next run, returns the names of the jobs run"""
+        now = now or datetime.now()
+        jobs = {'calendars': (self.refresh_calendars, self._next_calendars_run),
+                'tickers': (self.refresh_tickers, self._next_tickers_run)}
+        ran = []
+        for name, (job, next_run) in jobs.items():
+            if self.next_runs[name] > now:
+                continue
+            try:
+                job()
+            except Exception as e:
+                logger.error(f"Scheduled {name} refresh failed: {e}")
+            self.next_runs[name] = next_run(now)
+            ran.append(name)
+        return ran
+
+    def run(self, leader_lock=LEADER_LOCK):
+        """
+        Run the jobs as they come due until stop() is called, as long as this process holds leader_lock. Other
+        processes check the lock at each wake up and take over when the leader exits
+        """
+        leader = FileLock(leader_lock)
+        try:
+            while not self._stop.is_set():
+                wait = 300.0
+                if leader.locked or leader.acquire(blocking=False):
+                    self.run_pending()
+                    wait = (min(self.next_runs.values()) - datetime.now()).total_seconds()
+                # woken up every few minutes, so a clock change or a suspended machine does not delay runs by hours
+                self._stop.wait(min(max(wait, 1.0), 300.0))
+        finally:
+            leader.release()
+
+    def start(self):
+        """Run the scheduler on a daemon thread next to the app"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, name='refresh-scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Refresh the cached dividend calendars and ticker data")
+    parser.add_argument('--once', action='store_true', help="refresh what expired and exit, for cron")
+    parser.add_argument('--config', default='./conf/general.conf', help="configuration file")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    scheduler = RefreshScheduler(AppConfig.from_file(args.config))
+    if args.once:
+        scheduler.run_once()
+    else:
+        for name, when in scheduler.next_runs.items():
+            logger.info(f"Next {name} refresh at {when:%Y-%m-%d %H:%M}")
+        scheduler.run()
+
+
+if __name__ == '__main__':
+    main()
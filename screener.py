@@ -0,0 +1,190 @@
+"""
+Screens every ticker held in csv_files. The universe is loaded once into a columnar table (last close, yields and
+the dividend analytics of each ticker, and the calendars it appears in) and only the tickers whose cache entries
+changed are loaded again, so screens are answered from memory:
+
+    from screener import universe
+    universe.screen([('forward_yield', '>', 4), ('increase_streak', '>=', 10), ('in_nextWeek', '==', True)],
+                    sort_by='forward_yield')
+"""
+import configparser
+import logging
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from dividend_analytics import dividend_analytics
+from get_dividends import INITIAL_PART_DIVIDENDS_BY_DATE
+from get_dividends_historical_by_ticker import INITIAL_PART_HISTORICAL_DIVIDENDS_TICKER
+from get_historical_data_by_ticker import INITIAL_PART_HISTORICAL_DATA_TICKER
+from misc.cache_index import cache_index
+from misc.freshness import FRESHNESS
+from misc.utils import load_cached_response
+from misc.utils import load_latest_response
+from misc.utils import calendar_tickers
+
+logger = logging.getLogger(__name__)
+
+config = configparser.ConfigParser()
+config.read('./conf/general.conf')
+# screens within this many seconds of the last one do not look for refreshed cache entries
+REFRESH_SECONDS = config.getfloat('SCREENER', 'REFRESH_SECONDS', fallback=30)
+
+# calendars from the narrowest, a ticker going ex-dividend tomorrow is also in this week's calendar
+CALENDARS = ['tomorrow', 'thisWeek', 'nextWeek']
+# one flag per calendar, screens on a calendar cover the tickers of the narrower ones it holds
+CALENDAR_FLAGS = [f'in_{filter_time}' for filter_time in CALENDARS]
+CALENDAR_COLUMNS = ['company', 'calendar', 'ex_dividend_date', 'payment_date'] + CALENDAR_FLAGS
+
+OPERATORS = {
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+    '==': np.equal,
+    '!=': np.not_equal,
+    'in': lambda column, values: column.isin(values),
+}
+
+
+def last_closes(prices):
+    """Last close of each {ticker: price frame}"""
+    closes = {ticker: pd.to_numeric(df['close'], errors='coerce').dropna() for ticker, df in prices.items()}
+    return pd.Series({ticker: close.iloc[-1] for ticker, close in closes.items() if not close.empty},
+                     dtype=float)
+
+
+def score(prices, dividends, as_of=None):
+    """Rows of the universe table of the tickers of prices and dividends, {ticker: frame} dicts"""
+    table = dividend_analytics(dividends, as_of=as_of)
+    table = table.reindex(table.index.union(list(prices)))
+    table[['payments', 'increase_streak']] = table[['payments', 'increase_streak']].fillna(0).astype(int)
+    table['close'] = last_closes(prices)
+    suspended = table['suspended'].fillna(False).astype(bool)
+    forward = (table['last_dividend'] * table['payments_per_year']).where(~suspended, 0.0)
+    table['forward_dividend'] = forward
+    table['trailing_yield'] = table['ttm_dividend'] / table['close'] * 100
+    table['forward_yield'] = forward / table['close'] * 100
+    return compact(table)
+
+
+def compact(table):
+    """Floats down to float32 and labels to categories, a few thousand tickers fit in a few hundred KB"""
+    floats = table.select_dtypes('float64').columns
+    table[floats] = table[floats].astype('float32')
+    for column in ('frequency',):
+        if column in table:
+            table[column] = table[column].astype('category')
+    for column in ('cut', 'suspended'):
+        if column in table:
+            table[column] = table[column].fillna(False).astype(bool)
+    return table
+
+
+def calendar_table(index=cache_index):
+    """
+    Narrowest fresh cached calendar each ticker appears in, with its ex-dividend and payment dates, and whether it
+    appears in each calendar (in_tomorrow, in_thisWeek, in_nextWeek)
+    """
+    rows = []
+    keys = sorted(index.versions(INITIAL_PART_DIVIDENDS_BY_DATE))
+    for filter_time in reversed(CALENDARS):
+        for key in keys:
+            if not key.endswith(f'_{filter_time}'):
+                continue
+            df = load_cached_response(key, freshness=FRESHNESS['dividends_by_date'])
+            if df is None or df.empty:
+                continue
+            rows.append(pd.DataFrame({
+                'ticker': calendar_tickers(df),
+                'company': df['Company (Ticker)'].str.rsplit('(', n=1).str[0].str.strip(),
+                'calendar': filter_time,
+                'ex_dividend_date': df['Ex-Dividend Date'],
+                'payment_date': df['Payment Date'],
+            }))
+    if not rows:
+        return pd.DataFrame(columns=CALENDAR_COLUMNS)
+    rows = pd.concat(rows, ignore_index=True)
+    flags = pd.crosstab(rows['ticker'], rows['calendar']).reindex(columns=CALENDARS, fill_value=0) > 0
+    flags.columns = CALENDAR_FLAGS
+    # the later, narrower calendars win
+    calendars = rows.drop_duplicates('ticker', keep='last').set_index('ticker').join(flags)
+    calendars['calendar'] = pd.Categorical(calendars['calendar'], categories=CALENDARS)
+    return calendars
+
+
+class Universe:
+    """Columnar table of every cached ticker, kept up to date with the cache index"""
+
+    def __init__(self, index=cache_index, refresh_seconds=REFRESH_SECONDS):
+        self.index = index
+        self.refresh_seconds = refresh_seconds
+        self._scores = score({}, {})
+        self.table = self._scores.join(pd.DataFrame(columns=CALENDAR_COLUMNS), how='left')
+        self._versions = {}
+        self._refreshed = None
+        self._lock = threading.Lock()
+
+    def _cached_versions(self):
+        return {**self.index.versions(INITIAL_PART_HISTORICAL_DATA_TICKER),
+                **self.index.versions(INITIAL_PART_HISTORICAL_DIVIDENDS_TICKER)}
+
+    def refresh(self, force=False):
+        """Load again the tickers whose prices or dividends were written since the last refresh"""
+        with self._lock:
+            if not force and self._refreshed is not None and \
+                    time.monotonic() - self._refreshed < self.refresh_seconds:
+                return self.table
+            versions = self._cached_versions()
+            changed = {key for key in versions.keys() | self._versions.keys()
+                       if versions.get(key) != self._versions.get(key)}
+            tickers = {key[len(prefix):] for key in changed
+                       for prefix in (INITIAL_PART_HISTORICAL_DATA_TICKER, INITIAL_PART_HISTORICAL_DIVIDENDS_TICKER)
+                       if key.startswith(prefix)}
+            if tickers:
+                scores = score(*self._load(tickers))
+                kept = self._scores.drop(index=list(tickers), errors='ignore')
+                self._scores = compact(pd.concat([kept, scores]).sort_index()) if not kept.empty else scores
+                logger.info(f"Screener loaded {len(tickers)} changed tickers, {len(self._scores)} in the universe")
+            self._versions = versions
+            # calendars are small and expire daily, they are read again on every refresh
+            self.table = self._scores.join(calendar_table(index=self.index), how='left')
+            self.table[CALENDAR_FLAGS] = self.table[CALENDAR_FLAGS].fillna(False).astype(bool)
+            self._refreshed = time.monotonic()
+            return self.table
+
+    @staticmethod
+    def _load(tickers):
+        prices, dividends = {}, {}
+        for ticker in tickers:
+            entry = load_latest_response(f'{INITIAL_PART_HISTORICAL_DATA_TICKER}{ticker}')
+            if entry is not None and not entry[0].empty:
+                prices[ticker] = entry[0]
+            entry = load_latest_response(f'{INITIAL_PART_HISTORICAL_DIVIDENDS_TICKER}{ticker}')
+            if entry is not None and not entry[0].empty:
+                dividends[ticker] = entry[0].assign(ticker=ticker)
+        return prices, dividends
+
+    def screen(self, filters=(), sort_by=None, ascending=False, limit=None):
+        """
+        Rows of the tickers passing every (column, operator, value) filter, the operators are those of
+        OPERATORS. Missing values never pass a filter
+        """
+        table = self.refresh()
+        mask = np.ones(len(table), dtype=bool)
+        for column, operator, value in filters:
+            if column not in table.columns:
+                raise ValueError(f"Unknown screener column {column}")
+            if operator not in OPERATORS:
+                raise ValueError(f"Unknown screener operator {operator}")
+            passed = np.asarray(OPERATORS[operator](table[column], value), dtype=bool)
+            mask &= passed & table[column].notna().to_numpy()
+        result = table[mask]
+        if sort_by is not None:
+            result = result.sort_values(sort_by, ascending=ascending, na_position='last')
+        return result.head(limit) if limit else result
+
+
+universe = Universe()
@@ -8,7 +8,12 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from api_requests.historical_dividends_by_ticker_yahoo_fin import get_historical_dividends, get_historical_dividends_get
-from api_requests.dividends_by_date_investing import get_dividends_next_week_post
+from api_requests.historical_dividends_by_ticker_yahoo_fin import get_historical_dividends_batch_get
+from api_requests.historical_data_by_ticker_yahoo_fin import get_historical_data_batch_get
+from api_requests.dividends_by_date_investing import iter_dividends_pages_post
+from api_requests.dividends_by_date_investing import InvestingClient, InvestingRequestError, RateLimiter
+from misc.freshness import FRESHNESS
+from get_dividends import iter_dividends_next_week, get_dividends_next_week, get_dividends_next_week_by_countries
 
 
 class TestHistoricalDividends:
@@ -60,10 +65,82 @@ class TestHistoricalDividends:
             assert isinstance(result, pd.DataFrame)
 
 
+def bulk_download(fields, values):
+    """Frame shaped like yfinance.download(..., group_by='ticker') for KO, PEP and a failed ticker"""
+    index = pd.to_datetime(['2023-01-03', '2023-01-04'])
+    data = {}
+    for ticker in ['KO', 'PEP', 'BAD']:
+        for field in fields:
+            data[(ticker, field)] = values[ticker].get(field, [float('nan')] * 2)
+    df = pd.DataFrame(data, index=index)
+    df.index.name = 'Date'
+    return df
+
+
+class TestBatchDownloads:
+    """Test cases for the multi-ticker bulk downloads"""
+    
+    def test_get_historical_data_batch_get(self):
+        """Test bulk prices are split per ticker in yahoo_fin's format"""
+        fields = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+        prices = {field: [1.0, 2.0] for field in fields}
+        data = bulk_download(fields, {'KO': prices, 'PEP': prices, 'BAD': {}})
+        
+        with patch('api_requests.historical_data_by_ticker_yahoo_fin.yf.download', return_value=data) as mock_download:
+            result = get_historical_data_batch_get(['KO', 'PEP', 'BAD'], '01/01/2023', '01/05/2023')
+            
+            mock_download.assert_called_once()
+            assert sorted(result) == ['KO', 'PEP']
+            assert list(result['KO'].columns) == ['date', 'open', 'high', 'low', 'close', 'adjclose', 'volume', 'ticker']
+            assert len(result['KO']) == 2
+            assert result['PEP']['ticker'].iloc[0] == 'PEP'
+    
+    def test_get_historical_dividends_batch_get(self):
+        """Test the batch asks the chart endpoint for dividends only, on one session"""
+        def chart(events, timezone='America/New_York'):
+            response = MagicMock()
+            response.json.return_value = {'chart': {'result': [{
+                'meta': {'exchangeTimezoneName': timezone}, **({'events': {'dividends': events}} if events else {})
+            }]}}
+            return response
+        session = MagicMock()
+        session.get.side_effect = [
+            # Yahoo dates the events at the open, 13:30 UTC, and keys them by timestamp
+            chart({'1686749400': {'amount': 0.46, 'date': 1686749400},
+                   '1678800600': {'amount': 0.46, 'date': 1678800600}}),
+            chart(None),
+            ValueError('404'),
+        ]
+        
+        result = get_historical_dividends_batch_get(['KO', 'PEP', 'BAD'], session=session)
+        
+        assert sorted(result) == ['KO', 'PEP']
+        assert all(call.kwargs['params']['events'] == 'div' for call in session.get.call_args_list)
+        assert list(result['KO'].columns) == ['date', 'dividend', 'ticker']
+        assert result['KO']['date'].dt.strftime('%Y-%m-%d %H:%M').tolist() == ['2023-03-14 00:00', '2023-06-14 00:00']
+        assert str(result['KO']['date'].dt.tz) == 'America/New_York'
+        assert result['PEP'].empty
+    
+    def test_ticker_without_data(self):
+        """Test yfinance's [] for a ticker without data gives an empty frame"""
+        with patch('api_requests.historical_dividends_by_ticker_yahoo_fin.yf') as mock_yf:
+            mock_yf.Ticker.return_value.dividends = []
+            
+            assert get_historical_dividends_get('GONE').empty
+
+
+def investing_client(max_retries=2, **post):
+    """Client whose session post is mocked, without waits between retries"""
+    session = MagicMock()
+    session.post = MagicMock(**post)
+    return InvestingClient(session=session, max_retries=max_retries, backoff=0,
+                           limiter=RateLimiter(requests_per_minute=0))
+
+
 class TestDividendsByDateInvesting:
     """Test cases for Investing.com API functions"""
     
-    def test_get_dividends_next_week_post_success(self):
+    def test_iter_dividends_pages_post_success(self):
         """Test successful API call to Investing.com"""
         mock_response = MagicMock()
         mock_response.status_code = 200
@@ -74,49 +151,231 @@ class TestDividendsByDateInvesting:
             "rows_num": 1
         }
         
-        with patch('api_requests.dividends_by_date_investing.requests.post', return_value=mock_response):
-            result = get_dividends_next_week_post()
+        with patch('api_requests.dividends_by_date_investing.get_client',
+                   return_value=investing_client(return_value=mock_response)):
+            result = list(iter_dividends_pages_post())
             
-            assert isinstance(result, dict)
-            assert "data" in result
-            assert "rows_num" in result
-            assert len(result["data"]) == 1
-            assert result["data"][0]["ticker"] == "AAPL"
+            assert len(result) == 1
+            assert "rows_num" in result[0]
+            assert len(result[0]["data"]) == 1
+            assert result[0]["data"][0]["ticker"] == "AAPL"
     
-    def test_get_dividends_next_week_post_api_error(self):
+    def test_iter_dividends_pages_post_api_error(self):
         """Test API call when server returns error status"""
         mock_response = MagicMock()
         mock_response.status_code = 500
+        mock_response.headers = {}
         
-        with patch('api_requests.dividends_by_date_investing.requests.post', return_value=mock_response):
-            result = get_dividends_next_week_post()
-            
-            assert isinstance(result, dict)
-            assert "data" in result
-            assert result["data"] == []
+        with patch('api_requests.dividends_by_date_investing.get_client',
+                   return_value=investing_client(return_value=mock_response)):
+            with pytest.raises(InvestingRequestError):
+                list(iter_dividends_pages_post())
     
-    def test_get_dividends_next_week_post_json_error(self):
+    def test_iter_dividends_pages_post_json_error(self):
         """Test API call when response is not valid JSON"""
         mock_response = MagicMock()
         mock_response.status_code = 200
         mock_response.json.side_effect = Exception("Invalid JSON")
         mock_response.text = "<html>Error page</html>"
         
-        with patch('api_requests.dividends_by_date_investing.requests.post', return_value=mock_response):
-            result = get_dividends_next_week_post()
-            
-            assert isinstance(result, dict)
-            assert "data" in result
-            assert result["data"] == []
+        with patch('api_requests.dividends_by_date_investing.get_client',
+                   return_value=investing_client(return_value=mock_response)):
+            with pytest.raises(InvestingRequestError):
+                list(iter_dividends_pages_post())
     
-    def test_get_dividends_next_week_post_request_error(self):
+    def test_iter_dividends_pages_post_request_error(self):
         """Test API call when request fails completely"""
-        with patch('api_requests.dividends_by_date_investing.requests.post', side_effect=Exception("Network error")):
-            result = get_dividends_next_week_post()
+        with patch('api_requests.dividends_by_date_investing.get_client',
+                   return_value=investing_client(side_effect=Exception("Network error"))):
+            with pytest.raises(InvestingRequestError):
+                list(iter_dividends_pages_post())
+
+
+class TestInvestingClient:
+    """Test cases for the pooled investing.com client"""
+    
+    def ok_response(self):
+        response = MagicMock()
+        response.status_code = 200
+        response.json.return_value = {"data": "<tr></tr>"}
+        return response
+    
+    def test_failures_are_retried(self):
+        """Test network errors and retryable statuses are retried until a page arrives"""
+        throttled = MagicMock()
+        throttled.status_code = 429
+        throttled.headers = {}
+        client = investing_client(side_effect=[Exception("Network error"), throttled, self.ok_response()])
+        
+        assert client.post_calendar() == {"data": "<tr></tr>"}
+        assert client.session.post.call_count == 3
+    
+    def test_retries_are_bounded(self):
+        """Test the client gives up with an error once the retries are used"""
+        client = investing_client(max_retries=2, side_effect=Exception("Network error"))
+        
+        with pytest.raises(InvestingRequestError):
+            client.post_calendar()
+        assert client.session.post.call_count == 3
+    
+    def test_client_errors_are_not_retried(self):
+        """Test a status that will not change is reported at once"""
+        forbidden = MagicMock()
+        forbidden.status_code = 403
+        client = investing_client(return_value=forbidden)
+        
+        with pytest.raises(InvestingRequestError):
+            client.post_calendar()
+        assert client.session.post.call_count == 1
+    
+    def test_rate_limiter_spaces_requests(self):
+        """Test request starts are spaced by the configured rate"""
+        limiter = RateLimiter(requests_per_minute=600)
+        
+        with patch('api_requests.dividends_by_date_investing.time.sleep') as mock_sleep:
+            limiter.wait()
+            limiter.wait()
+            
+            mock_sleep.assert_called_once()
+            assert 0 < mock_sleep.call_args[0][0] <= 0.1
+    
+    def test_failed_calendar_is_not_cached(self):
+        """Test a failed refresh serves the last calendar and caches nothing"""
+        stale = pd.DataFrame({'Company (Ticker)': ['Coca-Cola (KO)']})
+        
+        with patch('get_dividends.load_cached_response', return_value=None), \
+                patch('get_dividends.iter_dividends_pages_post', side_effect=InvestingRequestError("down")), \
+                patch('get_dividends.load_latest_response', return_value=(stale, None)), \
+                patch('get_dividends.save_spooled_response') as mock_save:
+            result = get_dividends_next_week(country=5, filter_time='nextWeek')
+            
+            mock_save.assert_not_called()
+        assert result is stale
+
+
+def calendar_page(day, ticker):
+    return (f'<tr><td class="theDay">{day}</td></tr>' if day else '') + (
+        f'<tr><td></td><td>{ticker} Inc&nbsp;(<a>{ticker}</a>)</td><td>Oct 23, 2023</td><td>0.5</td>'
+        f'<td></td><td>Nov 15, 2023</td><td>1.00%</td></tr>')
+
+
+class TestCalendarPaging:
+    """Test cases for the paginated calendar ingestion"""
+    
+    def test_pages_are_followed_until_exhausted(self):
+        """Test next pages are asked for with limit_from and last_time_scope"""
+        pages = [
+            {"data": "<tr></tr>", "bind_scroll_handler": True, "last_time_scope": 1698019200},
+            {"data": "<tr></tr>", "bind_scroll_handler": True, "last_time_scope": 1698105600},
+            {"data": "<tr></tr>", "bind_scroll_handler": False},
+        ]
+        
+        with patch.object(InvestingClient, 'post_calendar', side_effect=pages) as mock_post:
+            result = list(iter_dividends_pages_post(country=5, filter_time='nextWeek'))
+            
+            assert result == pages
+            assert [call.kwargs['limit_from'] for call in mock_post.call_args_list] == [0, 1, 2]
+            assert mock_post.call_args_list[2].kwargs['last_time_scope'] == 1698105600
+    
+    def test_paging_stops_at_max_pages(self):
+        """Test an endless continuation is cut at max_pages"""
+        page = {"data": "<tr></tr>", "bind_scroll_handler": True, "last_time_scope": 1}
+        
+        with patch.object(InvestingClient, 'post_calendar', return_value=page):
+            assert len(list(iter_dividends_pages_post(max_pages=3))) == 3
+    
+    def test_pages_are_cached_as_they_arrive(self, tmp_path):
+        """Test each page is yielded and appended to the spool, which is saved once the last page is in"""
+        pages = [
+            {"data": calendar_page('Monday, October 23, 2023', 'KO'), "bind_scroll_handler": True,
+             "last_time_scope": 1},
+            {"data": calendar_page(None, 'PEP'), "bind_scroll_handler": False},
+        ]
+        spool = str(tmp_path / 'dividends_by_date_5_nextWeek.csv.tmp')
+        saved = []
+        
+        def save(path, file_name):
+            saved.append((file_name, pd.read_csv(path)))
+            os.remove(path)
+        
+        with patch('get_dividends.load_cached_response', return_value=None), \
+                patch('get_dividends.iter_dividends_pages_post', return_value=iter(pages)), \
+                patch('get_dividends.spool_path', return_value=spool), \
+                patch('get_dividends.save_spooled_response', side_effect=save):
+            frames = iter_dividends_next_week(country=5, filter_time='nextWeek')
+            first = next(frames)
+            
+            assert len(pd.read_csv(spool)) == 1 and not saved
+            frames = [first, *frames]
+            
+            assert [len(frame) for frame in frames] == [1, 1]
+            assert frames[1]['Date'].iloc[0] == 'Monday, October 23, 2023'
+            assert saved[0][0].startswith('dividends_by_date_5_nextWeek_')
+            assert saved[0][1]['Company (Ticker)'].str.contains('PEP').tolist() == [False, True]
+    
+    def test_incomplete_calendar_is_not_kept(self, tmp_path):
+        """Test the spool of a calendar whose consumer stopped early is dropped and nothing is saved"""
+        pages = [
+            {"data": calendar_page('Monday, October 23, 2023', 'KO'), "bind_scroll_handler": True,
+             "last_time_scope": 1},
+            {"data": calendar_page(None, 'PEP'), "bind_scroll_handler": False},
+        ]
+        spool = str(tmp_path / 'dividends_by_date_5_nextWeek.csv.tmp')
+        
+        with patch('get_dividends.load_cached_response', return_value=None), \
+                patch('get_dividends.iter_dividends_pages_post', return_value=iter(pages)), \
+                patch('get_dividends.spool_path', return_value=spool), \
+                patch('get_dividends.save_spooled_response') as mock_save:
+            frames = iter_dividends_next_week(country=5, filter_time='nextWeek')
+            next(frames)
+            frames.close()
+            
+            mock_save.assert_not_called()
+            assert not os.path.exists(spool)
+    
+    def test_failed_page_serves_the_previous_calendar(self, tmp_path):
+        """Test a calendar failing after its first page falls back to the last complete one"""
+        def pages(**kwargs):
+            yield {"data": calendar_page('Monday, October 23, 2023', 'KO'), "bind_scroll_handler": True,
+                   "last_time_scope": 1}
+            raise InvestingRequestError('page 2 failed')
+        previous = pd.DataFrame({'Company (Ticker)': ['Coca-Cola (KO)', 'PepsiCo (PEP)']})
+        
+        with patch('get_dividends.load_cached_response', return_value=None), \
+                patch('get_dividends.iter_dividends_pages_post', side_effect=pages), \
+                patch('get_dividends.spool_path', return_value=str(tmp_path / 'spool.csv.tmp')), \
+                patch('get_dividends.load_latest_response', return_value=(previous, None)):
+            result = get_dividends_next_week(country=5, filter_time='nextWeek', stale_while_revalidate=False)
+        
+        pd.testing.assert_frame_equal(result, previous)
+        assert os.listdir(tmp_path) == []
+
+
+class TestMultiCountryCalendar:
+    """Test cases for the calendar of several countries"""
+    
+    def test_countries_are_merged_with_a_country_column(self):
+        """Test each country is fetched on its own and tagged in the merged calendar"""
+        calendars = {
+            5: pd.DataFrame({'Company (Ticker)': ['Coca-Cola (KO)']}),
+            32: pd.DataFrame({'Company (Ticker)': ['Petrobras (PETR4)', 'Vale (VALE3)']}),
+        }
+        
+        with patch('get_dividends.get_dividends_next_week',
+                   side_effect=lambda country, filter_time, freshness: calendars[country]) as mock_get:
+            result = get_dividends_next_week_by_countries([5, 32], filter_time='thisWeek')
+            
+            assert sorted(call.kwargs['country'] for call in mock_get.call_args_list) == [5, 32]
+        assert result['Country'].tolist() == ['United States', 'Brazil', 'Brazil']
+        assert list(result.columns) == ['Country', 'Company (Ticker)']
+    
+    def test_list_of_countries_is_dispatched(self):
+        """Test get_dividends_next_week accepts a list of countries"""
+        with patch('get_dividends.get_dividends_next_week_by_countries') as mock_by_countries:
+            get_dividends_next_week(country=[5, 29], filter_time='nextWeek')
             
-            assert isinstance(result, dict)
-            assert "data" in result
-            assert result["data"] == []
+            mock_by_countries.assert_called_once_with([5, 29], filter_time='nextWeek',
+                                                      freshness=FRESHNESS['dividends_by_date'])
 
 
 if __name__ == "__main__":
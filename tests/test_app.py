@@ -9,6 +9,8 @@ import configparser
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app import DividendAnalysisApp
+import dividend_yield
+from dash.exceptions import PreventUpdate
 
 
 class TestDividendAnalysisApp:
@@ -30,7 +32,30 @@ class TestDividendAnalysisApp:
         assert layout is not None
         # Check that key components are present
         assert hasattr(layout, 'children')
-    
+
+    def test_new_pages_start_at_the_current_revalidation(self):
+        """Test a page loaded after background refreshes does not receive their keys on its first poll"""
+        app = DividendAnalysisApp()
+
+        with patch('app.notifier') as notifier:
+            notifier.version = 42
+            layout = app.app.layout()
+
+        assert layout['revalidated'].data == {'version': 42, 'keys': []}
+
+    def test_background_jobs_start_with_the_first_request(self):
+        """Test the scheduler and the cache collector start once the server handles requests, under any server"""
+        app = DividendAnalysisApp()
+        app.config.scheduler_enabled = True
+
+        with patch.object(app.scheduler, 'start') as scheduler, patch.object(app.cache_collector, 'start') as gc:
+            client = app.app.server.test_client()
+            client.get('/api/income-projection')
+            client.get('/api/income-projection')
+
+        scheduler.assert_called_once()
+        gc.assert_called_once()
+
     def test_config_loading(self):
         """Test that configuration is loaded correctly"""
         app = DividendAnalysisApp()
@@ -77,6 +102,271 @@ class TestAppStructure:
         for attr in required_attrs:
             assert hasattr(config, attr), f"Config missing attribute: {attr}"
 
+    def test_config_with_several_countries(self, tmp_path):
+        """Test COUNTRY accepts a comma separated list of markets"""
+        config = configparser.ConfigParser()
+        config.read('./conf/general.conf')
+        config.set('INVESTING', 'COUNTRY', '5,32,29,37')
+        config_path = str(tmp_path / 'general.conf')
+        with open(config_path, 'w') as f:
+            config.write(f)
+        
+        app = DividendAnalysisApp(config_path=config_path)
+        
+        assert app.config.countries == [5, 32, 29, 37]
+        assert app.config.country == 5
+        assert app.components.get_column_definitions()[0] == {"field": "Country"}
+
+
+class TestServerSideResults:
+    """Test cases for the server-side store of the per-ticker results"""
+    
+    @pytest.fixture
+    def app_instance(self):
+        app = DividendAnalysisApp()
+        dividends = pd.DataFrame({
+            'date': pd.to_datetime(['2023-03-14', '2023-06-14', '2022-12-14']),
+            'dividend': [0.46, 0.46, 0.44],
+            'ticker': ['KO', 'KO', 'KO']
+        })
+        future = MagicMock()
+        future.result.return_value = dividends
+        app._fetch_ticker = MagicMock(return_value={'historical_dividends': future})
+        return app
+    
+    def test_results_are_computed_once_per_history(self, app_instance):
+        """Test the figure, table and summary are computed once and shared by the callbacks"""
+        with patch('app.calculate_dividend_summary.get_dividend_summary', return_value=None) as mock_summary:
+            key, results = app_instance._ticker_results('KO')
+            same_key, same_results = app_instance._ticker_results('KO')
+            
+            mock_summary.assert_called_once()
+        assert key == same_key and key.startswith('KO:')
+        assert results is same_results
+        assert set(results) >= {'figure', 'table', 'summary'}
+        assert [row['YEAR'] for row in results['table'].data] == [2023, '', 2022]
+    
+    def test_new_summary_is_a_new_key(self, app_instance):
+        """Test a summary written again for the same history computes the results again"""
+        with patch('app.calculate_dividend_summary.get_dividend_summary', return_value=None), \
+                patch('app.cache_index.version', side_effect=['summary_KO_1:a', 'summary_KO_2:b']):
+            key, results = app_instance._ticker_results('KO')
+            new_key, new_results = app_instance._ticker_results('KO')
+        
+        assert key != new_key
+        assert results is not new_results
+    
+    def test_store_holds_only_the_key(self, app_instance):
+        """Test store-data is resolved on the server from its key"""
+        with patch('app.calculate_dividend_summary.get_dividend_summary', return_value=None):
+            key, results = app_instance._ticker_results('KO')
+            
+            assert app_instance._stored_results({'ticker': 'KO', 'key': key}) is results
+            assert app_instance._stored_results([]) is None
+    
+    def test_missing_key_is_computed_from_the_ticker(self, app_instance):
+        """Test a worker that does not hold a key computes the results again"""
+        with patch('app.calculate_dividend_summary.get_dividend_summary', return_value=None):
+            results = app_instance._stored_results({'ticker': 'KO', 'key': 'KO:unknown'})
+        
+        assert results['figure'] is not None
+        app_instance._fetch_ticker.assert_called_with('KO')
+
+
+class TestStocksZoom:
+    """Test cases for the resolution-aware stock price chart"""
+    
+    def test_zoom_window_from_relayout_data(self):
+        """Test zooms, pans and zoom outs are read from relayoutData"""
+        assert DividendAnalysisApp._zoom_window({'xaxis.range[0]': '2021-01-04', 'xaxis.range[1]': '2021-06-30'}) == \
+            ('2021-01-04', '2021-06-30')
+        assert DividendAnalysisApp._zoom_window({'xaxis.range': ['2021-01-04', '2021-06-30']}) == \
+            ('2021-01-04', '2021-06-30')
+        assert DividendAnalysisApp._zoom_window({'xaxis.autorange': True}) is None
+    
+    def test_other_relayouts_are_ignored(self):
+        """Test resizes do not redraw the chart"""
+        with pytest.raises(PreventUpdate):
+            DividendAnalysisApp._zoom_window({'autosize': True})
+    
+    def test_figure_is_downsampled(self):
+        """Test the stock figure holds at most MAX_POINTS points, zoomed windows pin the x axis"""
+        app = DividendAnalysisApp()
+        app.config.max_points = 100
+        prices = pd.DataFrame({'date': pd.bdate_range('2019-01-01', periods=1250), 'close': range(1250)})
+        
+        full = app._build_stocks_figure('KO', prices)
+        zoomed = app._build_stocks_figure('KO', prices, window=('2020-01-01', '2020-01-31'))
+        
+        assert len(full.data[0].x) == 100
+        # the 23 weekdays of January 2020 and one on each side
+        assert len(zoomed.data[0].x) == 25
+        assert list(zoomed.layout.xaxis.range) == ['2020-01-01', '2020-01-31']
+
+    
+    def test_zoom_reads_the_stored_prices(self):
+        """Test a zoom redraws the prices of the full figure without fetching them again"""
+        app = DividendAnalysisApp()
+        prices = pd.DataFrame({'date': pd.bdate_range('2019-01-01', periods=300), 'close': range(300)})
+        future = MagicMock()
+        future.result.return_value = prices
+        app._fetch_ticker = MagicMock(return_value={'historical_data': future})
+        
+        with patch('app.cache_index.version', return_value='historical_data_KO_1:a'):
+            app._stocks_figure('KO')
+            zoomed = app._stocks_figure('KO', window=('2019-03-01', '2019-03-29'))
+        
+        app._fetch_ticker.assert_called_once_with('KO')
+        assert list(zoomed.layout.xaxis.range) == ['2019-03-01', '2019-03-29']
+    
+    def test_callback_ids_are_validated(self):
+        """Test callbacks are checked against the layout, the graph created by a callback is declared"""
+        app = DividendAnalysisApp()
+        
+        assert not app.app.config.suppress_callback_exceptions
+        assert 'stocks-graph' in str(app.app.validation_layout)
+
+class TestYieldChart:
+    """Test cases for the dividend yield chart and grid column"""
+    
+    def test_yield_figure_has_both_yields(self):
+        """Test the yield figure draws the trailing and the forward yield"""
+        app = DividendAnalysisApp()
+        prices = pd.DataFrame({'date': pd.bdate_range('2022-01-03', periods=300), 'close': 50.0})
+        dividends = pd.DataFrame({'date': pd.to_datetime(['2021-12-15', '2022-03-15', '2022-06-15', '2022-09-15']),
+                                  'dividend': 0.5})
+        series = dividend_yield.yield_series(dividend_yield.prepare_prices(prices),
+                                             dividend_yield.prepare_dividends(dividends))
+        
+        figure = app._build_yields_figure('KO', series)
+        
+        assert [trace.name for trace in figure.data] == ['Trailing', 'Forward']
+        assert figure.data[1].y[-1] == pytest.approx(4.0)
+    
+    def test_grid_column_is_numeric(self):
+        """Test the forward yield column of the grid is filtered as a number"""
+        app = DividendAnalysisApp()
+        
+        column = app.components.get_column_definitions()[-1]
+        
+        assert column['field'] == 'Fwd. Yield (%)'
+        assert column['filter'] == 'agNumberColumnFilter'
+
+
+class TestPrefetchProgress:
+    """Test cases for the progress of the prefetch shown under the calendar"""
+    
+    def test_progress_is_shown_while_running(self):
+        """Test the tickers warmed and failed are shown while the prefetch runs, nothing once it is over"""
+        running = {'total': 40, 'done': 12, 'failed': 1, 'cancelled': False, 'running': True}
+        
+        assert DividendAnalysisApp._prefetch_progress_text(running) == \
+            'Loading the calendar companies: 13/40, 1 failed'
+        assert DividendAnalysisApp._prefetch_progress_text({**running, 'running': False}) == ''
+
+class TestScreenerPage:
+    """Test cases for the screener page"""
+    
+    def test_empty_controls_do_not_filter(self):
+        """Test only the controls with a value become filters"""
+        assert DividendAnalysisApp._screener_filters() == []
+        assert DividendAnalysisApp._screener_filters(min_yield=4, min_cagr=5, calendar='nextWeek') == [
+            ('forward_yield', '>=', 4), ('cagr_5y', '>=', 0.05), ('in_nextWeek', '==', True)
+        ]
+    
+    def test_rows_are_json_ready(self):
+        """Test the grid rows hold rounded numbers, a payout status and no NaN"""
+        df = pd.DataFrame({
+            'company': ['Coca-Cola', None], 'close': [61.1234, 180.0], 'forward_yield': [3.01234, float('nan')],
+            'trailing_yield': [2.9, float('nan')], 'cagr_5y': [0.05, float('nan')], 'increase_streak': [12, 0],
+            'frequency': ['Quarterly', None], 'cut': [False, False], 'suspended': [False, False],
+            'calendar': ['nextWeek', None], 'payment_date': ['Oct 24', None]
+        }, index=pd.Index(['KO', 'PEP'], name='ticker'))
+        
+        rows = DividendAnalysisApp._screener_rows(df)
+        
+        assert rows[0]['forward_yield'] == 3.01
+        assert rows[0]['cagr_5y'] == 5.0
+        assert rows[0]['status'] == 'Paying'
+        assert rows[1]['forward_yield'] is None
+
+
+class TestIncomePage:
+    """Test cases for the income projection page and its API"""
+
+    @pytest.fixture
+    def table(self):
+        return pd.DataFrame({'p5': [1.0, 2.0, 3.0], 'p50': [2.0, 3.0, 5.0], 'p95': [3.0, 4.0, 7.0],
+                             'mean': [2.0, 3.0, 5.0]}, index=['2026-11', '2026-12', 'Total'])
+
+    def test_income_figure_has_bands_and_median(self, table):
+        """Test the figure fills the band of the outer percentiles around the median"""
+        app = DividendAnalysisApp()
+
+        figure = app._build_income_figure(table.drop(index='Total'))
+
+        assert [trace.name for trace in figure.data] == [None, 'p5 - p95', 'p50']
+        assert figure.data[1].fill == 'tonexty'
+
+    def test_api_returns_percentiles(self, table):
+        """Test the API answers the percentiles of the holdings as JSON"""
+        app = DividendAnalysisApp()
+        client = app.app.server.test_client()
+
+        with patch('app.income_projection.income_percentiles', return_value=table) as projection:
+            response = client.get('/api/income-projection?holdings=KO:100,PEP:50&percentiles=5,50,95')
+
+        assert response.status_code == 200
+        assert projection.call_args.args[0] == {'KO': 100.0, 'PEP': 50.0}
+        assert projection.call_args.kwargs['percentiles'] == [5.0, 50.0, 95.0]
+        assert response.json['percentiles']['Total']['p50'] == 5.0
+        assert response.json['missing'] == []
+
+    def test_missing_holdings_are_reported(self, table):
+        """Test the holdings left out of the projection are listed by the API and on the page"""
+        app = DividendAnalysisApp()
+        client = app.app.server.test_client()
+        table.attrs['missing'] = ['PEP']
+
+        with patch('app.income_projection.income_percentiles', return_value=table):
+            response = client.get('/api/income-projection?holdings=KO:100,PEP:50')
+            page = app._income_projection('KO:100, PEP:50')
+
+        assert response.json['missing'] == ['PEP']
+        assert 'No current dividends to project for PEP' in str(page)
+
+    def test_api_rejects_invalid_holdings(self):
+        """Test holdings the API cannot read are answered with a 400"""
+        client = DividendAnalysisApp().app.server.test_client()
+
+        response = client.get('/api/income-projection?holdings=KO')
+
+        assert response.status_code == 400
+        assert 'error' in response.json
+
+    def test_api_caps_holdings_and_paths(self, table):
+        """Test the API rejects too many holdings and caps the paths it simulates"""
+        client = DividendAnalysisApp().app.server.test_client()
+
+        with patch('app.income_projection.MAX_HOLDINGS', 2), patch('app.income_projection.MAX_PATHS', 1000), \
+                patch('app.income_projection.income_percentiles', return_value=table) as projection:
+            too_many = client.get('/api/income-projection?holdings=KO:1,PEP:1,T:1')
+            capped = client.get('/api/income-projection?holdings=KO:1&paths=1000000')
+
+        assert too_many.status_code == 400
+        assert capped.status_code == 200
+        assert projection.call_args.kwargs['paths'] == 1000
+
+    def test_failed_projection_is_an_error_response(self):
+        """Test a failure that exits, e.g. a cache write, is answered with a 500 instead of ending the worker"""
+        client = DividendAnalysisApp().app.server.test_client()
+
+        with patch('app.income_projection.income_percentiles', side_effect=SystemExit('Can not save file')):
+            response = client.get('/api/income-projection?holdings=KO:100')
+
+        assert response.status_code == 500
+        assert 'Can not save file' in response.json['error']
+
 
 class TestAppErrorHandling:
     """Test cases for error handling in the app"""
@@ -0,0 +1,132 @@
+import pytest
+import pandas as pd
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch, MagicMock
+import sys
+import os
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backtest
+from backtest import capture_trades, parameters_hash, summarize
+
+
+@pytest.fixture
+def prices():
+    days = pd.bdate_range('2023-01-02', '2023-06-30')
+    return {
+        'KO': pd.DataFrame({'date': days, 'close': np.linspace(60.0, 66.0, len(days))}),
+        'PEP': pd.DataFrame({'date': days, 'close': 180.0}),
+    }
+
+
+@pytest.fixture
+def dividends():
+    return {
+        'KO': pd.DataFrame({'date': ['1965-03-01', '2023-03-14', '2023-06-14', '2023-07-14'],
+                            'dividend': [0.1, 0.46, 0.46, 0.46], 'ticker': 'KO'}),
+        'PEP': pd.DataFrame({'date': ['2023-01-02', '2023-03-03'], 'dividend': [1.15, 1.15], 'ticker': 'PEP'}),
+    }
+
+
+class TestCaptureTrades:
+    """Test cases for the vectorized dividend capture trades"""
+
+    def test_trades_of_every_ex_date(self, prices, dividends):
+        """Test each ex-date inside the price history is bought before and sold after it"""
+        trades = capture_trades(prices, dividends, entry_offset=1, exit_offset=1)
+
+        assert list(zip(trades['ticker'], trades['ex_date'].dt.strftime('%Y-%m-%d'))) == [
+            ('KO', '2023-03-14'), ('KO', '2023-06-14'), ('PEP', '2023-03-03')
+        ]
+        pep = trades[trades['ticker'] == 'PEP'].iloc[0]
+        assert pep['entry_date'] == pd.Timestamp('2023-03-02')
+        assert pep['exit_date'] == pd.Timestamp('2023-03-06')
+        assert pep['total_return'] == pytest.approx(1.15 / 180)
+
+    def test_offsets_and_costs(self, prices, dividends):
+        """Test the offsets move the entry and exit days and costs are paid on both sides"""
+        trades = capture_trades(prices, dividends, entry_offset=3, exit_offset=0, cost_bps=10)
+
+        pep = trades[trades['ticker'] == 'PEP'].iloc[0]
+        assert pep['entry_date'] == pd.Timestamp('2023-02-28')
+        assert pep['exit_date'] == pd.Timestamp('2023-03-03')
+        assert pep['total_return'] == pytest.approx(1.15 / 180 - 0.002)
+
+    def test_invalid_offsets(self, prices, dividends):
+        """Test buying on or after the ex-date is rejected"""
+        with pytest.raises(ValueError):
+            capture_trades(prices, dividends, entry_offset=0)
+
+    def test_summary(self, prices, dividends):
+        """Test the per ticker summary of the trades"""
+        summary = summarize(capture_trades(prices, dividends))
+
+        assert summary.loc['KO', 'trades'] == 2
+        assert summary.loc['PEP', 'win_rate'] == 1.0
+
+
+class TestBacktestRun:
+    """Test cases for the sharded and cached backtest runs"""
+
+    @pytest.fixture
+    def index(self, prices, dividends):
+        """Index of the cached prices and dividends, read through load_latest_response"""
+        cache = {f'historical_data_{ticker}': df for ticker, df in prices.items()}
+        cache.update({f'historical_dividends_{ticker}': df for ticker, df in dividends.items()})
+        index = MagicMock()
+        index.versions.side_effect = lambda prefix: {key: 'v1' for key in cache if key.startswith(prefix)}
+        with patch('backtest.load_latest_response',
+                   side_effect=lambda key, index=None: (cache[key], None) if key in cache else None):
+            yield index
+
+    def test_shards_give_the_same_trades(self, index, prices, dividends):
+        """Test a run over shards in a pool finds the trades of a single pass"""
+        # threads stand in for the processes, which would not see the patched cache
+        pools = []
+
+        def pool(max_workers, mp_context):
+            pools.append(mp_context.get_start_method())
+            return ThreadPoolExecutor(max_workers=max_workers)
+
+        with patch('backtest.save_response'), patch('backtest.ProcessPoolExecutor', pool):
+            trades = backtest.backtest(workers=2, shard_size=1, index=index)
+
+        pd.testing.assert_frame_equal(trades, capture_trades(prices, dividends))
+        # forked workers would share the index's sqlite connection
+        assert pools == ['spawn']
+
+    def test_shards_read_the_given_index(self, index):
+        """Test the shards read the entries of the index the run was given"""
+        with patch('backtest.save_response'), \
+                patch('backtest.load_shard', return_value=({}, {})) as load:
+            backtest.backtest(['KO', 'PEP'], workers=1, shard_size=1, index=index)
+
+        assert [call.args[1] for call in load.call_args_list] == [index, index]
+
+    def test_results_are_cached_by_parameters(self, index):
+        """Test a run with the same parameters and data is read from the cache"""
+        with patch('backtest.save_response') as save:
+            trades = backtest.backtest(['KO'], entry_offset=1, exit_offset=1, cost_bps=0.0, workers=1, index=index)
+
+        assert save.call_args.args[1].startswith(f"backtest_{parameters_hash(['KO'], 1, 1, 0.0, index)}_")
+        with patch('backtest.load_latest_response', return_value=(trades.copy(), None)), \
+                patch('backtest.backtest_shard') as run:
+            cached = backtest.backtest(['KO'], entry_offset=1, exit_offset=1, cost_bps=0.0, workers=1, index=index)
+        run.assert_not_called()
+        pd.testing.assert_frame_equal(cached, trades)
+
+    def test_hash_follows_parameters_and_data(self, index):
+        """Test other offsets or a refreshed history give another hash"""
+        digest = parameters_hash(['KO'], 1, 1, 0.0, index)
+
+        assert parameters_hash(['KO'], 1, 1, 0.0, index) == digest
+        assert parameters_hash(['KO'], 2, 1, 0.0, index) != digest
+        index.versions.side_effect = lambda prefix: {f'{prefix}KO': 'v2'}
+        assert parameters_hash(['KO'], 1, 1, 0.0, index) != digest
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
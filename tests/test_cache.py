@@ -0,0 +1,610 @@
+import pytest
+import pandas as pd
+from datetime import datetime, timedelta
+from unittest.mock import patch, MagicMock
+import sys
+import os
+import pickle
+import time
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from misc.cache_index import CacheIndex, key_from_filename
+from misc.cache_gc import collect
+from misc.figure_cache import FigureCache
+from misc.file_lock import FileLock
+import plotly.graph_objects as go
+from dash import dash_table, html
+import get_dividends_historical_by_ticker
+import get_historical_data_by_ticker
+import threading
+from misc.memory_cache import MemoryCache, size_of
+from misc.storage import get_storage, get_storage_for_file
+from misc.freshness import EXPIRED, FreshnessPolicy, load_policies, parse_duration
+import configparser
+from zoneinfo import ZoneInfo
+import misc.utils
+
+
+def write_file(directory, filename, content='a,b\n1,2\n'):
+    path = os.path.join(str(directory), filename)
+    with open(path, 'w') as f:
+        f.write(content)
+    return path
+
+
+class TestCacheIndex:
+    """Test cases for the on-disk cache index"""
+
+    def test_key_from_timestamped_filename(self):
+        """Test the cache key is the file name without its timestamp"""
+        assert key_from_filename('historical_data_KO_2023-10-24_10-11-12.csv') == 'historical_data_KO'
+        assert key_from_filename('./csv_files/dividends_by_date_5_nextWeek_2023-10-24_10-11-12.csv') == \
+            'dividends_by_date_5_nextWeek'
+
+    def test_latest_returns_freshest_entry(self, tmp_path):
+        """Test the freshest entry for a key is returned"""
+        index = CacheIndex(str(tmp_path))
+        old = write_file(tmp_path, 'historical_data_KO_2023-01-01_00-00-00.csv')
+        new = write_file(tmp_path, 'historical_data_KO_2023-01-02_00-00-00.csv')
+        index.register('historical_data_KO', old, created=time.time() - 100)
+        index.register('historical_data_KO', new, created=time.time())
+
+        path, created = index.latest('historical_data_KO')
+
+        assert os.path.basename(path) == 'historical_data_KO_2023-01-02_00-00-00.csv'
+        assert isinstance(created, datetime)
+
+    def test_latest_does_not_match_key_prefixes(self, tmp_path):
+        """Test a ticker is not confused with a longer ticker sharing its prefix"""
+        index = CacheIndex(str(tmp_path))
+        path = write_file(tmp_path, 'historical_data_KOF_2023-01-01_00-00-00.csv')
+        index.register('historical_data_KOF', path)
+
+        assert index.latest('historical_data_KO') is None
+
+    def test_latest_forgets_deleted_files(self, tmp_path):
+        """Test entries whose file was removed by hand are dropped"""
+        index = CacheIndex(str(tmp_path))
+        path = write_file(tmp_path, 'historical_data_KO_2023-01-01_00-00-00.csv')
+        index.register('historical_data_KO', path)
+        os.remove(path)
+
+        assert index.latest('historical_data_KO') is None
+
+    def test_existing_files_are_migrated_on_first_run(self, tmp_path):
+        """Test files cached before the index existed are registered"""
+        write_file(tmp_path, 'historical_data_KO_2023-01-01_00-00-00.csv')
+        write_file(tmp_path, 'dividends_summary_KO_2023-01-01_00-00-00.csv')
+        write_file(tmp_path, 'del', content='')
+
+        index = CacheIndex(str(tmp_path))
+
+        assert index.latest('historical_data_KO') is not None
+        assert index.latest('dividends_summary_KO') is not None
+
+    def test_versions_of_a_prefix(self, tmp_path):
+        """Test the versions of the freshest entry of every key with a prefix are read at once"""
+        index = CacheIndex(str(tmp_path))
+        old = write_file(tmp_path, 'historical_data_KO_2023-01-01_00-00-00.csv')
+        new = write_file(tmp_path, 'historical_data_KO_2023-01-02_00-00-00.csv')
+        other = write_file(tmp_path, 'historical_dividends_KO_2023-01-01_00-00-00.csv')
+        index.register('historical_data_KO', old, created=time.time() - 100)
+        index.register('historical_data_KO', new, created=time.time())
+        index.register('historical_dividends_KO', other)
+
+        versions = index.versions('historical_data_')
+
+        assert versions == {'historical_data_KO': index.version('historical_data_KO')}
+        assert versions['historical_data_KO'].startswith('historical_data_KO_2023-01-02_00-00-00.csv')
+
+    def test_touch_restarts_the_freshest_entry(self, tmp_path):
+        """Test touch moves the creation time of the freshest entry to now"""
+        index = CacheIndex(str(tmp_path))
+        path = write_file(tmp_path, 'historical_dividends_KO.csv')
+        index.register('historical_dividends_KO', path, created=time.time() - 1000)
+
+        index.touch('historical_dividends_KO')
+
+        assert datetime.now() - index.latest('historical_dividends_KO')[1] < timedelta(seconds=10)
+
+
+class TestStorage:
+    """Test cases for the cache storage backends"""
+
+    def test_feather_keeps_column_types(self, tmp_path):
+        """Test dates and floats come back typed from the binary format"""
+        df = pd.DataFrame({
+            'date': pd.to_datetime(['2023-01-03', '2023-01-04']),
+            'close': [58.1, 58.45],
+            'ticker': ['KO', 'KO']
+        })
+        path = os.path.join(str(tmp_path), 'historical_data_KO.feather')
+        get_storage('feather').write(df, path)
+
+        result = get_storage_for_file(path).read(path)
+
+        assert str(result['date'].dtype) == 'datetime64[ns]'
+        assert result['close'].dtype == 'float64'
+        pd.testing.assert_frame_equal(result, df)
+
+    def test_csv_files_still_load(self, tmp_path):
+        """Test files saved as csv are read by the csv backend"""
+        path = write_file(tmp_path, 'historical_data_KO_2023-01-01_00-00-00.csv')
+
+        result = get_storage_for_file(path).read(path)
+
+        assert list(result.columns) == ['a', 'b']
+
+    def test_unknown_format(self):
+        """Test an unknown cache format is rejected"""
+        with pytest.raises(ValueError):
+            get_storage('xml')
+
+
+class TestMemoryCache:
+    """Test cases for the in-process memory cache"""
+
+    def test_hits_and_misses_are_counted(self):
+        """Test the cache reports hit and miss counters"""
+        cache = MemoryCache()
+        cache.set('historical_data_KO', pd.DataFrame({'close': [1.0]}))
+
+        assert cache.get('historical_data_KO') is not None
+        assert cache.get('historical_data_PEP') is None
+        assert cache.stats()['hits'] == 1
+        assert cache.stats()['misses'] == 1
+
+    def test_size_of_components_counts_their_rows(self):
+        """Test Dash components are sized by the rows they hold, not as empty objects"""
+        rows = [{'YEAR': 2023, 'dividend': 0.46, 'date': '2023-03-14'}] * 1000
+        table = dash_table.DataTable(data=rows)
+        
+        assert size_of({'table': html.Div([table])}) > size_of(rows)
+        assert size_of({'table': table}) > 1000 * sys.getsizeof({})
+
+    def test_entries_older_than_max_age_expire(self):
+        """Test an entry is not served once it is older than the dataset TTL"""
+        cache = MemoryCache()
+        cache.set('historical_data_KO', pd.DataFrame({'close': [1.0]}),
+                  created=datetime.now() - timedelta(hours=2))
+
+        assert cache.get('historical_data_KO', max_age=timedelta(hours=3)) is not None
+        assert cache.get('historical_data_KO', max_age=timedelta(hours=1)) is None
+
+    def test_least_recently_used_entry_is_evicted_by_size(self):
+        """Test the cache evicts by byte size, least recently used first"""
+        df = pd.DataFrame({'close': [1.0] * 100})
+        cache = MemoryCache(max_bytes=int(size_of(df) * 2.5))
+        cache.set('a', df)
+        cache.set('b', df)
+        cache.get('a')
+        cache.set('c', df)
+
+        assert cache.get('a') is not None
+        assert cache.get('b') is None
+        assert cache.get('c') is not None
+        assert cache.stats()['bytes'] <= cache.max_bytes
+
+    def test_repeat_lookup_does_not_touch_disk(self):
+        """Test a saved response is served from memory afterwards"""
+        df = pd.DataFrame({'date': ['2023-01-01'], 'dividend': [0.5], 'ticker': ['ZZTEST']})
+        path = misc.utils.save_response(df, 'historical_dividends_ZZTEST_2023-01-01_00-00-00')
+        try:
+            with patch('misc.utils.read_cached_file') as mock_read:
+                first = misc.utils.load_cached_response('historical_dividends_ZZTEST', freshness='1d')
+                second = misc.utils.load_cached_response('historical_dividends_ZZTEST', freshness='1d')
+
+                mock_read.assert_not_called()
+            pd.testing.assert_frame_equal(first, df)
+            assert first is not second
+        finally:
+            os.remove(path)
+            misc.utils.memory_cache.invalidate('historical_dividends_ZZTEST')
+
+
+class TestCacheGarbageCollector:
+    """Test cases for the csv_files garbage collector"""
+    
+    def test_only_newest_entry_per_key_is_kept(self, tmp_path):
+        """Test superseded files are removed and their bytes reported"""
+        index = CacheIndex(str(tmp_path))
+        old = write_file(tmp_path, 'historical_data_KO_2023-01-01_00-00-00.csv')
+        new = write_file(tmp_path, 'historical_data_KO_2023-01-02_00-00-00.csv')
+        other = write_file(tmp_path, 'historical_data_PEP_2023-01-01_00-00-00.csv')
+        index.register('historical_data_KO', old, created=time.time() - 100)
+        index.register('historical_data_KO', new, created=time.time())
+        index.register('historical_data_PEP', other)
+        
+        report = collect(index, max_bytes=0)
+        
+        assert not os.path.exists(old)
+        assert os.path.exists(new) and os.path.exists(other)
+        assert report['files_removed'] == 1
+        assert report['bytes_reclaimed'] == len('a,b\n1,2\n')
+        assert index.entries('historical_data_KO') == [new]
+    
+    def test_empty_newest_file_falls_back_to_previous(self, tmp_path):
+        """Test an invalid newest file is removed and the previous valid one kept"""
+        index = CacheIndex(str(tmp_path))
+        old = write_file(tmp_path, 'historical_data_KO_2023-01-01_00-00-00.csv')
+        broken = write_file(tmp_path, 'historical_data_KO_2023-01-02_00-00-00.csv', content='')
+        index.register('historical_data_KO', old, created=time.time() - 100)
+        index.register('historical_data_KO', broken, created=time.time())
+        
+        collect(index, max_bytes=0)
+        
+        assert index.entries('historical_data_KO') == [old]
+    
+    def test_size_cap_evicts_least_recently_read_keys(self, tmp_path):
+        """Test keys are evicted least recently read first until the cache fits"""
+        index = CacheIndex(str(tmp_path))
+        paths = {}
+        for i, ticker in enumerate(['KO', 'PEP', 'MO']):
+            paths[ticker] = write_file(tmp_path, f'historical_data_{ticker}_2023-01-01_00-00-00.csv')
+            index.register(f'historical_data_{ticker}', paths[ticker])
+        index.mark_accessed('historical_data_KO')
+        index._connect().execute("UPDATE entries SET accessed = 1 WHERE key = 'historical_data_PEP'")
+        index._connect().execute("UPDATE entries SET accessed = 2 WHERE key = 'historical_data_MO'")
+        size = os.path.getsize(paths['KO'])
+        
+        report = collect(index, max_bytes=size)
+        
+        assert report['keys_evicted'] == 2
+        assert report['bytes_kept'] == size
+        assert os.path.exists(paths['KO'])
+        assert not os.path.exists(paths['PEP']) and not os.path.exists(paths['MO'])
+    
+    def test_dry_run_removes_nothing(self, tmp_path):
+        """Test a dry run reports without deleting"""
+        index = CacheIndex(str(tmp_path))
+        old = write_file(tmp_path, 'historical_data_KO_2023-01-01_00-00-00.csv')
+        index.register('historical_data_KO', old, created=time.time() - 100)
+        index.register('historical_data_KO', write_file(tmp_path, 'historical_data_KO_2023-01-02_00-00-00.csv'))
+        
+        report = collect(index, max_bytes=0, dry_run=True)
+        
+        assert report['files_removed'] == 1
+        assert os.path.exists(old)
+    
+    def test_untracked_files_are_collected(self, tmp_path):
+        """Test old files missing from the index are removed, recent ones may still be being registered"""
+        index = CacheIndex(str(tmp_path))
+        index._connect()
+        stray = write_file(tmp_path, 'historical_data_KO_2023-01-01_00-00-00.csv')
+        os.utime(stray, (time.time() - 7200, time.time() - 7200))
+        recent = write_file(tmp_path, 'historical_data_PEP_2023-01-01_00-00-00.csv')
+        other = write_file(tmp_path, 'del')
+        os.utime(other, (time.time() - 7200, time.time() - 7200))
+        
+        collect(index, max_bytes=0)
+        
+        assert not os.path.exists(stray)
+        assert os.path.exists(recent) and os.path.exists(other)
+    
+    def test_index_is_sent_to_workers_without_its_connection(self, tmp_path):
+        """Test a pickled index, as sent to a worker process, opens its own sqlite connection"""
+        index = CacheIndex(str(tmp_path))
+        index.register('historical_data_KO', write_file(tmp_path, 'historical_data_KO_2023-01-01_00-00-00.csv'))
+
+        copy = pickle.loads(pickle.dumps(index))
+
+        assert getattr(copy._local, 'connection', None) is None
+        assert copy.cache_dir == index.cache_dir
+        assert copy.entries('historical_data_KO') == index.entries('historical_data_KO')
+
+    def test_invalidated_entries_are_deleted(self, tmp_path):
+        """Test invalidating a key deletes its files along with its index rows"""
+        index = CacheIndex(str(tmp_path))
+        path = write_file(tmp_path, 'dividends_summary_KO_2023-01-01_00-00-00.csv')
+        index.register('dividends_summary_KO', path)
+        
+        with patch('misc.utils.cache_index', index), patch('misc.utils.CACHE_DIR', str(tmp_path)):
+            misc.utils.invalidate_response('dividends_summary_KO')
+        
+        assert index.entries('dividends_summary_KO') == []
+        assert not os.path.exists(path)
+    
+    def test_invalidated_entries_are_not_indexed_again(self, tmp_path):
+        """Test a collection pass does not bring back the entries of a key invalidated on purpose"""
+        index = CacheIndex(str(tmp_path))
+        complete = write_file(tmp_path, 'dividends_by_date_5_nextWeek_2023-01-01_00-00-00.csv')
+        partial = write_file(tmp_path, 'dividends_by_date_5_nextWeek_2023-01-02_00-00-00.csv')
+        index.register('dividends_by_date_5_nextWeek', complete, created=time.time() - 100)
+        index.register('dividends_by_date_5_nextWeek', partial)
+        index.remove(partial)
+        
+        collect(index, max_bytes=0)
+        
+        assert index.entries('dividends_by_date_5_nextWeek') == [complete]
+
+
+class TestConcurrentCacheWrites:
+    """Test cases for atomic writes, checksums and single-flight cache fills"""
+    
+    def test_write_atomic_replaces_the_file_whole(self, tmp_path):
+        """Test the file is written through a temporary file and its checksum returned"""
+        path = write_file(tmp_path, 'historical_data_KO_2023-01-01_00-00-00.csv')
+        
+        checksum = misc.utils.write_atomic(lambda tmp: write_file(tmp_path, os.path.basename(tmp), 'x\n3\n'), path)
+        
+        assert open(path).read() == 'x\n3\n'
+        assert checksum == misc.utils.file_checksum(path)
+        assert os.listdir(tmp_path) == ['historical_data_KO_2023-01-01_00-00-00.csv']
+    
+    def test_failed_write_keeps_the_previous_file(self, tmp_path):
+        """Test a write failing half way leaves the previous file and no temporary file"""
+        path = write_file(tmp_path, 'historical_data_KO_2023-01-01_00-00-00.csv')
+        
+        def write(tmp):
+            write_file(tmp_path, os.path.basename(tmp), 'partial')
+            raise OSError('disk full')
+        
+        with pytest.raises(OSError):
+            misc.utils.write_atomic(write, path)
+        assert open(path).read() == 'a,b\n1,2\n'
+        assert os.listdir(tmp_path) == ['historical_data_KO_2023-01-01_00-00-00.csv']
+    
+    def test_corrupt_entry_is_dropped_for_the_previous_one(self, tmp_path):
+        """Test an entry failing its checksum is deleted and the previous entry served"""
+        index = CacheIndex(str(tmp_path))
+        old = write_file(tmp_path, 'historical_data_KO_2023-01-01_00-00-00.csv')
+        new = write_file(tmp_path, 'historical_data_KO_2023-01-02_00-00-00.csv')
+        index.register('historical_data_KO', old, created=time.time() - 100,
+                       checksum=misc.utils.file_checksum(old))
+        index.register('historical_data_KO', new, checksum=misc.utils.file_checksum(new))
+        write_file(tmp_path, 'historical_data_KO_2023-01-02_00-00-00.csv', 'a,b\n1,')
+        
+        with patch('misc.utils.cache_index', index):
+            df, created = misc.utils.read_latest_entry('historical_data_KO')
+        
+        assert df['a'].tolist() == [1]
+        assert not os.path.exists(new)
+        assert index.entries('historical_data_KO') == [old]
+    
+    def test_file_rewritten_while_read_is_kept(self, tmp_path):
+        """Test a fixed-name file swapped in and registered after its old checksum was read is not dropped"""
+        index = CacheIndex(str(tmp_path))
+        path = write_file(tmp_path, 'historical_dividends_KO.csv', 'a,b\n1,2\n')
+        stale = misc.utils.file_checksum(path)
+        write_file(tmp_path, 'historical_dividends_KO.csv', 'a,b\n3,4\n')
+        index.register('historical_dividends_KO', path, checksum=misc.utils.file_checksum(path))
+
+        # the reader got the checksum of the previous write, the writer registered the new one since
+        with patch('misc.utils.cache_index', index), \
+                patch.object(index, 'checksum', side_effect=[stale, misc.utils.file_checksum(path),
+                                                             misc.utils.file_checksum(path)]):
+            df, created = misc.utils.read_latest_entry('historical_dividends_KO')
+
+        assert df['a'].tolist() == [3]
+        assert os.path.exists(path)
+        assert index.entries('historical_dividends_KO') == [path]
+
+    def test_file_lock_is_exclusive(self, tmp_path):
+        """Test a second holder waits, and gives up after its timeout"""
+        path = str(tmp_path / 'historical_data_KO.lock')
+        
+        with FileLock(path) as first:
+            assert first.locked
+            assert FileLock(path, timeout=0.1).acquire() is False
+        with FileLock(path, timeout=0.1) as second:
+            assert second.locked
+    
+    def test_concurrent_misses_fetch_once(self):
+        """Test workers missing the same key wait for a single upstream fetch"""
+        ticker = 'ZZLOCK'
+        file_name = f'historical_data_{ticker}'
+        response = pd.DataFrame({'date': ['2023-01-03'], 'close': [1.0], 'ticker': [ticker]})
+        
+        def download(*args):
+            time.sleep(0.2)
+            return response.copy()
+        
+        results = []
+        
+        def worker():
+            results.append(get_historical_data_by_ticker.get_historical_data(
+                ticker=ticker, incremental=False, stale_while_revalidate=False))
+        
+        try:
+            with patch('get_historical_data_by_ticker.get_historical_data_get', side_effect=download) as mock_get:
+                threads = [threading.Thread(target=worker) for _ in range(3)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join(10)
+            
+            assert mock_get.call_count == 1
+            assert len(results) == 3
+        finally:
+            for path in misc.utils.cache_index.entries(file_name):
+                os.remove(path)
+            misc.utils.invalidate_response(file_name)
+
+    
+    def test_concurrent_batch_misses_fetch_once(self):
+        """Test batches missing the same keys in any order wait for each other instead of fetching them again"""
+        tickers = ['ZZLOCKA', 'ZZLOCKB']
+        fetched = []
+        
+        def download(missing):
+            time.sleep(0.2)
+            fetched.extend(missing)
+            return {ticker: pd.DataFrame({'date': pd.to_datetime(['2023-03-14']), 'dividend': [0.46],
+                                          'ticker': [ticker]}) for ticker in missing}
+        
+        results = []
+        
+        def worker(order):
+            results.append(get_dividends_historical_by_ticker.get_historical_dividends_batch(order))
+        
+        try:
+            with patch('get_dividends_historical_by_ticker.get_historical_dividends_batch_get', side_effect=download):
+                threads = [threading.Thread(target=worker, args=(order,)) for order in (tickers, tickers[::-1])]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join(10)
+            
+            assert sorted(fetched) == tickers
+            assert [sorted(frames) for frames in results] == [tickers, tickers]
+        finally:
+            for ticker in tickers:
+                file_name = f'historical_dividends_{ticker}'
+                for path in misc.utils.cache_index.entries(file_name):
+                    os.remove(path)
+                misc.utils.invalidate_response(file_name)
+
+class TestFigureCache:
+    """Test cases for the cache of serialized figures"""
+    
+    def test_figure_is_built_once_per_key(self, tmp_path):
+        """Test a repeat lookup returns the serialized figure without building it"""
+        cache = FigureCache()
+        build = MagicMock(return_value=go.Figure(go.Scatter(x=[1, 2], y=[3, 4])))
+        key = ('stocks', 'KO', 'historical_data_KO_2023-01-01_00-00-00.feather:1a2b', ('Verdana',))
+        
+        first = cache.get_or_build(key, build)
+        second = cache.get_or_build(key, build)
+        
+        build.assert_called_once()
+        assert first == second
+        assert first['data'][0]['y'] == [3, 4]
+    
+    def test_hit_is_not_parsed_again(self):
+        """Test a hit returns the kept dict without a JSON round trip"""
+        cache = FigureCache()
+        build = MagicMock(return_value=go.Figure(go.Scatter(x=[1, 2], y=[3, 4])))
+        key = ('stocks', 'KO', 'v1', ('Verdana',))
+        first = cache.get_or_build(key, build)
+        
+        with patch('misc.figure_cache.json.loads') as loads:
+            second = cache.get_or_build(key, build)
+        
+        loads.assert_not_called()
+        assert second is first
+        assert cache.stats()['bytes'] == len(build.return_value.to_json())
+    
+    def test_new_version_or_theme_builds_again(self):
+        """Test a new dataset version or theme is a new figure"""
+        cache = FigureCache()
+        build = MagicMock(return_value=go.Figure())
+        
+        cache.get_or_build(('stocks', 'KO', 'v1', ('Verdana',)), build)
+        cache.get_or_build(('stocks', 'KO', 'v2', ('Verdana',)), build)
+        cache.get_or_build(('stocks', 'KO', 'v2', ('Arial',)), build)
+        
+        assert build.call_count == 3
+    
+    def test_unversioned_figures_are_not_kept(self):
+        """Test figures of data missing from the cache index are always built"""
+        cache = FigureCache()
+        build = MagicMock(return_value=go.Figure())
+        
+        cache.get_or_build(('stocks', 'KO', None, ('Verdana',)), build)
+        cache.get_or_build(('stocks', 'KO', None, ('Verdana',)), build)
+        
+        assert build.call_count == 2
+    
+    def test_index_version_changes_only_with_the_content(self, tmp_path):
+        """Test touching an entry keeps its version and writing it again changes it"""
+        index = CacheIndex(str(tmp_path))
+        path = write_file(tmp_path, 'historical_dividends_KO.csv')
+        index.register('historical_dividends_KO', path, checksum='aaaa')
+        version = index.version('historical_dividends_KO')
+        
+        index.touch('historical_dividends_KO')
+        assert index.version('historical_dividends_KO') == version
+        index.register('historical_dividends_KO', path, checksum='bbbb')
+        assert index.version('historical_dividends_KO') != version
+        assert index.version('historical_dividends_PEP') is None
+    
+    def test_index_versions_are_kept_until_the_index_changes(self, tmp_path):
+        """Test repeat lookups of a version skip sqlite until another process writes the index"""
+        index = CacheIndex(str(tmp_path))
+        other = CacheIndex(str(tmp_path))
+        path = write_file(tmp_path, 'historical_dividends_KO.csv')
+        index.register('historical_dividends_KO', path, checksum='aaaa')
+        version = index.version('historical_dividends_KO')
+        
+        with patch.object(index, '_connect') as connect:
+            assert index.version('historical_dividends_KO') == version
+        connect.assert_not_called()
+        # the file's mtime may not tick between two writes made this fast
+        time.sleep(0.02)
+        other.register('historical_dividends_KO', path, checksum='bbbb')
+        assert index.version('historical_dividends_KO') == other.version('historical_dividends_KO') != version
+    
+    def test_reads_are_written_in_batches(self, tmp_path):
+        """Test reads of many keys are written to the index together, at most once per resolution"""
+        index = CacheIndex(str(tmp_path))
+        for ticker in ['KO', 'PEP']:
+            index.register(f'historical_data_{ticker}', write_file(tmp_path, f'historical_data_{ticker}.csv'))
+        index.mark_accessed('historical_data_KO')
+        
+        with patch.object(index, '_connect') as connect:
+            index.mark_accessed('historical_data_KO')
+            index.mark_accessed('historical_data_PEP')
+        connect.assert_not_called()
+        index._connect().execute("UPDATE entries SET accessed = 0")
+        
+        accessed = {key: accessed for key, _, _, _, accessed in index.all_entries()}
+        assert accessed['historical_data_KO'] > 0 and accessed['historical_data_PEP'] > 0
+
+
+class TestFreshnessPolicy:
+    """Test cases for the per-dataset freshness policies"""
+    
+    def test_durations_take_units_and_bare_numbers_are_days(self):
+        """Test durations are parsed with their unit, a bare number being days"""
+        assert parse_duration('90m') == timedelta(minutes=90)
+        assert parse_duration('12h') == timedelta(hours=12)
+        assert parse_duration('2w') == timedelta(weeks=2)
+        assert parse_duration(60) == timedelta(days=60)
+        with pytest.raises(ValueError):
+            parse_duration('soon')
+    
+    def test_days_are_not_read_as_hours(self):
+        """Test a 60 day policy still serves an entry saved 3 days ago"""
+        policy = FreshnessPolicy.parse('60')
+        now = datetime(2023, 6, 1, 12, 0)
+        
+        assert policy.is_fresh(now - timedelta(days=3), now=now)
+        assert not policy.is_fresh(now - timedelta(days=61), now=now)
+        assert not EXPIRED.is_fresh(now, now=now)
+    
+    def test_market_close_expires_at_the_next_weekday_close(self):
+        """Test market_close entries expire at the first close after they were saved"""
+        policy = FreshnessPolicy.parse('market_close')
+        friday_close = datetime(2023, 6, 2, 16, 0, tzinfo=policy_tz())
+        
+        before_close = policy.expires_at(to_local(datetime(2023, 6, 2, 10, 0, tzinfo=policy_tz())))
+        after_close = policy.expires_at(to_local(datetime(2023, 6, 2, 17, 0, tzinfo=policy_tz())))
+        
+        assert before_close == to_local(friday_close)
+        assert after_close == to_local(friday_close + timedelta(days=3))
+    
+    def test_freshness_section_overrides_time_delta_days(self):
+        """Test FRESHNESS settings win over TIME_DELTA_DAYS, which is read in days"""
+        config = configparser.ConfigParser()
+        config.read_dict({'TIME_DELTA_DAYS': {'HISTORICAL_DATA': '1', 'DIVIDENDS': '60'},
+                          'FRESHNESS': {'HISTORICAL_DATA': 'market_close'}})
+        policies = load_policies(config)
+        
+        assert policies['historical_data'].market_close
+        assert policies['historical_dividends'].max_age == timedelta(days=60)
+        assert policies['dividends_summary'].max_age == timedelta(days=60)
+        assert policies['dividends_by_date'].max_age == timedelta(days=1)
+
+
+def policy_tz():
+    return ZoneInfo('America/New_York')
+
+
+def to_local(moment):
+    return moment.astimezone().replace(tzinfo=None)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,144 @@
+import pytest
+import pandas as pd
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+import sys
+import os
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from income_projection import holding_dividends, holding_parameters, income_percentiles, parse_holdings, project_income
+from income_projection import shard_pool
+
+AS_OF = '2026-10-18'
+
+
+def dividends(ticker, amount, growth, months=(1, 4, 7, 10), years=12, cut_year=None):
+    """Payments of ticker in months up to last month, raised by growth every year and halved from cut_year on"""
+    today = pd.Timestamp(AS_OF)
+    dates = [pd.Timestamp(year, month, 15) for year in range(today.year - years, today.year + 1) for month in months]
+    dates = [day for day in dates if day <= today - pd.Timedelta(days=30)]
+    amounts = [amount * (1 + growth) ** (day.year - dates[0].year) * (0.5 if cut_year and day.year >= cut_year else 1)
+               for day in dates]
+    return pd.DataFrame({'ticker': ticker, 'date': dates, 'dividend': amounts})
+
+
+@pytest.fixture
+def history():
+    return {
+        'KO': dividends('KO', 0.4, 0.05),
+        'O': dividends('O', 0.25, 0.0, months=range(1, 13)),
+        'T': dividends('T', 0.5, 0.0, cut_year=2022),
+    }
+
+
+class TestHoldings:
+    """Test cases for the holdings entered as text"""
+
+    def test_parse_holdings(self):
+        """Test tickers and shares separated by commas or lines, repeated tickers are added up"""
+        assert parse_holdings('ko:100, PEP 50\nT=20, KO:10') == {'KO': 110.0, 'PEP': 50.0, 'T': 20.0}
+
+    def test_invalid_holdings(self):
+        """Test holdings without shares or no holdings at all raise ValueError"""
+        with pytest.raises(ValueError):
+            parse_holdings('KO, PEP:50')
+        with pytest.raises(ValueError):
+            parse_holdings('  ')
+
+
+class TestHoldingParameters:
+    """Test cases for the parameters simulated for each holding"""
+
+    def test_parameters_follow_the_history(self, history):
+        """Test the frequency, payment months, growth and cuts taken from each history"""
+        parameters = holding_parameters({'KO': 100, 'O': 10, 'T': 5, 'PEP': 1}, history, as_of=AS_OF)
+
+        assert list(parameters.index) == ['KO', 'O', 'T']
+        assert parameters.loc['KO', 'payments_per_year'] == 4
+        assert parameters.loc['KO', [1, 2, 4, 7, 10]].tolist() == [1, 0, 1, 1, 1]
+        assert parameters.loc['O', list(range(1, 13))].sum() == 12
+        assert parameters.loc['KO', 'growth_mean'] == pytest.approx(np.log(1.05))
+        assert parameters.loc['T', 'cut_probability'] > parameters.loc['KO', 'cut_probability']
+        assert parameters.loc['T', 'cut_size'] == pytest.approx(0.5)
+
+    def test_suspended_holdings_are_left_out(self):
+        """Test a holding without payments for years is not projected"""
+        stopped = dividends('GE', 0.1, 0.0, years=12)
+        stopped = stopped[stopped['date'] < '2020-01-01']
+
+        assert holding_parameters({'GE': 100}, {'GE': stopped}, as_of=AS_OF).empty
+
+
+class TestProjection:
+    """Test cases for the Monte Carlo income projection"""
+
+    def test_percentiles_of_each_month(self, history):
+        """Test the months after as_of, increasing percentiles and the income of the payment months"""
+        table = income_percentiles({'KO': 100, 'O': 10}, percentiles=(5, 50, 95), paths=2000, seed=7, workers=1,
+                                   as_of=AS_OF, dividends=history)
+
+        assert list(table.index[:3]) == ['2026-11', '2026-12', '2027-01']
+        assert table.index[-1] == 'Total'
+        assert list(table.columns) == ['p5', 'p50', 'p95', 'mean']
+        assert (table['p5'] <= table['p50']).all() and (table['p50'] <= table['p95']).all()
+        # only the monthly payer pays in November, a flat dividend without cuts in its history
+        assert table.loc['2026-11', 'p50'] == pytest.approx(10 * 0.25)
+        assert table.loc['2027-01', 'p50'] == pytest.approx(10 * 0.25 + 100 * 0.4 * 1.05 ** 12 * 1.05 ** 0.25,
+                                                             rel=0.01)
+
+    def test_same_paths_with_any_number_of_workers(self, history):
+        """Test a seed gives the same projection inline and with shards in a pool"""
+        holdings = {'KO': 100, 'O': 10, 'T': 50}
+        inline = project_income(holdings, paths=500, seed=3, workers=1, shard_size=1, as_of=AS_OF,
+                                dividends=history)
+        # threads stand in for the processes, the shards are the same
+        with patch('income_projection.shard_pool', return_value=ThreadPoolExecutor(max_workers=3)):
+            pooled = project_income(holdings, paths=500, seed=3, workers=3, shard_size=1, as_of=AS_OF,
+                                    dividends=history)
+
+        pd.testing.assert_frame_equal(inline, pooled)
+
+    def test_pool_is_spawned_once(self):
+        """Test the shards of every projection run on the same pool of spawned processes"""
+        pool = shard_pool(2)
+
+        assert shard_pool(2) is pool
+        assert pool._mp_context.get_start_method() == 'spawn'
+
+    def test_dividends_are_read_from_the_cache(self, history):
+        """Test holdings are projected from their cached dividends, only the ones never cached are downloaded"""
+        cache = {'historical_dividends_KO': (history['KO'].drop(columns='ticker'), None)}
+        with patch('income_projection.load_latest_response', side_effect=cache.get) as load, \
+                patch('income_projection.get_historical_dividends_batch',
+                      return_value={'O': history['O'].drop(columns='ticker'), 'PEP': pd.DataFrame()}) as fetch:
+            income = project_income({'KO': 100, 'O': 10, 'PEP': 10}, months=6, paths=100, workers=1, as_of=AS_OF)
+
+        assert [call.args[0] for call in load.call_args_list] == ['historical_dividends_KO', 'historical_dividends_O',
+                                                                 'historical_dividends_PEP']
+        assert fetch.call_args.args[0] == ['O', 'PEP']
+        assert income.to_numpy().any()
+        assert income.attrs['missing'] == ['PEP']
+
+    def test_downloads_are_bounded(self, history):
+        """Test at most max_requests histories are downloaded"""
+        with patch('income_projection.load_latest_response', return_value=None), \
+                patch('income_projection.get_historical_dividends_batch', return_value={}) as fetch:
+            dividends = holding_dividends(['KO', 'O', 'T'], max_requests=2)
+
+        assert fetch.call_args.args[0] == ['KO', 'O']
+        assert dividends == {}
+
+    def test_no_projected_holdings(self, history):
+        """Test holdings without dividends give no income"""
+        income = project_income({'PEP': 10}, months=6, paths=100, workers=1, as_of=AS_OF, dividends=history)
+
+        assert income.shape == (100, 6)
+        assert not income.to_numpy().any()
+        assert income.attrs['missing'] == ['PEP']
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,169 @@
+import pytest
+import pandas as pd
+from datetime import date, datetime, timedelta
+from unittest.mock import patch
+from zoneinfo import ZoneInfo
+import sys
+import os
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import AppConfig
+from misc.file_lock import FileLock
+from misc.freshness import FreshnessPolicy
+from misc.market_calendar import easter, get_market_calendar, nyse_holidays
+from scheduler import RefreshScheduler
+
+NEW_YORK = ZoneInfo('America/New_York')
+
+
+def new_york(*args):
+    """Naive local datetime of a New York wall clock time"""
+    return datetime(*args, tzinfo=NEW_YORK).astimezone().replace(tzinfo=None)
+
+
+class TestMarketCalendar:
+    """Test cases for the exchange trading calendars"""
+
+    def test_nyse_holidays(self):
+        """Test the NYSE holidays of a year, observed on weekdays"""
+        assert nyse_holidays(2023) == {
+            date(2023, 1, 2), date(2023, 1, 16), date(2023, 2, 20), date(2023, 4, 7), date(2023, 5, 29),
+            date(2023, 6, 19), date(2023, 7, 4), date(2023, 9, 4), date(2023, 11, 23), date(2023, 12, 25),
+        }
+        # new year's day on a saturday is not observed on the last friday of the previous year
+        assert date(2021, 12, 31) not in nyse_holidays(2022)
+        assert easter(2024) == date(2024, 3, 31)
+
+    def test_trading_days_skip_weekends_and_holidays(self):
+        """Test weekends and holidays are not trading days"""
+        nyse = get_market_calendar(5)
+
+        assert nyse.is_trading_day(date(2023, 7, 3))
+        assert not nyse.is_trading_day(date(2023, 7, 4))
+        assert not nyse.is_trading_day(date(2023, 7, 8))
+
+    def test_next_close_skips_closed_days(self):
+        """Test the next close after a close is the one of the next trading day"""
+        nyse = get_market_calendar(5)
+
+        assert nyse.next_close(new_york(2023, 6, 30, 10, 0)) == new_york(2023, 6, 30, 16, 0)
+        # Friday after the close, July 4th is a holiday
+        assert nyse.next_close(new_york(2023, 6, 30, 16, 0)) == new_york(2023, 7, 3, 16, 0)
+        assert nyse.next_close(new_york(2023, 7, 3, 17, 0)) == new_york(2023, 7, 5, 16, 0)
+
+    def test_unknown_country_uses_nyse(self):
+        """Test countries without a calendar follow the NYSE"""
+        assert get_market_calendar(999).name == 'NYSE'
+
+    def test_market_close_policy_does_not_expire_over_holidays(self):
+        """Test prices saved after a Friday close stay fresh over a long weekend"""
+        policy = FreshnessPolicy.parse('market_close', country=5)
+        saved = new_york(2023, 6, 30, 17, 0)
+
+        assert policy.is_fresh(saved, now=new_york(2023, 7, 3, 12, 0))
+        assert not policy.is_fresh(saved, now=new_york(2023, 7, 3, 16, 0))
+
+    def test_end_of_day_policy_expires_at_midnight(self):
+        """Test calendars saved late in the day expire at midnight"""
+        policy = FreshnessPolicy.parse('end_of_day')
+
+        assert policy.expires_at(datetime(2023, 6, 1, 23, 59)) == datetime(2023, 6, 2)
+
+
+class TestRefreshScheduler:
+    """Test cases for the refresh scheduler"""
+
+    @pytest.fixture
+    def scheduler(self):
+        config = AppConfig(countries=[5], scheduler_filters=['nextWeek'], scheduler_after_close_minutes=30)
+        return RefreshScheduler(config)
+
+    def test_tickers_run_after_the_close(self, scheduler):
+        """Test the ticker refresh is scheduled the configured minutes after the next close"""
+        assert scheduler._next_tickers_run(new_york(2023, 6, 30, 12, 0)) == new_york(2023, 6, 30, 16, 30)
+        assert scheduler._next_tickers_run(new_york(2023, 6, 30, 16, 29)) == new_york(2023, 6, 30, 16, 30)
+        # once run, the next one is after the close of the next trading day
+        assert scheduler._next_tickers_run(new_york(2023, 6, 30, 16, 30)) == new_york(2023, 7, 3, 16, 30)
+
+    def test_calendars_run_after_midnight(self, scheduler):
+        """Test the calendar refresh is scheduled right after the next midnight"""
+        assert scheduler._next_calendars_run(datetime(2023, 6, 1, 23, 0)) == datetime(2023, 6, 2, 0, 1)
+
+    def test_only_due_jobs_run(self, scheduler):
+        """Test run_pending runs the due jobs and schedules them again"""
+        now = new_york(2023, 6, 30, 17, 0)
+        scheduler.next_runs = {'calendars': now - timedelta(minutes=1), 'tickers': now + timedelta(minutes=1)}
+
+        with patch.object(scheduler, 'refresh_calendars') as calendars, \
+                patch.object(scheduler, 'refresh_tickers') as tickers:
+            assert scheduler.run_pending(now) == ['calendars']
+
+        calendars.assert_called_once()
+        tickers.assert_not_called()
+        assert scheduler.next_runs['calendars'] > now
+
+    def test_failed_job_is_rescheduled(self, scheduler):
+        """Test a failing refresh does not stop the scheduler"""
+        now = datetime(2023, 6, 1, 0, 5)
+        scheduler.next_runs['calendars'] = now
+
+        with patch.object(scheduler, 'refresh_calendars', side_effect=ValueError('down')):
+            assert scheduler.run_pending(now) == ['calendars']
+        assert scheduler.next_runs['calendars'] == datetime(2023, 6, 2, 0, 1)
+
+    def test_only_the_leader_runs_jobs(self, scheduler, tmp_path):
+        """Test a process runs the jobs only while it holds the leader lock, e.g. one of the gunicorn workers"""
+        lock = str(tmp_path / 'scheduler.lock')
+
+        with patch.object(scheduler, 'run_pending') as run_pending, \
+                patch.object(scheduler._stop, 'wait', side_effect=lambda timeout: scheduler._stop.set()):
+            with FileLock(lock):
+                scheduler.run(lock)
+            run_pending.assert_not_called()
+            scheduler._stop.clear()
+            scheduler.run(lock)
+
+        run_pending.assert_called_once()
+        # released on stop, another process takes over
+        other = FileLock(lock)
+        assert other.acquire(blocking=False)
+        other.release()
+
+    def test_refresh_warms_the_calendar_tickers(self, scheduler):
+        """Test the ticker refresh covers every ticker of the configured calendars"""
+        calendar = pd.DataFrame({'Company (Ticker)': ['Coca-Cola (KO)', 'PepsiCo (PEP)', 'Coca-Cola (KO)']})
+        dividends = pd.DataFrame({'date': ['2023-01-01'], 'dividend': [0.46], 'ticker': ['KO']})
+        history = pd.DataFrame({'date': ['2023-01-03'], 'close': [60.0]})
+
+        with patch('scheduler.get_dividends.get_dividends_next_week', return_value=calendar), \
+                patch('scheduler.get_historical_data_by_ticker.get_historical_data_batch',
+                      return_value={'KO': history, 'PEP': history}) as prices, \
+                patch('scheduler.get_dividends_historical_by_ticker.get_historical_dividends_batch',
+                      return_value={'KO': dividends, 'PEP': pd.DataFrame()}), \
+                patch('scheduler.calculate_dividend_summary.get_dividend_summary') as summary, \
+                patch('dividend_yield.get_yield_series') as yields:
+            scheduler.run_once()
+
+        assert prices.call_args.kwargs['tickers'] == ['KO', 'PEP']
+        summary.assert_called_once()
+        # yields are computed with the refresh for the tickers with prices and dividends
+        assert [call.args[0] for call in yields.call_args_list] == ['KO']
+
+    def test_price_window_moves_with_each_run(self, scheduler):
+        """Test each ticker refresh asks for the prices up to and including the day it runs"""
+        with patch('scheduler.get_historical_data_by_ticker.get_historical_data_batch') as prices, \
+                patch('scheduler.get_dividends_historical_by_ticker.get_historical_dividends_batch', return_value={}), \
+                patch('config.date') as today:
+            today.today.return_value = date(2023, 6, 30)
+            scheduler.refresh_tickers(['KO'])
+            today.today.return_value = date(2023, 7, 3)
+            scheduler.refresh_tickers(['KO'])
+
+        assert [call.kwargs['end_date'] for call in prices.call_args_list] == ['07/01/2023', '07/04/2023']
+        assert prices.call_args.kwargs['start_date'] == '07/04/2018'
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,118 @@
+import pytest
+import pandas as pd
+from unittest.mock import patch, MagicMock
+import sys
+import os
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from screener import Universe, calendar_table
+
+
+def quarterly_dividends(amount, growth, years=12):
+    """Quarterly payments up to last month, raised by growth every calendar year"""
+    today = pd.Timestamp.today()
+    dates = [pd.Timestamp(year, month, 15) for year in range(today.year - years, today.year + 1)
+             for month in (1, 4, 7, 10)]
+    dates = [day for day in dates if day <= today - pd.Timedelta(days=30)]
+    return pd.DataFrame({'date': dates, 'dividend': [amount * (1 + growth) ** (day.year - dates[0].year)
+                                                     for day in dates]})
+
+
+class TestUniverse:
+    """Test cases for the screener over the cached tickers"""
+
+    @pytest.fixture
+    def cache(self):
+        """Cached prices and dividends of KO (3% yield, growing), T (7% yield, flat) and PEP (no dividends)"""
+        return {
+            'historical_data_KO': pd.DataFrame({'date': ['2023-01-02', '2023-01-03'], 'close': [60.0, 61.0]}),
+            'historical_data_T': pd.DataFrame({'date': ['2023-01-03'], 'close': [16.0]}),
+            'historical_data_PEP': pd.DataFrame({'date': ['2023-01-03'], 'close': [180.0]}),
+            'historical_dividends_KO': quarterly_dividends(0.4, 0.05),
+            'historical_dividends_T': quarterly_dividends(0.28, 0.0),
+        }
+
+    @pytest.fixture
+    def versions(self, cache):
+        return {key: 'v1' for key in cache}
+
+    @pytest.fixture
+    def universe(self, cache, versions):
+        index = MagicMock()
+        index.versions.side_effect = lambda prefix: {key: version for key, version in versions.items()
+                                                     if key.startswith(prefix)}
+        universe = Universe(index=index, refresh_seconds=0)
+        with patch('screener.load_latest_response',
+                   side_effect=lambda key: (cache[key], None) if key in cache else None):
+            yield universe
+
+    def test_screen_filters_and_sorts(self, universe):
+        """Test rows pass every filter and come sorted"""
+        result = universe.screen([('forward_yield', '>', 2)], sort_by='forward_yield')
+
+        assert list(result.index) == ['T', 'KO']
+        assert result.loc['T', 'forward_yield'] == pytest.approx(7.0)
+        assert result.loc['KO', 'increase_streak'] >= 10
+
+        growing = universe.screen([('forward_yield', '>', 2), ('increase_streak', '>=', 10)])
+        assert list(growing.index) == ['KO']
+
+    def test_missing_values_do_not_pass(self, universe):
+        """Test a ticker without dividends is kept in the universe but fails the dividend filters"""
+        assert 'PEP' in universe.refresh().index
+        assert 'PEP' not in universe.screen([('forward_yield', '<', 100)]).index
+
+    def test_only_changed_tickers_are_loaded_again(self, universe, versions):
+        """Test a refresh loads the tickers whose cache entries changed since the last one"""
+        universe.refresh()
+        versions['historical_data_T'] = 'v2'
+
+        with patch.object(Universe, '_load', wraps=universe._load) as load:
+            table = universe.refresh()
+
+        assert load.call_args.args[0] == {'T'}
+        assert set(table.index) == {'KO', 'T', 'PEP'}
+
+    def test_calendar_filter(self, universe):
+        """Test tickers are screened by the narrowest calendar they appear in"""
+        calendars = pd.DataFrame({'company': ['Coca-Cola'], 'calendar': ['nextWeek'], 'ex_dividend_date': ['Oct 20'],
+                                  'payment_date': ['Oct 24'], 'in_tomorrow': [False], 'in_thisWeek': [False],
+                                  'in_nextWeek': [True]}, index=pd.Index(['KO'], name='ticker'))
+
+        with patch('screener.calendar_table', return_value=calendars):
+            result = universe.screen([('in_nextWeek', '==', True)])
+
+        assert list(result.index) == ['KO']
+
+    def test_wider_calendars_hold_the_narrower_ones(self, universe):
+        """Test a ticker going ex-dividend tomorrow is also screened in this week's calendar"""
+        index = MagicMock()
+        index.versions.return_value = {'dividends_by_date_5_tomorrow': 'v1', 'dividends_by_date_5_thisWeek': 'v1'}
+        tomorrow = pd.DataFrame({'Company (Ticker)': ['Coca-Cola (KO)'], 'Ex-Dividend Date': ['Oct 19'],
+                                 'Payment Date': ['Oct 24']})
+        week = pd.concat([tomorrow, pd.DataFrame({'Company (Ticker)': ['AT&T (T)'], 'Ex-Dividend Date': ['Oct 21'],
+                                                  'Payment Date': ['Nov 1']})])
+
+        with patch('screener.load_cached_response',
+                   side_effect=lambda key, **kwargs: tomorrow if key.endswith('_tomorrow') else week):
+            calendars = calendar_table(index=index)
+        with patch('screener.calendar_table', return_value=calendars):
+            in_this_week = universe.screen([('in_thisWeek', '==', True)])
+            in_tomorrow = universe.screen([('in_tomorrow', '==', True)])
+
+        assert calendars.loc['KO', 'calendar'] == 'tomorrow'
+        assert set(in_this_week.index) == {'KO', 'T'}
+        assert list(in_tomorrow.index) == ['KO']
+
+    def test_unknown_filters_are_rejected(self, universe):
+        """Test filters on unknown columns or operators raise ValueError"""
+        with pytest.raises(ValueError):
+            universe.screen([('dividend_score', '>', 1)])
+        with pytest.raises(ValueError):
+            universe.screen([('forward_yield', '~', 1)])
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
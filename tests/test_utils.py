@@ -1,5 +1,6 @@
 import pytest
 import pandas as pd
+from datetime import datetime
 from unittest.mock import patch, MagicMock
 import sys
 import os
@@ -9,6 +10,19 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from misc.utils import *
 from calculate_dividend_summary import get_dividend_summary
+from dividend_analytics import dividend_analytics
+import dividend_yield
+from get_historical_data_by_ticker import get_historical_data_batch
+from get_historical_data_by_ticker import refresh_historical_data
+from get_dividends_historical_by_ticker import merge_dividends, upsert_historical_dividends
+from misc.fetcher import FetchOrchestrator
+from misc.prefetch import Prefetcher
+from misc.freshness import EXPIRED
+from misc.downsample import downsample_prices, lttb
+from misc.revalidate import RevalidationNotifier, serve_stale_and_revalidate
+import get_historical_data_by_ticker
+import threading
+import time
 
 
 class TestUtils:
@@ -43,6 +57,88 @@ class TestUtils:
         assert is_numeric(None) == False
 
 
+CALENDAR_HTML = """<tr>
+<td colspan="7" class="theDay">Monday, October 23, 2023</td>
+</tr>
+<tr event_attr_ID="1">
+<td class="flag"><span title="United States" class="ceFlags USA middle">&nbsp;</span></td>
+<td class="left noWrap"><span class="earnCalCompanyName middle">Coca-Cola</span>&nbsp;(<a href="/equities/coca-cola-co">KO</a>)</td>
+<td>Oct 23, 2023</td>
+<td>0.46</td>
+<td><span class="ceDivIcons quarterly" title="Quarterly"></span></td>
+<td>Dec 15, 2023</td>
+<td>3.26%</td>
+</tr>
+<tr>
+<td colspan="7" class="theDay">Tuesday, October 24, 2023</td>
+</tr>
+<tr event_attr_ID="2">
+<td class="flag"><span title="United States" class="ceFlags USA middle"></span></td>
+<td class="left noWrap"><span class="earnCalCompanyName middle">PepsiCo</span>&nbsp;(<a href="/equities/pepsico">PEP</a>)</td>
+<td>Oct 24, 2023</td>
+<td>1.265</td>
+<td><span class="ceDivIcons quarterly" title="Quarterly"></span></td>
+<td>Jan 05, 2024</td>
+<td>3.01%</td>
+</tr>"""
+
+
+class TestInvestingCalendarParser:
+    """Test cases for the investing.com calendar parser"""
+    
+    def test_rows_are_parsed_with_their_day(self):
+        """Test every row gets the day header it is listed under"""
+        df, tickers, last_day = parse_investing_calendar(CALENDAR_HTML)
+        
+        assert list(df.columns) == headers + ['Ticker']
+        assert df['Date'].tolist() == ['Monday, October 23, 2023', 'Tuesday, October 24, 2023']
+        assert df['Company (Ticker)'].tolist() == ['Coca-Cola\xa0(KO)', 'PepsiCo\xa0(PEP)']
+        assert df['Dividend'].tolist() == [0.46, 1.265]
+        assert df['Yield'].tolist() == ['3.26%', '3.01%']
+        assert tickers == df['Ticker'].tolist() == ['KO', 'PEP']
+        assert last_day == 'Tuesday, October 24, 2023'
+    
+    def test_blank_cells_are_kept_in_place(self):
+        """Test a row with a blank cell keeps its other cells in their columns and the blank as NaN"""
+        html = CALENDAR_HTML.replace('<td>Jan 05, 2024</td>', '<td></td>')
+        
+        df, _, _ = parse_investing_calendar(html)
+        
+        pep = df.set_index('Ticker').loc['PEP']
+        assert pd.isna(pep['Payment Date'])
+        assert pep['Yield'] == '3.01%'
+        assert pep['Dividend'] == 1.265
+    
+    def test_tickers_come_from_the_links(self):
+        """Test the tickers of the links are used, and the cells' for calendars cached without them"""
+        df = pd.DataFrame({'Company (Ticker)': ['Brookfield (Canada) Corp (BN)', 'PepsiCo (PEP)'],
+                           'Ticker': ['BN', float('nan')]})
+        
+        assert calendar_tickers(df) == ['BN', 'PEP']
+        assert calendar_tickers(df.drop(columns='Ticker')) == ['BN', 'PEP']
+    
+    def test_selected_row_ticker_comes_from_the_link(self):
+        """Test a grid row's ticker is the one of its link, and its cell's in calendars cached without it"""
+        assert row_ticker({'Company (Ticker)': 'Brookfield (Canada) Corp (BN)', 'Ticker': 'BN.A'}) == 'BN.A'
+        assert row_ticker({'Company (Ticker)': 'PepsiCo (PEP)', 'Ticker': None}) == 'PEP'
+        assert row_ticker({'Company (Ticker)': 'PepsiCo (PEP)'}) == 'PEP'
+    
+    def test_page_continues_previous_day(self):
+        """Test rows before the first day header belong to the day passed in"""
+        html = CALENDAR_HTML.split('<tr>\n<td colspan="7" class="theDay">Tuesday')[0].split('</tr>\n', 1)[1]
+        
+        df, _, _ = parse_investing_calendar(html, current_day='Sunday, October 22, 2023')
+        
+        assert df['Date'].tolist() == ['Sunday, October 22, 2023']
+    
+    def test_empty_response(self):
+        """Test an empty response gives an empty calendar with the same columns"""
+        df, _, _ = parse_investing_calendar('')
+        
+        assert df.empty
+        assert list(df.columns) == headers + ['Ticker']
+
+
 class TestCalculateDividendSummary:
     """Test cases for dividend summary calculation"""
     
@@ -56,19 +152,20 @@ class TestCalculateDividendSummary:
             {'date': '2023-10-01', 'dividend': 0.8, 'ticker': 'AAPL'}
         ]
         
-        result = get_dividend_summary(data, time_delta=60)
+        result = get_dividend_summary(data, freshness='60d')
         
         assert isinstance(result, pd.DataFrame)
         assert len(result) > 0
         assert 'First Div. Paid (Year)' in result.columns
         assert 'First Div. Paid (US$)' in result.columns
         assert 'Div. Frequency' in result.columns
+        assert result['Payout Status'].iloc[0] in ('Paying', 'Cut', 'Suspended')
     
     def test_get_dividend_summary_with_empty_data(self):
         """Test dividend summary calculation with empty data"""
         data = []
         
-        result = get_dividend_summary(data, time_delta=60)
+        result = get_dividend_summary(data, freshness='60d')
         
         assert result is None or len(result) == 0
     
@@ -76,12 +173,137 @@ class TestCalculateDividendSummary:
         """Test dividend summary calculation with invalid data structure"""
         data = [{'wrong_column': 'value'}]
         
-        result = get_dividend_summary(data, time_delta=60)
+        result = get_dividend_summary(data, freshness='60d')
         
         # Should handle gracefully
         assert result is None or len(result) == 0
 
 
+class TestDividendAnalytics:
+    """Test cases for the vectorized dividend analytics"""
+
+    @pytest.fixture
+    def history(self):
+        # KO raises 5% a year, O pays monthly and halves in 2020 then stops, X has a single payment
+        rows = [{'ticker': 'KO', 'date': f'{year}-{month:02d}-15', 'dividend': 0.25 * 1.05 ** (year - 2010)}
+                for year in range(2010, 2024) for month in (2, 5, 8, 11)]
+        rows += [{'ticker': 'O', 'date': f'{year}-{month:02d}-01', 'dividend': 0.2 if year < 2020 else 0.1}
+                 for year in range(2015, 2022) for month in range(1, 13)]
+        rows.append({'ticker': 'X', 'date': '2023-06-01', 'dividend': 1.0})
+        return pd.DataFrame(rows)
+
+    def test_growth_and_streaks(self, history):
+        """Test the trailing twelve month dividend, CAGR and years of increases"""
+        result = dividend_analytics(history, as_of='2024-01-10')
+
+        ko = result.loc['KO']
+        assert ko['ttm_dividend'] == pytest.approx(4 * 0.25 * 1.05 ** 13)
+        assert ko['cagr_1y'] == pytest.approx(0.05)
+        assert ko['cagr_10y'] == pytest.approx(0.05)
+        assert ko['increase_streak'] == 13
+        assert ko['frequency'] == 'Quarterly'
+        assert ko['regularity'] == 1.0
+        # not enough history for the growth rates
+        assert pd.isna(result.loc['X', 'cagr_1y'])
+
+    def test_cuts_and_suspensions(self, history):
+        """Test a halved payment is a cut and a stopped payer is suspended"""
+        result = dividend_analytics(history, as_of='2020-06-15')
+
+        assert result.loc['O', 'last_cut'] == pd.Timestamp('2020-01-01')
+        assert result.loc['O', 'cut']
+        assert not result.loc['KO', 'cut']
+        assert not result.loc['O', 'suspended']
+
+        later = dividend_analytics(history, as_of='2024-01-10')
+        assert later.loc['O', 'suspended']
+        assert not later.loc['O', 'cut']
+        assert later.loc['O', 'ttm_dividend'] == 0
+
+    def test_scores_several_sources(self, history):
+        """Test the {ticker: frame} dict of the batch getters is scored like one long frame"""
+        frames = {ticker: df for ticker, df in history.groupby('ticker')}
+
+        result = dividend_analytics(frames, as_of='2024-01-10')
+
+        pd.testing.assert_frame_equal(result, dividend_analytics(history, as_of='2024-01-10'))
+        assert dividend_analytics({}, as_of='2024-01-10').empty
+
+
+class TestDividendYield:
+    """Test cases for the yield series joined from prices and dividends"""
+
+    @pytest.fixture
+    def prices(self):
+        return pd.DataFrame({'date': pd.bdate_range('2022-01-03', '2022-12-30'), 'close': 40.0})
+
+    @pytest.fixture
+    def dividends(self):
+        return pd.DataFrame({'date': pd.to_datetime(['2021-09-15', '2021-12-15', '2022-03-15', '2022-06-15']),
+                             'dividend': [0.4, 0.4, 0.5, 0.5], 'ticker': 'KO'})
+
+    def test_trailing_and_forward_yields(self, prices, dividends):
+        """Test each day is joined with the dividends paid until then"""
+        with patch('dividend_yield.cached_series', return_value=None), patch('dividend_yield.save_response'):
+            series = dividend_yield.get_yield_series('KO', prices, dividends)
+
+        day = series.set_index('date')
+        assert day.loc['2022-03-14', 'ttm_dividend'] == pytest.approx(0.8)
+        assert day.loc['2022-03-15', 'forward_yield'] == pytest.approx(0.5 * 4 / 40 * 100)
+        assert day.loc['2022-07-15', 'trailing_yield'] == pytest.approx(1.8 / 40 * 100)
+        # no payment after June: after two usual gaps the forward dividend is taken as suspended
+        assert day.loc['2022-12-30', 'forward_yield'] == 0
+
+    def test_new_days_are_appended(self, prices, dividends):
+        """Test a cached series is extended with the new days only"""
+        with patch('dividend_yield.cached_series', return_value=None), patch('dividend_yield.save_response'):
+            cached = dividend_yield.get_yield_series('KO', prices.iloc[:-1], dividends)
+
+        with patch('dividend_yield.cached_series', return_value=cached), \
+                patch('dividend_yield.save_response') as save, \
+                patch('dividend_yield.yield_series', wraps=dividend_yield.yield_series) as join:
+            series = dividend_yield.get_yield_series('KO', prices, dividends)
+
+        # the new day and the last cached one, whose close may have been partial
+        assert len(join.call_args.args[0]) == 2
+        assert len(series) == len(prices)
+        save.assert_called_once()
+    
+    def test_final_close_of_the_last_day_is_joined_again(self, prices, dividends):
+        """Test a last day cached with a partial close is replaced by the final one"""
+        with patch('dividend_yield.cached_series', return_value=None), patch('dividend_yield.save_response'):
+            cached = dividend_yield.get_yield_series('KO', prices, dividends)
+        prices.loc[prices.index[-1], 'close'] = 50.0
+        
+        with patch('dividend_yield.cached_series', return_value=cached), patch('dividend_yield.save_response'):
+            series = dividend_yield.get_yield_series('KO', prices, dividends)
+        
+        assert len(series) == len(prices)
+        assert series['close'].iloc[-1] == 50.0
+
+    def test_changed_dividends_recompute_the_series(self, prices, dividends):
+        """Test a payment corrected before the last cached day recomputes every day"""
+        with patch('dividend_yield.cached_series', return_value=None), patch('dividend_yield.save_response'):
+            cached = dividend_yield.get_yield_series('KO', prices, dividends)
+        dividends.loc[2, 'dividend'] = 0.45
+
+        with patch('dividend_yield.cached_series', return_value=cached), patch('dividend_yield.save_response'):
+            series = dividend_yield.get_yield_series('KO', prices, dividends)
+
+        assert series.set_index('date').loc['2022-03-15', 'forward_dividend'] == pytest.approx(1.8)
+
+
+    def test_grid_yields_are_only_read(self):
+        """Test the latest forward yields come from the cached series without computing any"""
+        series = pd.DataFrame({'date': pd.to_datetime(['2023-01-02', '2023-01-03']), 'forward_yield': [3.1, 3.04]})
+        with patch('dividend_yield.load_cached_response', side_effect=[series, None]) as load, \
+                patch('dividend_yield.get_yield_series') as compute:
+            yields = dividend_yield.cached_forward_yields(['KO', 'PEP', 'KO'])
+
+        assert yields == {'KO': 3.04}
+        assert [call.args[0] for call in load.call_args_list] == ['dividend_yield_KO', 'dividend_yield_PEP']
+        compute.assert_not_called()
+
 class TestDataValidation:
     """Test cases for data validation functions"""
     
@@ -112,6 +334,405 @@ class TestDataValidation:
         assert validate_dataframe_structure(df, ['date', 'dividend']) == False
 
 
+class TestHistoricalDataRefresh:
+    """Test cases for the incremental refresh of price history"""
+    
+    @pytest.fixture
+    def cached_df(self):
+        return pd.DataFrame({
+            'date': pd.to_datetime(['2023-10-16', '2023-10-17', '2023-10-18']),
+            'close': [58.0, 58.5, 59.0],
+            'ticker': ['KO'] * 3
+        })
+    
+    def test_only_missing_days_are_fetched(self, cached_df):
+        """Test the fetch starts at the last cached date and rows are appended"""
+        new_df = pd.DataFrame({'date': pd.to_datetime(['2023-10-18', '2023-10-19', '2023-10-20']),
+                               'close': [59.0, 59.5, 60.0], 'ticker': ['KO'] * 3})
+        
+        with patch('get_historical_data_by_ticker.get_historical_data_get', return_value=new_df) as mock_get:
+            result = refresh_historical_data(cached_df, 'KO', '10/17/2023', '10/21/2023')
+            
+            mock_get.assert_called_once_with('KO', '10/18/2023', '10/21/2023')
+        # the window start rolled forward past 2023-10-16
+        assert result['date'].dt.strftime('%Y-%m-%d').tolist() == \
+            ['2023-10-17', '2023-10-18', '2023-10-19', '2023-10-20']
+    
+    def test_partial_last_bar_is_replaced(self, cached_df):
+        """Test today's bar cached during market hours is replaced by its final close"""
+        # 2023-10-18 is a Wednesday cached at midday, the window ends tomorrow as price_window does
+        final = pd.DataFrame({'date': pd.to_datetime(['2023-10-18']), 'close': [59.4], 'ticker': ['KO']})
+        with patch('get_historical_data_by_ticker.get_historical_data_get', return_value=final) as mock_get:
+            result = refresh_historical_data(cached_df, 'KO', '', '10/19/2023')
+            
+            mock_get.assert_called_once_with('KO', '10/18/2023', '10/19/2023')
+        assert len(result) == 3
+        assert result['close'].iloc[-1] == 59.4
+    
+    def test_no_fetch_without_weekdays_in_the_window(self, cached_df):
+        """Test nothing is fetched when the window ends before the last cached date"""
+        with patch('get_historical_data_by_ticker.get_historical_data_get') as mock_get:
+            result = refresh_historical_data(cached_df, 'KO', '', '10/18/2023')
+            
+            mock_get.assert_not_called()
+        assert len(result) == 3
+    
+    def test_failed_fetch_returns_none(self, cached_df):
+        """Test a failed fetch is reported so the cached frame is not saved as fresh"""
+        with patch('get_historical_data_by_ticker.get_historical_data_get', side_effect=Exception("Network error")):
+            assert refresh_historical_data(cached_df, 'KO', '', '10/25/2023') is None
+    
+    def test_expired_batch_is_refreshed_incrementally(self, cached_df):
+        """Test expired entries of a batch are refreshed in one download from their earliest last cached date"""
+        pep_df = cached_df.iloc[:2].assign(ticker='PEP')
+        response = {'KO': pd.DataFrame({'date': pd.to_datetime(['2023-10-18', '2023-10-19']), 'close': [59.4, 60.0],
+                                        'ticker': ['KO'] * 2})}
+        cache = {'historical_data_KO': (cached_df, None), 'historical_data_PEP': (pep_df, None)}
+        
+        with patch('get_historical_data_by_ticker.load_cached_response', return_value=None), \
+                patch('get_historical_data_by_ticker.load_latest_response', side_effect=cache.get), \
+                patch('get_historical_data_by_ticker.get_historical_data_batch_get', return_value=response) as bulk, \
+                patch('get_historical_data_by_ticker.save_response') as save:
+            frames = get_historical_data_batch(['KO', 'PEP'], '', '10/20/2023')
+            
+            bulk.assert_called_once_with(['KO', 'PEP'], '10/17/2023', '10/20/2023')
+        assert frames['KO']['close'].tolist() == [58.0, 58.5, 59.4, 60.0]
+        # PEP was left out of the download, its expired entry is kept unsaved
+        assert frames['PEP'] is pep_df
+        assert [call.args[1].split('_2')[0] for call in save.call_args_list] == ['historical_data_KO']
+
+
+class TestDividendsUpsert:
+    """Test cases for the merge of refreshed dividend histories"""
+    
+    @pytest.fixture
+    def cached_df(self):
+        # as read back from a csv file written from yfinance data
+        return pd.DataFrame({
+            'date': ['2023-03-14 00:00:00-04:00', '2023-06-14 00:00:00-04:00'],
+            'dividend': [0.46, 0.46],
+            'ticker': ['KO', 'KO']
+        })
+    
+    @pytest.fixture
+    def response_df(self):
+        dates = pd.DatetimeIndex(['2023-03-14', '2023-06-14', '2023-09-14']).tz_localize('America/New_York')
+        return pd.DataFrame({'date': dates, 'dividend': [0.46, 0.46, 0.46], 'ticker': ['KO'] * 3})
+    
+    def test_only_new_payments_are_appended(self, cached_df, response_df):
+        """Test payments already held are not duplicated"""
+        merged, new_rows = merge_dividends(cached_df, response_df)
+        
+        assert new_rows == 1
+        assert merged['date'].dt.strftime('%Y-%m-%d').tolist() == ['2023-03-14', '2023-06-14', '2023-09-14']
+    
+    def test_corrected_amounts_overwrite_the_cached_ones(self, cached_df, response_df):
+        """Test a payment held with another amount is replaced, not kept next to the correction"""
+        response_df.loc[1, 'dividend'] = 0.47
+        merged, changed = merge_dividends(cached_df, response_df)
+        
+        assert changed == 2
+        assert merged['dividend'].tolist() == [0.46, 0.47, 0.46]
+    
+    def test_new_payments_invalidate_the_summary(self, cached_df, response_df):
+        """Test new rows are saved and the summary is recomputed"""
+        with patch('get_dividends_historical_by_ticker.load_latest_response', return_value=(cached_df, None)), \
+                patch('get_dividends_historical_by_ticker.save_canonical_response') as mock_save, \
+                patch('get_dividends_historical_by_ticker.invalidate_response') as mock_invalidate, \
+                patch('get_dividends_historical_by_ticker.touch_response') as mock_touch:
+            result = upsert_historical_dividends('KO', response_df)
+            
+            mock_save.assert_called_once()
+            assert mock_save.call_args[0][1] == 'historical_dividends_KO'
+            mock_invalidate.assert_called_once_with('dividends_summary_KO')
+            mock_touch.assert_not_called()
+        assert len(result) == 3
+    
+    def test_unchanged_series_is_not_rewritten(self, cached_df, response_df):
+        """Test a refresh without new payments only restarts the TTLs"""
+        with patch('get_dividends_historical_by_ticker.load_latest_response', return_value=(cached_df, None)), \
+                patch('get_dividends_historical_by_ticker.save_canonical_response') as mock_save, \
+                patch('get_dividends_historical_by_ticker.invalidate_response') as mock_invalidate, \
+                patch('get_dividends_historical_by_ticker.touch_response') as mock_touch:
+            upsert_historical_dividends('KO', response_df.iloc[:2])
+            
+            mock_save.assert_not_called()
+            mock_invalidate.assert_not_called()
+            assert [call[0][0] for call in mock_touch.call_args_list] == \
+                ['historical_dividends_KO', 'dividends_summary_KO']
+
+
+class TestFetchOrchestrator:
+    """Test cases for the fetch orchestrator"""
+    
+    def test_same_key_in_flight_shares_one_future(self):
+        """Test concurrent requests for the same key run a single fetch"""
+        orchestrator = FetchOrchestrator(max_workers=2)
+        release = threading.Event()
+        calls = []
+        
+        def fetch(ticker):
+            calls.append(ticker)
+            release.wait(5)
+            return ticker
+        
+        first = orchestrator.submit(('historical_data', 'KO'), fetch, 'KO')
+        second = orchestrator.submit(('historical_data', 'KO'), fetch, 'KO')
+        release.set()
+        
+        assert first is second
+        assert first.result() == 'KO'
+        assert calls == ['KO']
+    
+    def test_different_keys_run_concurrently(self):
+        """Test fetches for different keys run at the same time"""
+        orchestrator = FetchOrchestrator(max_workers=2)
+        barrier = threading.Barrier(2, timeout=5)
+        
+        dividends = orchestrator.submit(('historical_dividends', 'KO'), barrier.wait)
+        prices = orchestrator.submit(('historical_data', 'KO'), barrier.wait)
+        
+        # both calls have to be running for the barrier to be passed
+        dividends.result()
+        prices.result()
+    
+    def test_finished_key_is_fetched_again(self):
+        """Test a key is only shared while its fetch is in flight"""
+        orchestrator = FetchOrchestrator(max_workers=1)
+        
+        first = orchestrator.submit('KO', lambda: 1)
+        first.result()
+        second = orchestrator.submit('KO', lambda: 2)
+        
+        assert second.result() == 2
+        assert orchestrator.in_flight() == []
+
+
+class TestPrefetcher:
+    """Test cases for the background prefetcher"""
+    
+    def wait_until_finished(self, prefetcher, session=None):
+        deadline = time.monotonic() + 5
+        while prefetcher.progress(session)['running'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+    
+    def test_parse_ticker(self):
+        """Test the ticker is taken out of a calendar cell"""
+        assert parse_ticker('Coca-Cola Co (KO)') == 'KO'
+    
+    def test_every_ticker_is_warmed_once(self):
+        """Test each distinct ticker is warmed and progress is reported"""
+        warmed = []
+        prefetcher = Prefetcher(warmed.extend, max_workers=2, requests_per_second=0)
+        
+        prefetcher.start(['KO', 'PEP', 'KO', 'MO'])
+        self.wait_until_finished(prefetcher)
+        
+        assert sorted(warmed) == ['KO', 'MO', 'PEP']
+        assert prefetcher.progress() == {'total': 3, 'done': 3, 'failed': 0,
+                                         'cancelled': False, 'running': False}
+    
+    def test_failures_are_counted(self):
+        """Test a failing warm up does not stop the others"""
+        def warm(tickers):
+            if tickers == ['BAD']:
+                raise ValueError('no data')
+        prefetcher = Prefetcher(warm, max_workers=1, requests_per_second=0)
+        
+        prefetcher.start(['BAD', 'KO'])
+        self.wait_until_finished(prefetcher)
+        
+        assert prefetcher.progress()['done'] == 1
+        assert prefetcher.progress()['failed'] == 1
+    
+    def test_exits_are_counted_as_failures(self):
+        """Test a warm up raising SystemExit, e.g. a failed cache write, is counted and the others go on"""
+        def warm(tickers):
+            if tickers == ['BAD']:
+                raise SystemExit('Can not save file')
+        prefetcher = Prefetcher(warm, max_workers=1, requests_per_second=0)
+        
+        prefetcher.start(['BAD', 'KO'])
+        self.wait_until_finished(prefetcher)
+        
+        assert prefetcher.progress() == {'total': 2, 'done': 1, 'failed': 1,
+                                         'cancelled': False, 'running': False}
+    
+    def test_cancel_stops_dispatching(self):
+        """Test cancel stops the prefetch before the remaining tickers"""
+        warmed = []
+        prefetcher = Prefetcher(warmed.extend, max_workers=1, requests_per_second=0.5)
+        
+        prefetcher.start(['KO', 'PEP', 'MO'])
+        time.sleep(0.2)
+        prefetcher.cancel()
+        time.sleep(0.2)
+        
+        assert warmed == ['KO']
+        assert prefetcher.progress()['cancelled'] is True
+        assert prefetcher.progress()['running'] is False
+    
+    def test_tickers_are_warmed_in_batches(self):
+        """Test warm receives batches of tickers and progress counts tickers"""
+        batches = []
+        prefetcher = Prefetcher(batches.append, max_workers=1, requests_per_second=0, batch_size=2)
+        
+        prefetcher.start(['KO', 'PEP', 'MO'])
+        self.wait_until_finished(prefetcher)
+        
+        assert batches == [['KO', 'PEP'], ['MO']]
+        assert prefetcher.progress()['done'] == 3
+    
+    def test_sessions_only_cancel_their_own_prefetch(self):
+        """Test a page starting a prefetch cancels its previous one and leaves the other pages' running"""
+        release = threading.Event()
+        prefetcher = Prefetcher(lambda tickers: release.wait(5), max_workers=2, requests_per_second=0)
+        
+        prefetcher.start(['KO', 'PEP'], session='a')
+        prefetcher.start(['MO'], session='b')
+        assert prefetcher.progress('a')['running'] and prefetcher.progress('b')['running']
+        prefetcher.start(['T'], session='a')
+        assert prefetcher.progress('b')['running']
+        assert prefetcher.progress('a')['total'] == 1
+        release.set()
+        self.wait_until_finished(prefetcher, 'b')
+        
+        assert prefetcher.progress('b') == {'total': 1, 'done': 1, 'failed': 0, 'cancelled': False, 'running': False}
+        assert prefetcher.progress('c') == {'total': 0, 'done': 0, 'failed': 0, 'cancelled': False, 'running': False}
+
+
+class TestStaleWhileRevalidate:
+    """Test cases for serving stale entries while they are refreshed"""
+    
+    def test_notifier_reports_keys_changed_since_a_version(self):
+        """Test the notifier returns the keys refreshed after a version"""
+        notifier = RevalidationNotifier()
+        notifier.notify('historical_data_KO')
+        version, keys = notifier.changes_since(0)
+        notifier.notify('historical_dividends_PEP')
+        notifier.notify('historical_dividends_PEP')
+        
+        assert keys == ['historical_data_KO']
+        assert notifier.changes_since(version) == (3, ['historical_dividends_PEP'])
+        assert notifier.changes_since(3) == (3, [])
+    
+    def test_stale_frame_is_served_and_refreshed_in_background(self):
+        """Test the cached frame is returned at once and the refresh runs on the fetcher"""
+        stale_df = pd.DataFrame({'close': [1.0]})
+        orchestrator = FetchOrchestrator(max_workers=1)
+        notifier = RevalidationNotifier()
+        refresh = MagicMock(return_value=pd.DataFrame({'close': [2.0]}))
+        
+        index = MagicMock()
+        index.version.side_effect = ['historical_data_KO_1:a', 'historical_data_KO_2:b']
+        with patch('misc.revalidate.load_latest_response', return_value=(stale_df, datetime(2023, 1, 1))), \
+                patch('misc.revalidate.fetcher', orchestrator), patch('misc.revalidate.notifier', notifier), \
+                patch('misc.revalidate.cache_index', index):
+            result = serve_stale_and_revalidate('historical_data_KO', refresh, ticker='KO', freshness=EXPIRED)
+            orchestrator.submit(('revalidate', 'historical_data_KO'), lambda: None).result()
+        
+        assert result is stale_df
+        refresh.assert_called_once_with(ticker='KO', freshness=EXPIRED)
+        assert notifier.changes_since(0) == (1, ['historical_data_KO'])
+    
+    def test_nothing_cached_returns_none(self):
+        """Test the caller fetches synchronously when nothing was ever cached"""
+        refresh = MagicMock()
+        
+        with patch('misc.revalidate.load_latest_response', return_value=None):
+            assert serve_stale_and_revalidate('historical_data_KO', refresh) is None
+        refresh.assert_not_called()
+    
+    def test_failed_refresh_keeps_the_stale_entry(self):
+        """Test a failing background refresh is logged and not notified"""
+        orchestrator = FetchOrchestrator(max_workers=1)
+        notifier = RevalidationNotifier()
+        
+        with patch('misc.revalidate.load_latest_response', return_value=(pd.DataFrame(), datetime(2023, 1, 1))), \
+                patch('misc.revalidate.fetcher', orchestrator), patch('misc.revalidate.notifier', notifier):
+            serve_stale_and_revalidate('historical_data_KO', MagicMock(side_effect=ValueError('down')))
+            orchestrator.submit('wait', lambda: None).result()
+        
+        assert notifier.changes_since(0) == (0, [])
+    
+    def test_refresh_falling_back_to_the_stale_entry_is_not_notified(self):
+        """Test a refresh that returns without writing a new entry does not redraw the page"""
+        orchestrator = FetchOrchestrator(max_workers=1)
+        notifier = RevalidationNotifier()
+        stale_df = pd.DataFrame({'close': [1.0]})
+        index = MagicMock()
+        index.version.return_value = 'historical_data_KO_1:a'
+        
+        with patch('misc.revalidate.load_latest_response', return_value=(stale_df, datetime(2023, 1, 1))), \
+                patch('misc.revalidate.fetcher', orchestrator), patch('misc.revalidate.notifier', notifier), \
+                patch('misc.revalidate.cache_index', index), patch('misc.revalidate.logger') as logger:
+            serve_stale_and_revalidate('historical_data_KO', MagicMock(return_value=stale_df))
+            orchestrator.submit('wait', lambda: None).result()
+        
+        assert notifier.changes_since(0) == (0, [])
+        # an unchanged entry is routine, only failed refreshes are warned about
+        logger.debug.assert_called_once()
+        logger.warning.assert_not_called()
+    
+    def test_getter_serves_stale_prices_without_downloading(self):
+        """Test get_historical_data answers from the stale entry and schedules itself as the refresh"""
+        stale_df = pd.DataFrame({'close': [1.0]})
+        
+        with patch('get_historical_data_by_ticker.load_cached_response', return_value=None), \
+                patch('get_historical_data_by_ticker.serve_stale_and_revalidate', return_value=stale_df) as serve, \
+                patch('get_historical_data_by_ticker.get_historical_data_get') as download:
+            result = get_historical_data_by_ticker.get_historical_data(ticker='KO', stale_while_revalidate=True)
+        
+        assert result is stale_df
+        download.assert_not_called()
+        assert serve.call_args.args[1] is get_historical_data_by_ticker.get_historical_data
+        assert serve.call_args.kwargs['stale_while_revalidate'] is False
+
+
+class TestDownsample:
+    """Test cases for the downsampling of price series"""
+    
+    @pytest.fixture
+    def prices(self):
+        dates = pd.bdate_range('2019-01-01', periods=1250)
+        close = pd.Series(range(1250), dtype=float) / 10
+        close[700] = 1000.0
+        return pd.DataFrame({'date': dates, 'close': close, 'ticker': 'KO'})
+    
+    def test_lttb_keeps_endpoints_and_peaks(self, prices):
+        """Test LTTB keeps the requested count, both ends and an isolated spike"""
+        kept = lttb(prices['date'].astype('int64'), prices['close'], 100)
+        
+        assert len(kept) == 100
+        assert kept[0] == 0 and kept[-1] == 1249
+        assert 700 in kept
+        assert (pd.Series(kept).diff().dropna() > 0).all()
+    
+    def test_short_series_is_not_reduced(self, prices):
+        """Test series shorter than the target, or no target, are returned whole"""
+        assert len(downsample_prices(prices.head(50), 500)) == 50
+        assert len(downsample_prices(prices, 0)) == 1250
+    
+    def test_window_is_sampled_at_full_resolution(self, prices):
+        """Test a zoomed window keeps its own points plus one on each side"""
+        window = ('2020-01-01', '2020-03-31')
+        in_window = prices[(prices['date'] >= window[0]) & (prices['date'] <= window[1])]
+        
+        result = downsample_prices(prices, 500, window=window)
+        
+        assert len(result) == len(in_window) + 2
+        assert result['date'].iloc[1] == in_window['date'].iloc[0]
+    
+    def test_missing_closes_are_dropped(self, prices):
+        """Test days without a close do not break the sampling"""
+        prices.loc[10:20, 'close'] = None
+        
+        result = downsample_prices(prices, 100)
+        
+        assert len(result) == 100
+        assert result['close'].notna().all()
+
+
 # Helper functions for testing (these should be defined in utils.py)
 def is_valid_date(date_string):
     """Helper function to validate date strings"""